@@ -175,6 +175,26 @@ def create_app(config_class=Config):
     db.init_app(app)
     login_manager.init_app(app)
     
+    # Keep statistics rollups in step with their source tables
+    from app.utils.rollups import register_rollup_listeners, ensure_rollups_populated
+    register_rollup_listeners()
+    
+    # Keep unread badges in step with chat messages and inquiries
+    from app.utils.unread_counters import register_unread_counter_listeners, ensure_unread_counters_populated
+    register_unread_counter_listeners()
+    
+    # Shared statistics cache, invalidated on commit
+    from app.utils.cache import stats_cache
+    stats_cache.init_app(app)
+    
+    # Uploaded images: content-hash storage and background thumbnails
+    from app.utils.images import image_pipeline
+    image_pipeline.init_app(app)
+    
+    # Background report jobs with on-disk artifacts
+    from app.utils.report_jobs import report_jobs
+    report_jobs.init_app(app)
+    
     # Create upload directories
     with app.app_context():
         upload_folder = Path(app.config['UPLOAD_FOLDER'])
@@ -186,17 +206,6 @@ def create_app(config_class=Config):
         ml_datasets_folder.mkdir(parents=True, exist_ok=True)
         product_images_folder.mkdir(parents=True, exist_ok=True)
     
-    # Add custom Jinja2 filters
-    @app.template_filter('from_json')
-    def from_json_filter(value):
-        import json
-        if isinstance(value, str):
-            try:
-                return json.loads(value)
-            except:
-                return []
-        return value if isinstance(value, list) else []
-    
     # Create database tables and seed users
     with app.app_context():
         import sys
@@ -204,14 +213,52 @@ def create_app(config_class=Config):
         db.create_all()
         print("INFO: Database tables created/verified", file=sys.stderr, flush=True)
 
+        # Optionally record queries for the index advisor
+        if app.config.get('QUERY_LOG_PATH'):
+            from app.utils.query_log import enable_query_log
+            enable_query_log(db.engine, app.config['QUERY_LOG_PATH'])
+
         # Ensure the role column can hold longer role names
         ensure_role_column_length()
         
+        # Backfill statistics rollups for databases created before they existed
+        ensure_rollups_populated()
+        
+        # Seed chat read cursors from existing is_read flags
+        from app.utils.chat import ensure_read_cursors_populated
+        ensure_read_cursors_populated()
+        ensure_unread_counters_populated()
+        
+        # Full-text index for marketplace search
+        from app.utils.search import ensure_search_index
+        ensure_search_index()
+        
+        # Stock reservation expiry for marketplace orders
+        from app.utils.reservations import ensure_reservation_column
+        ensure_reservation_column()
+        
+        # Native JSON columns (jsonb + GIN on PostgreSQL, JSON1 index on SQLite)
+        from app.utils.json_columns import ensure_json_columns
+        ensure_json_columns()
+        
+        # Stock ledger idempotency keys and the baseline stock snapshot
+        from app.utils.stock import ensure_stock_ledger
+        ensure_stock_ledger()
+        
+        # Product requests linked to inventory products (fulfilment matching)
+        from app.utils.product_requests import ensure_request_product_link
+        ensure_request_product_link()
+        
         # Auto-seed demo users if they don't exist (for production deployment)
         print("INFO: Checking if demo users need seeding...", file=sys.stderr, flush=True)
         seed_demo_users_if_needed()
         print("INFO: User seeding check completed", file=sys.stderr, flush=True)
     
+    # Fail requests that repeat a query past QUERY_REPEAT_LIMIT (N+1 detection in tests)
+    if app.config.get('QUERY_REPEAT_LIMIT'):
+        from app.utils.query_guard import enable_query_guard
+        enable_query_guard(app)
+    
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.main import main_bp
@@ -32,8 +32,38 @@ class Config:
     # Product images upload path
     PRODUCT_IMAGES_FOLDER = UPLOAD_FOLDER / 'products'
     
+    # Threads generating WebP thumbnails for uploaded images
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    
+    # Large reports built in the background and kept until the data they read changes
+    REPORT_FOLDER = basedir / 'instance' / 'reports'
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+    REPORT_RETENTION_HOURS = int(os.environ.get('REPORT_RETENTION_HOURS', 24))
+    
+    # Processes rendering per-farmer PDFs for bulk district exports (default: one per CPU)
+    BULK_REPORT_PROCESSES = int(os.environ['BULK_REPORT_PROCESSES']) if os.environ.get('BULK_REPORT_PROCESSES') else None
+    
+    # Minutes a marketplace checkout holds its stock before an unpaid order expires
+    STOCK_RESERVATION_MINUTES = int(os.environ.get('STOCK_RESERVATION_MINUTES', 15))
+    
     # OpenWeatherMap API
     WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY') or None
     WEATHER_API_URL = 'https://api.openweathermap.org/data/2.5/weather'
     WEATHER_FORECAST_URL = 'https://api.openweathermap.org/data/2.5/forecast'
-
+    
+    # Shared statistics cache ('memory' per process, or 'sqlite' shared by all workers)
+    STATS_CACHE_BACKEND = os.environ.get('STATS_CACHE_BACKEND', 'memory')
+    STATS_CACHE_PATH = basedir / 'instance' / 'stats_cache.db'
+    STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 60))
+    
+    # HTTP caching of anonymous public pages (ETag/304 plus a shared response cache).
+    # Bump HTTP_CACHE_VERSION on deploys that change templates to retire old ETags.
+    HTTP_CACHE_ENABLED = os.environ.get('HTTP_CACHE_ENABLED', '1') == '1'
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+    HTTP_CACHE_VERSION = os.environ.get('HTTP_CACHE_VERSION', '1')
+    
+    # Record executed SELECTs (JSON lines) for scripts/utils/index_advisor.py
+    QUERY_LOG_PATH = os.environ.get('QUERY_LOG_PATH') or None
+    
+    # Raise when one request runs the same SELECT more than this many times (N+1 detection; tests set it)
+    QUERY_REPEAT_LIMIT = int(os.environ['QUERY_REPEAT_LIMIT']) if os.environ.get('QUERY_REPEAT_LIMIT') else None
@@ -2,16 +2,21 @@
 from app.models.user import db, User
 from app.models.farmer import (
     CropIssue, YieldPrediction, Notice, FarmerNoticeRead,
-    ProductRequest, ChatMessage, FarmerProduct, MarketplaceOrder
+    ProductRequest, ChatMessage, ChatReadCursor, UnreadCounter, FarmerProduct, MarketplaceOrder,
+    MarketplaceInquiry
 )
 from app.models.expert import DiagnosisReport, ExpertRating
-from app.models.admin import MLDataset, ModelTraining, ModelPerformance
-from app.models.officer import Product, ProductStockHistory
+from app.models.admin import (
+    MLDataset, ModelTraining, ModelPerformance,
+    IssueRollup, RegionFarmerRollup, YieldRollup, DiseaseRollup
+)
+from app.models.officer import Product, ProductStockHistory, ProductStockSnapshot
 
 __all__ = [
     'db', 'User', 'CropIssue', 'YieldPrediction', 
-    'Notice', 'FarmerNoticeRead', 'ProductRequest', 'ChatMessage', 'FarmerProduct',
-    'MarketplaceOrder', 'DiagnosisReport', 'ExpertRating',
+    'Notice', 'FarmerNoticeRead', 'ProductRequest', 'ChatMessage', 'ChatReadCursor', 'UnreadCounter', 'FarmerProduct',
+    'MarketplaceOrder', 'MarketplaceInquiry', 'DiagnosisReport', 'ExpertRating',
     'MLDataset', 'ModelTraining', 'ModelPerformance',
-    'Product', 'ProductStockHistory'
+    'IssueRollup', 'RegionFarmerRollup', 'YieldRollup', 'DiseaseRollup',
+    'Product', 'ProductStockHistory', 'ProductStockSnapshot'
 ]
@@ -61,3 +61,68 @@ class ModelPerformance(db.Model):
     def __repr__(self):
         return f'<ModelPerformance {self.id} - {self.model_type}>'
 
+
+# ==================== STATISTICS ROLLUPS ====================
+# Incrementally maintained aggregates (see app/utils/rollups.py).
+# Key columns use '' instead of NULL so they can take part in unique keys.
+
+class IssueRollup(db.Model):
+    __tablename__ = 'issue_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('location', 'crop_type', 'month', name='uq_issue_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(200), nullable=False, default='')
+    crop_type = db.Column(db.String(100), nullable=False, default='')
+    month = db.Column(db.String(7), nullable=False, index=True)  # YYYY-MM
+    issue_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<IssueRollup {self.location}/{self.crop_type}/{self.month}: {self.issue_count}>'
+
+class RegionFarmerRollup(db.Model):
+    __tablename__ = 'region_farmer_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('location', 'farmer_id', name='uq_region_farmer_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(200), nullable=False, default='')
+    farmer_id = db.Column(db.Integer, nullable=False)
+    issue_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<RegionFarmerRollup {self.location}/{self.farmer_id}: {self.issue_count}>'
+
+class YieldRollup(db.Model):
+    __tablename__ = 'yield_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('location', 'crop_type', 'month', name='uq_yield_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(200), nullable=False, default='')
+    crop_type = db.Column(db.String(100), nullable=False, default='')
+    month = db.Column(db.String(7), nullable=False, index=True)  # YYYY-MM
+    prediction_count = db.Column(db.Integer, default=0, nullable=False)
+    yield_sum = db.Column(db.Float, default=0.0, nullable=False)
+    yield_count = db.Column(db.Integer, default=0, nullable=False)  # predictions with a yield value
+    
+    def __repr__(self):
+        return f'<YieldRollup {self.location}/{self.crop_type}/{self.month}: {self.prediction_count}>'
+
+class DiseaseRollup(db.Model):
+    __tablename__ = 'disease_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('disease', 'crop_type', 'severity', name='uq_disease_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    disease = db.Column(db.String(200), nullable=False, default='')
+    crop_type = db.Column(db.String(100), nullable=False, default='')
+    severity = db.Column(db.String(20), nullable=False, default='')
+    diagnosis_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<DiseaseRollup {self.disease}/{self.crop_type}/{self.severity}: {self.diagnosis_count}>'
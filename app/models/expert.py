@@ -1,9 +1,12 @@
 # Expert Module Models
-from app.models.user import db
+from app.models.user import db, JSONDocument
 from datetime import datetime
 
 class DiagnosisReport(db.Model):
     __tablename__ = 'diagnosis_reports'
+    __table_args__ = (
+        db.Index('ix_diagnosis_reports_expert_created', 'expert_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     crop_issue_id = db.Column(db.Integer, db.ForeignKey('crop_issues.id'), nullable=False, unique=True)
@@ -13,7 +16,7 @@ class DiagnosisReport(db.Model):
     severity = db.Column(db.String(20))  # Low, Medium, High, Critical
     treatment_plan = db.Column(db.Text, nullable=False)
     preventive_measures = db.Column(db.Text)
-    recommended_products = db.Column(db.Text)  # JSON string
+    recommended_products = db.Column(JSONDocument)  # List of product names
     ai_prediction_used = db.Column(db.Boolean, default=False)
     confidence_level = db.Column(db.String(20))  # High, Medium, Low
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
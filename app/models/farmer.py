@@ -1,9 +1,13 @@
 # Farmer Module Models
-from app.models.user import db
+from app.models.user import db, JSONDocument
 from datetime import datetime
 
 class CropIssue(db.Model):
     __tablename__ = 'crop_issues'
+    __table_args__ = (
+        db.Index('ix_crop_issues_farmer_created', 'farmer_id', 'created_at'),
+        db.Index('ix_crop_issues_status_created', 'status', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -11,11 +15,11 @@ class CropIssue(db.Model):
     crop_variety = db.Column(db.String(100))
     planting_date = db.Column(db.Date)
     issue_description = db.Column(db.Text, nullable=False)
-    symptoms = db.Column(db.Text)  # JSON string of selected symptoms
+    symptoms = db.Column(JSONDocument)  # List of selected symptoms
     image_path = db.Column(db.String(255))
     location = db.Column(db.String(200))
     status = db.Column(db.String(20), default='pending', nullable=False)  # pending, reviewed, resolved
-    ai_prediction = db.Column(db.Text)  # JSON string of AI disease prediction
+    ai_prediction = db.Column(JSONDocument)  # AI disease prediction (disease_name, confidence, ...)
     expert_response = db.Column(db.Text)
     expert_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -29,6 +33,9 @@ class CropIssue(db.Model):
 
 class YieldPrediction(db.Model):
     __tablename__ = 'yield_predictions'
+    __table_args__ = (
+        db.Index('ix_yield_predictions_farmer_created', 'farmer_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -75,6 +82,9 @@ class Notice(db.Model):
 
 class FarmerNoticeRead(db.Model):
     __tablename__ = 'farmer_notice_reads'
+    __table_args__ = (
+        db.Index('ix_farmer_notice_reads_farmer_notice', 'farmer_id', 'notice_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     notice_id = db.Column(db.Integer, db.ForeignKey('notices.id'), nullable=False)
@@ -89,9 +99,14 @@ class FarmerNoticeRead(db.Model):
 
 class ProductRequest(db.Model):
     __tablename__ = 'product_requests'
+    __table_args__ = (
+        db.Index('ix_product_requests_status_created', 'status', 'created_at'),
+        db.Index('ix_product_requests_product', 'product_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'))  # Inventory product, matched by name and type
     product_name = db.Column(db.String(200), nullable=False)
     product_type = db.Column(db.String(50), nullable=False)  # seed, fertilizer, pesticide, equipment
     quantity = db.Column(db.Integer, nullable=False)
@@ -106,19 +121,24 @@ class ProductRequest(db.Model):
     
     farmer = db.relationship('User', foreign_keys=[farmer_id], backref='product_requests')
     approver = db.relationship('User', foreign_keys=[approved_by])
+    product = db.relationship('Product', backref='requests')
     
     def __repr__(self):
         return f'<ProductRequest {self.id} - {self.product_name}>'
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_thread', 'farmer_id', 'expert_id', 'id'),
+        db.Index('ix_chat_messages_unread', 'farmer_id', 'sender_role', 'is_read'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     expert_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     message = db.Column(db.Text, nullable=False)
     sender_role = db.Column(db.String(20), nullable=False)  # farmer, expert
-    is_read = db.Column(db.Boolean, default=False, nullable=False)
+    is_read = db.Column(db.Boolean, default=False, nullable=False)  # legacy; reads are tracked by ChatReadCursor
     related_issue_id = db.Column(db.Integer, db.ForeignKey('crop_issues.id'))
     image_path = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -131,12 +151,59 @@ class ChatMessage(db.Model):
         return f'<ChatMessage {self.id}>'
 
 
+class ChatReadCursor(db.Model):
+    """
+    Highest message id each side of a farmer-expert conversation has read.
+    Messages from the other side with a larger id are unread; unread counters
+    and "mark read" use the cursor, not ``ChatMessage.is_read``.
+    """
+    __tablename__ = 'chat_read_cursors'
+    __table_args__ = (
+        db.UniqueConstraint('farmer_id', 'expert_id', 'reader_role', name='uq_chat_read_cursor'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    expert_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    reader_role = db.Column(db.String(20), nullable=False)  # farmer, expert
+    last_read_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChatReadCursor {self.farmer_id}-{self.expert_id} {self.reader_role}@{self.last_read_id}>'
+
+
+class UnreadCounter(db.Model):
+    """
+    Unread messages per recipient and conversation, maintained on write.
+    kind is 'chat' (partner_id = the other user) or 'inquiry' (partner_id = 0,
+    public marketplace inquiries).
+    """
+    __tablename__ = 'unread_counters'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'partner_id', name='uq_unread_counter_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # chat, inquiry
+    partner_id = db.Column(db.Integer, nullable=False, default=0)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<UnreadCounter {self.user_id} {self.kind}:{self.partner_id}={self.unread_count}>'
+
+
 class FarmerProduct(db.Model):
     """
     Farmer's agricultural products for public agro marketplace.
     Allows farmers to list products for sale (tomato, onion, etc.) with stock and contact details.
     """
     __tablename__ = 'farmer_products'
+    __table_args__ = (
+        db.Index('ix_farmer_products_available_created', 'is_available', 'created_at', 'id'),
+        db.Index('ix_farmer_products_category_available_created', 'category', 'is_available', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -169,6 +236,10 @@ class MarketplaceOrder(db.Model):
     Includes shipping info, payment status, and delivery status.
     """
     __tablename__ = 'marketplace_orders'
+    __table_args__ = (
+        db.Index('ix_marketplace_orders_farmer_created', 'farmer_id', 'created_at'),
+        db.Index('ix_marketplace_orders_reservation', 'payment_status', 'reserved_until'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('farmer_products.id'), nullable=False)
@@ -186,13 +257,16 @@ class MarketplaceOrder(db.Model):
     total_price = db.Column(db.Float, nullable=False)
     
     # Status tracking
-    payment_status = db.Column(db.String(20), default='pending')  # pending, paid
+    payment_status = db.Column(db.String(20), default='pending')  # pending, paid, expired
     order_status = db.Column(db.String(20), default='pending')    # pending, shipped, delivered, cancelled
     
     # Payment Info
     transaction_id = db.Column(db.String(100))
     payment_method = db.Column(db.String(50), default='Demo Card')
     
+    # Stock is held for the order until payment or this time (see app/utils/reservations.py)
+    reserved_until = db.Column(db.DateTime)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -204,4 +278,32 @@ class MarketplaceOrder(db.Model):
         return f'<Order {self.id} - {self.product.product_name}>'
 
 
+class MarketplaceInquiry(db.Model):
+    """
+    Question sent to a farmer from a public marketplace product page.
+    Visitor details are stored in their own columns rather than inside the
+    message text.
+    """
+    __tablename__ = 'marketplace_inquiries'
+    __table_args__ = (
+        db.Index('ix_marketplace_inquiries_farmer_created', 'farmer_id', 'created_at'),
+        db.Index('ix_marketplace_inquiries_farmer_unread', 'farmer_id', 'is_read'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('farmer_products.id'), index=True)  # None for backfilled rows
+    farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    visitor_name = db.Column(db.String(150), nullable=False, default='Guest')
+    visitor_phone = db.Column(db.String(20))
+    message = db.Column(db.Text, nullable=False)
+    is_read = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    product = db.relationship('FarmerProduct', backref='inquiries')
+    farmer = db.relationship('User', backref='marketplace_inquiries')
+
+    def __repr__(self):
+        return f'<MarketplaceInquiry {self.id}>'
+
+
 
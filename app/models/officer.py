@@ -27,8 +27,15 @@ class Product(db.Model):
     def __repr__(self):
         return f'<Product {self.id} - {self.name}>'
 
+# Product requests are matched to inventory case-insensitively on type and name
+db.Index('ix_products_type_name_lower', db.func.lower(Product.product_type), db.func.lower(Product.name))
+
 class ProductStockHistory(db.Model):
     __tablename__ = 'product_stock_history'
+    __table_args__ = (
+        db.Index('ix_product_stock_history_product_created', 'product_id', 'created_at'),
+        db.Index('ix_product_stock_history_idempotency_key', 'idempotency_key', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
@@ -37,6 +44,7 @@ class ProductStockHistory(db.Model):
     new_stock = db.Column(db.Integer, nullable=False)
     reason = db.Column(db.String(200))  # restock, distribution, adjustment, etc.
     changed_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    idempotency_key = db.Column(db.String(64))  # Client-supplied; a repeated key does not apply the change again
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     product = db.relationship('Product', backref='stock_history')
@@ -45,3 +53,17 @@ class ProductStockHistory(db.Model):
     def __repr__(self):
         return f'<ProductStockHistory {self.id} - Product {self.product_id}>'
 
+class ProductStockSnapshot(db.Model):
+    """Stock of one product at ``taken_at``; stock history after it is the delta to later dates"""
+    __tablename__ = 'product_stock_snapshots'
+    __table_args__ = (
+        db.Index('ix_product_stock_snapshots_product_taken', 'product_id', 'taken_at', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    stock_quantity = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<ProductStockSnapshot Product {self.product_id} @ {self.taken_at}>'
@@ -1,11 +1,16 @@
 # User Model
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import JSONB
 import bcrypt
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# Column type for JSON documents: JSONB on PostgreSQL, JSON text (queried through JSON1) on SQLite.
+# Python None is stored as SQL NULL rather than the JSON value null.
+JSONDocument = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -1,5 +1,5 @@
 # Admin Module Routes
-from flask import Blueprint, render_template, request, flash, redirect, url_for, send_file, make_response, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, send_file, make_response, current_app, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app.models import (
@@ -7,7 +7,13 @@ from app.models import (
     ExpertRating, ProductRequest, ChatMessage, Notice,
     MLDataset, ModelTraining, ModelPerformance
 )
-from app.utils.reports import generate_pdf_report, generate_csv_report
+from app.utils.reports import generate_pdf_report, stream_csv_report
+from app.utils.report_jobs import report_jobs
+from app.utils.stats import (
+    load_dashboard_stats, load_system_totals, region_issue_stats, region_yield_stats,
+    disease_frequency_stats, disease_by_crop_stats, yield_by_crop_stats, yield_trend_stats,
+    predicted_disease_stats
+)
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc, and_, case
 from pathlib import Path
@@ -30,80 +36,9 @@ def dashboard():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.admin_login'))
     
-    # User statistics
-    total_farmers = User.query.filter_by(role='farmer').count()
-    total_experts = User.query.filter_by(role='expert').count()
-    total_officers = User.query.filter_by(role='krishi_bhavan_officer').count()
-    active_users = User.query.filter_by(is_active=True).count()
-    
-    # Issue statistics
-    total_issues = CropIssue.query.count()
-    pending_issues = CropIssue.query.filter_by(status='pending').count()
-    resolved_issues = CropIssue.query.filter_by(status='resolved').count()
-    
-    # Prediction statistics
-    total_yield_predictions = YieldPrediction.query.count()
-    total_diagnoses = DiagnosisReport.query.count()
-    
-    # Product requests
-    total_product_requests = ProductRequest.query.count()
-    pending_requests = ProductRequest.query.filter_by(status='pending').count()
-    
-    # Region statistics
-    region_stats = db.session.query(
-        CropIssue.location,
-        func.count(CropIssue.id)
-    ).filter(CropIssue.location.isnot(None))\
-     .group_by(CropIssue.location)\
-     .order_by(desc(func.count(CropIssue.id)))\
-     .limit(10).all()
+    stats = load_dashboard_stats()
     
-    # Disease frequency
-    disease_frequency = db.session.query(
-        DiagnosisReport.disease_identified,
-        func.count(DiagnosisReport.id)
-    ).filter(DiagnosisReport.disease_identified.isnot(None))\
-     .group_by(DiagnosisReport.disease_identified)\
-     .order_by(desc(func.count(DiagnosisReport.id)))\
-     .limit(10).all()
-    
-    # Crop type distribution
-    crop_distribution = db.session.query(
-        CropIssue.crop_type,
-        func.count(CropIssue.id)
-    ).group_by(CropIssue.crop_type).all()
-    
-    # Monthly trends (last 6 months) - handle Postgres vs SQLite
-    dialect = db.engine.dialect.name
-    month_expr = func.strftime('%Y-%m', CropIssue.created_at) if dialect == 'sqlite' else func.to_char(CropIssue.created_at, 'YYYY-MM')
-    monthly_issues = db.session.query(
-        month_expr.label('month'),
-        func.count(CropIssue.id)
-    ).group_by('month')\
-     .order_by(desc('month'))\
-     .limit(6).all()
-    
-    # Yield statistics
-    avg_yield = db.session.query(func.avg(YieldPrediction.predicted_yield)).scalar()
-    avg_yield = round(avg_yield, 2) if avg_yield else 0
-    
-    return render_template('admin/dashboard.html',
-                         total_farmers=total_farmers,
-                         total_experts=total_experts,
-                         total_officers=total_officers,
-                         active_users=active_users,
-                         total_issues=total_issues,
-                         pending_issues=pending_issues,
-                         resolved_issues=resolved_issues,
-                         total_yield_predictions=total_yield_predictions,
-                         total_diagnoses=total_diagnoses,
-                         total_product_requests=total_product_requests,
-                         pending_requests=pending_requests,
-                         region_stats=dict(region_stats),
-                         disease_frequency=dict(disease_frequency),
-                         crop_distribution=dict(crop_distribution),
-                         monthly_issues=dict(monthly_issues),
-                         avg_yield=avg_yield)
+    return render_template('admin/dashboard.html', **stats.template_context())
 
 # ==================== USER MANAGEMENT ====================
 
@@ -206,21 +141,10 @@ def region_statistics():
         return redirect(url_for('auth.admin_login'))
     
     # Region-wise statistics
-    region_issues = db.session.query(
-        CropIssue.location,
-        func.count(CropIssue.id).label('total_issues'),
-        func.count(func.distinct(CropIssue.farmer_id)).label('farmers_count')
-    ).filter(CropIssue.location.isnot(None))\
-     .group_by(CropIssue.location)\
-     .order_by(desc('total_issues')).all()
+    region_issues = region_issue_stats()
     
     # Region-wise yield predictions
-    region_yields = db.session.query(
-        YieldPrediction.location,
-        func.avg(YieldPrediction.predicted_yield).label('avg_yield'),
-        func.count(YieldPrediction.id).label('prediction_count')
-    ).group_by(YieldPrediction.location)\
-     .order_by(desc('avg_yield')).all()
+    region_yields = region_yield_stats()
     
     return render_template('admin/region_statistics.html',
                          region_issues=region_issues,
@@ -236,35 +160,18 @@ def disease_statistics():
         return redirect(url_for('auth.admin_login'))
     
     # Disease frequency
-    disease_freq = db.session.query(
-        DiagnosisReport.disease_identified,
-        func.count(DiagnosisReport.id).label('count'),
-        func.avg(
-            case(
-                (DiagnosisReport.severity == 'Critical', 4),
-                (DiagnosisReport.severity == 'High', 3),
-                (DiagnosisReport.severity == 'Medium', 2),
-                (DiagnosisReport.severity == 'Low', 1),
-                else_=0
-            )
-        ).label('avg_severity')
-    ).filter(DiagnosisReport.disease_identified.isnot(None))\
-     .group_by(DiagnosisReport.disease_identified)\
-     .order_by(desc('count')).all()
+    disease_freq = disease_frequency_stats()
     
     # Disease by crop type
-    disease_by_crop = db.session.query(
-        CropIssue.crop_type,
-        DiagnosisReport.disease_identified,
-        func.count(DiagnosisReport.id)
-    ).join(DiagnosisReport, CropIssue.id == DiagnosisReport.crop_issue_id)\
-     .filter(DiagnosisReport.disease_identified.isnot(None))\
-     .group_by(CropIssue.crop_type, DiagnosisReport.disease_identified)\
-     .order_by(desc(func.count(DiagnosisReport.id))).all()
+    disease_by_crop = disease_by_crop_stats()
+    
+    # AI predictions, grouped in SQL on the JSON column
+    predicted_diseases = predicted_disease_stats()
     
     return render_template('admin/disease_statistics.html',
                          disease_freq=disease_freq,
-                         disease_by_crop=disease_by_crop)
+                         disease_by_crop=disease_by_crop,
+                         predicted_diseases=predicted_diseases)
 
 # ==================== YIELD STATISTICS ====================
 
@@ -276,31 +183,13 @@ def yield_statistics():
         return redirect(url_for('auth.admin_login'))
     
     # Yield by crop type
-    yield_by_crop = db.session.query(
-        YieldPrediction.crop_type,
-        func.avg(YieldPrediction.predicted_yield).label('avg_yield'),
-        func.count(YieldPrediction.id).label('count')
-    ).group_by(YieldPrediction.crop_type)\
-     .order_by(desc('avg_yield')).all()
+    yield_by_crop = yield_by_crop_stats()
     
     # Yield by region
-    yield_by_region = db.session.query(
-        YieldPrediction.location,
-        func.avg(YieldPrediction.predicted_yield).label('avg_yield'),
-        func.count(YieldPrediction.id).label('count')
-    ).group_by(YieldPrediction.location)\
-     .order_by(desc('avg_yield')).all()
-    
-    # Yield trends (monthly) - handle Postgres vs SQLite
-    dialect = db.engine.dialect.name
-    month_expr = func.strftime('%Y-%m', YieldPrediction.created_at) if dialect == 'sqlite' else func.to_char(YieldPrediction.created_at, 'YYYY-MM')
-    yield_trends = db.session.query(
-        month_expr.label('month'),
-        func.avg(YieldPrediction.predicted_yield).label('avg_yield'),
-        func.count(YieldPrediction.id).label('count')
-    ).group_by('month')\
-     .order_by(desc('month'))\
-     .limit(12).all()
+    yield_by_region = region_yield_stats()
+    
+    # Yield trends (monthly)
+    yield_trends = yield_trend_stats(months=12)
     
     return render_template('admin/yield_statistics.html',
                          yield_by_crop=yield_by_crop,
@@ -473,31 +362,15 @@ def retrain_model():
 
 # ==================== REPORTS ====================
 
-@admin_bp.route('/reports/region-wise/pdf')
-@login_required
-def report_region_wise_pdf():
-    if not current_user.is_admin():
-        flash('Access denied.', 'danger')
-        return redirect(url_for('auth.admin_login'))
-    
-    from app.utils.reports import generate_pdf_report
-    
+@report_jobs.report('admin_region_wise', tables=(CropIssue.__tablename__, YieldPrediction.__tablename__),
+                    filename='region_wise_report_{date}.pdf')
+def build_region_wise_report():
+    """Region-wise statistics PDF (runs on the report worker pool)"""
     # Region-wise statistics
-    region_stats = db.session.query(
-        CropIssue.location,
-        func.count(CropIssue.id).label('total_issues'),
-        func.count(func.distinct(CropIssue.farmer_id)).label('farmers_count')
-    ).filter(CropIssue.location.isnot(None))\
-     .group_by(CropIssue.location)\
-     .order_by(desc('total_issues')).all()
+    region_stats = region_issue_stats()
     
     # Region-wise yield data
-    region_yields = db.session.query(
-        YieldPrediction.location,
-        func.avg(YieldPrediction.predicted_yield).label('avg_yield'),
-        func.count(YieldPrediction.id).label('prediction_count')
-    ).group_by(YieldPrediction.location)\
-     .order_by(desc('avg_yield')).all()
+    region_yields = region_yield_stats()
     
     data = []
     for region in region_stats:
@@ -519,21 +392,116 @@ def report_region_wise_pdf():
         'Total Yield Predictions': sum(r.prediction_count for r in region_yields)
     }
     
-    pdf_buffer = generate_pdf_report(
+    return generate_pdf_report(
         data,
         'Region-Wise Statistics',
         'Admin',
         subtitle='Comprehensive regional analysis',
         summary=summary
     )
+
+
+@report_jobs.report('admin_users', tables=(User.__tablename__,), filename='users_report_{date}.pdf')
+def build_users_report():
+    """All users PDF (runs on the report worker pool)"""
+    users = User.query.order_by(User.id).yield_per(1000)
+    data = ({
+        'ID': user.id,
+        'Username': user.username,
+        'Name': user.full_name,
+        'Email': user.email,
+        'Role': user.role,
+        'Status': 'Active' if user.is_active else 'Inactive',
+        'Created': user.created_at.strftime('%Y-%m-%d')
+    } for user in users)
+    
+    return generate_pdf_report(data, 'Users Report', 'Admin')
+
+
+def report_job_payload(job_id):
+    state = report_jobs.status(job_id)
+    return {
+        'job_id': job_id,
+        'report': state['report'],
+        'status': state['status'],
+        'error': state.get('error'),
+        'status_url': url_for('admin.report_job_status', job_id=job_id),
+        'download_url': url_for('admin.report_job_download', job_id=job_id) if state['status'] == 'done' else None
+    }
+
+
+def serve_report_job(name):
+    """
+    Send the cached report if it is built for the current data, otherwise
+    queue it and answer 202 (JSON for API clients, a self-refreshing page
+    for browsers).
+    """
+    job_id = report_jobs.submit(name)
+    state = report_jobs.status(job_id)
+    if state['status'] == 'done':
+        return send_file(
+            report_jobs.artifact_path(job_id),
+            mimetype=report_jobs.mimetype(job_id),
+            as_attachment=True,
+            download_name=report_jobs.download_name(job_id)
+        )
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(report_job_payload(job_id)), 202
+    return render_template('admin/report_job.html', job=report_job_payload(job_id)), 202
+
+
+@admin_bp.route('/reports/jobs/<report_name>', methods=['POST'])
+@login_required
+def report_job_create(report_name):
+    """Queue a background report and return its job id"""
+    if not current_user.is_admin():
+        return jsonify({'status': 'error', 'message': 'Access denied.'}), 403
+    if report_name not in ('admin_region_wise', 'admin_users'):
+        return jsonify({'status': 'error', 'message': 'Unknown report.'}), 404
+    
+    job_id = report_jobs.submit(report_name)
+    return jsonify(report_job_payload(job_id)), 202
+
+
+@admin_bp.route('/reports/jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    if not current_user.is_admin():
+        return jsonify({'status': 'error', 'message': 'Access denied.'}), 403
+    if report_jobs.status(job_id) is None:
+        return jsonify({'status': 'error', 'message': 'Unknown job.'}), 404
+    return jsonify(report_job_payload(job_id))
+
+
+@admin_bp.route('/reports/jobs/<job_id>/download')
+@login_required
+def report_job_download(job_id):
+    if not current_user.is_admin():
+        flash('Access denied.', 'danger')
+        return redirect(url_for('auth.admin_login'))
+    
+    state = report_jobs.status(job_id)
+    if state is None or state['status'] != 'done' or not report_jobs.artifact_path(job_id).exists():
+        flash('This report is not ready yet.', 'warning')
+        return redirect(url_for('admin.dashboard'))
     
     return send_file(
-        pdf_buffer,
-        mimetype='application/pdf',
+        report_jobs.artifact_path(job_id),
+        mimetype=report_jobs.mimetype(job_id),
         as_attachment=True,
-        download_name=f'region_wise_report_{datetime.now().strftime("%Y%m%d")}.pdf'
+        download_name=report_jobs.download_name(job_id)
     )
 
+
+@admin_bp.route('/reports/region-wise/pdf')
+@login_required
+def report_region_wise_pdf():
+    if not current_user.is_admin():
+        flash('Access denied.', 'danger')
+        return redirect(url_for('auth.admin_login'))
+    
+    return serve_report_job('admin_region_wise')
+
 @admin_bp.route('/reports/region-wise/csv')
 @login_required
 def report_region_wise_csv():
@@ -541,23 +509,9 @@ def report_region_wise_csv():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.admin_login'))
     
-    from app.utils.reports import generate_csv_report
-    from flask import make_response
-    
-    region_stats = db.session.query(
-        CropIssue.location,
-        func.count(CropIssue.id).label('total_issues'),
-        func.count(func.distinct(CropIssue.farmer_id)).label('farmers_count')
-    ).filter(CropIssue.location.isnot(None))\
-     .group_by(CropIssue.location)\
-     .order_by(desc('total_issues')).all()
+    region_stats = region_issue_stats()
     
-    region_yields = db.session.query(
-        YieldPrediction.location,
-        func.avg(YieldPrediction.predicted_yield).label('avg_yield'),
-        func.count(YieldPrediction.id).label('prediction_count')
-    ).group_by(YieldPrediction.location)\
-     .order_by(desc('avg_yield')).all()
+    region_yields = region_yield_stats()
     
     data = []
     for region in region_stats:
@@ -570,13 +524,7 @@ def report_region_wise_csv():
             'Yield Predictions': yield_data.prediction_count if yield_data else 0
         })
     
-    csv_data = generate_csv_report(data, 'region_wise')
-    
-    response = make_response(csv_data)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=region_wise_report_{datetime.now().strftime("%Y%m%d")}.csv'
-    
-    return response
+    return stream_csv_report(data, f'region_wise_report_{datetime.now().strftime("%Y%m%d")}.csv')
 
 @admin_bp.route('/reports/system/pdf')
 @login_required
@@ -588,33 +536,7 @@ def system_report_pdf():
     from app.utils.reports import generate_pdf_report
     
     # Collect system-wide data
-    data = []
-    
-    # User statistics
-    data.append({
-        'Category': 'Total Farmers',
-        'Value': User.query.filter_by(role='farmer').count()
-    })
-    data.append({
-        'Category': 'Total Experts',
-        'Value': User.query.filter_by(role='expert').count()
-    })
-    data.append({
-        'Category': 'Total Officers',
-        'Value': User.query.filter_by(role='krishi_bhavan_officer').count()
-    })
-    data.append({
-        'Category': 'Total Crop Issues',
-        'Value': CropIssue.query.count()
-    })
-    data.append({
-        'Category': 'Total Yield Predictions',
-        'Value': YieldPrediction.query.count()
-    })
-    data.append({
-        'Category': 'Total Diagnoses',
-        'Value': DiagnosisReport.query.count()
-    })
+    data = load_system_totals().as_report_rows()
     
     pdf_buffer = generate_pdf_report(data, 'System Report', 'Admin')
     
@@ -632,45 +554,10 @@ def system_report_csv():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.admin_login'))
     
-    from app.utils.reports import generate_csv_report
-    from flask import make_response
-    
     # Collect system-wide data
-    data = []
+    data = load_system_totals().as_report_rows()
     
-    # User statistics
-    data.append({
-        'Category': 'Total Farmers',
-        'Value': User.query.filter_by(role='farmer').count()
-    })
-    data.append({
-        'Category': 'Total Experts',
-        'Value': User.query.filter_by(role='expert').count()
-    })
-    data.append({
-        'Category': 'Total Officers',
-        'Value': User.query.filter_by(role='krishi_bhavan_officer').count()
-    })
-    data.append({
-        'Category': 'Total Crop Issues',
-        'Value': CropIssue.query.count()
-    })
-    data.append({
-        'Category': 'Total Yield Predictions',
-        'Value': YieldPrediction.query.count()
-    })
-    data.append({
-        'Category': 'Total Diagnoses',
-        'Value': DiagnosisReport.query.count()
-    })
-    
-    csv_data = generate_csv_report(data, 'system_report')
-    
-    response = make_response(csv_data)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=system_report_{datetime.now().strftime("%Y%m%d")}.csv'
-    
-    return response
+    return stream_csv_report(data, f'system_report_{datetime.now().strftime("%Y%m%d")}.csv')
 
 @admin_bp.route('/reports/users/pdf')
 @login_required
@@ -679,28 +566,7 @@ def users_report_pdf():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.admin_login'))
     
-    users = User.query.all()
-    data = []
-    
-    for user in users:
-        data.append({
-            'ID': user.id,
-            'Username': user.username,
-            'Name': user.full_name,
-            'Email': user.email,
-            'Role': user.role,
-            'Status': 'Active' if user.is_active else 'Inactive',
-            'Created': user.created_at.strftime('%Y-%m-%d')
-        })
-    
-    pdf_buffer = generate_pdf_report(data, 'Users Report', 'Admin')
-    
-    return send_file(
-        pdf_buffer,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'users_report_{datetime.now().strftime("%Y%m%d")}.pdf'
-    )
+    return serve_report_job('admin_users')
 
 @admin_bp.route('/reports/users/csv')
 @login_required
@@ -709,11 +575,8 @@ def users_report_csv():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.admin_login'))
     
-    users = User.query.all()
-    data = []
-    
-    for user in users:
-        data.append({
+    def user_row(user):
+        return {
             'ID': user.id,
             'Username': user.username,
             'Name': user.full_name,
@@ -721,13 +584,23 @@ def users_report_csv():
             'Role': user.role,
             'Status': 'Active' if user.is_active else 'Inactive',
             'Created': user.created_at.strftime('%Y-%m-%d')
-        })
+        }
     
-    csv_data = generate_csv_report(data, 'users_report')
+    # Streamed in id order, a chunk of users at a time
+    return stream_csv_report(User.query.order_by(User.id), f'users_report_{datetime.now().strftime("%Y%m%d")}.csv',
+                             row_fn=user_row)
+
+@admin_bp.route('/reports/farmers/bulk')
+@login_required
+def report_farmers_bulk():
+    """ZIP of disease history and yield PDFs for every farmer (optionally one district)"""
+    if not current_user.is_admin():
+        flash('Access denied.', 'danger')
+        return redirect(url_for('auth.admin_login'))
     
-    response = make_response(csv_data)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=users_report_{datetime.now().strftime("%Y%m%d")}.csv'
+    from app.utils.bulk_reports import stream_farmer_reports_zip, REPORT_KINDS
     
-    return response
+    district = request.args.get('district', '').strip() or None
+    kinds = [k for k in request.args.get('reports', ','.join(REPORT_KINDS)).split(',') if k in REPORT_KINDS]
+    return stream_farmer_reports_zip(district, kinds or REPORT_KINDS)
 
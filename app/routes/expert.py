@@ -7,8 +7,14 @@ from app.models import (
     DiagnosisReport, ExpertRating
 )
 from app.utils.ml_helpers import predict_disease, predict_yield
+from app.utils.stats import cached_issue_overview
+from app.utils.timeseries import monthly_series, days_between
+from app.utils.chat import (
+    CHAT_PAGE_SIZE, load_messages_page, serialize_message, mark_thread_read, load_conversations
+)
+from app.utils.unread_counters import unread_total
+from app.utils.images import image_pipeline
 from datetime import datetime
-import json
 from sqlalchemy import func, desc
 
 expert_bp = Blueprint('expert', __name__)
@@ -27,9 +33,8 @@ def dashboard():
     from app.utils.weather import get_weather
     weather = get_weather(location)
     
-    # Statistics
-    total_issues = CropIssue.query.count()
-    pending_issues = CropIssue.query.filter_by(status='pending').count()
+    # Statistics (global numbers are shared by all experts and cached)
+    overview = cached_issue_overview()
     my_diagnoses = DiagnosisReport.query.filter_by(expert_id=current_user.id).count()
     my_ratings = ExpertRating.query.filter_by(expert_id=current_user.id).count()
     
@@ -46,40 +51,24 @@ def dashboard():
     my_recent_diagnoses = DiagnosisReport.query.filter_by(expert_id=current_user.id)\
         .order_by(DiagnosisReport.created_at.desc()).limit(5).all()
     
-    # Analytics data
-    issues_by_status = db.session.query(
-        CropIssue.status,
-        func.count(CropIssue.id)
-    ).group_by(CropIssue.status).all()
-    
-    issues_by_crop = db.session.query(
-        CropIssue.crop_type,
-        func.count(CropIssue.id)
-    ).group_by(CropIssue.crop_type).limit(5).all()
-    
-    # Monthly diagnoses (last 6 months) - handle Postgres vs SQLite
-    dialect = db.engine.dialect.name
-    month_expr = func.strftime('%Y-%m', DiagnosisReport.created_at) if dialect == 'sqlite' else func.to_char(DiagnosisReport.created_at, 'YYYY-MM')
-    monthly_diagnoses = db.session.query(
-        month_expr.label('month'),
-        func.count(DiagnosisReport.id)
-    ).filter_by(expert_id=current_user.id)\
-     .group_by('month')\
-     .order_by(desc('month'))\
-     .limit(6).all()
+    # Monthly diagnoses (last 6 months)
+    monthly_diagnoses = monthly_series(
+        func.count(DiagnosisReport.id), DiagnosisReport.created_at,
+        DiagnosisReport.expert_id == current_user.id, months=6
+    )
     
     return render_template('expert/dashboard.html',
                          weather=weather,
-                         total_issues=total_issues,
-                         pending_issues=pending_issues,
+                         total_issues=overview.total_issues,
+                         pending_issues=overview.pending_issues,
                          my_diagnoses=my_diagnoses,
                          my_ratings=my_ratings,
                          avg_rating=avg_rating,
                          recent_pending=recent_pending,
                          my_recent_diagnoses=my_recent_diagnoses,
-                         issues_by_status=dict(issues_by_status),
-                         issues_by_crop=dict(issues_by_crop),
-                         monthly_diagnoses=dict(monthly_diagnoses))
+                         issues_by_status=overview.issues_by_status,
+                         issues_by_crop=overview.issues_by_crop,
+                         monthly_diagnoses=monthly_diagnoses)
 
 # ==================== PENDING ISSUES ====================
 
@@ -107,18 +96,10 @@ def view_issue(issue_id):
     # Check if already diagnosed
     existing_report = DiagnosisReport.query.filter_by(crop_issue_id=issue_id).first()
     
-    # Get AI prediction if available
-    ai_prediction = None
-    if issue.ai_prediction:
-        try:
-            ai_prediction = json.loads(issue.ai_prediction)
-        except:
-            pass
-    
     return render_template('expert/view_issue.html',
                          issue=issue,
                          existing_report=existing_report,
-                         ai_prediction=ai_prediction)
+                         ai_prediction=issue.ai_prediction)
 
 # ==================== DIAGNOSE ISSUE ====================
 
@@ -150,8 +131,7 @@ def diagnose_issue(issue_id):
         # AI Disease Prediction (if requested)
         ai_prediction_result = None
         if use_ai_prediction:
-            symptoms = json.loads(issue.symptoms) if issue.symptoms else []
-            ai_prediction_result = predict_disease(issue.image_path, symptoms, issue.crop_type)
+            ai_prediction_result = predict_disease(issue.image_path, issue.symptoms or [], issue.crop_type)
         
         if not all([diagnosis, treatment_plan]):
             flash('Please fill in all required fields.', 'danger')
@@ -166,7 +146,7 @@ def diagnose_issue(issue_id):
             severity=severity,
             treatment_plan=treatment_plan,
             preventive_measures=preventive_measures,
-            recommended_products=json.dumps(recommended_products) if recommended_products else None,
+            recommended_products=recommended_products or None,
             ai_prediction_used=use_ai_prediction,
             confidence_level=confidence_level
         )
@@ -185,14 +165,6 @@ def diagnose_issue(issue_id):
             db.session.rollback()
             flash(f'An error occurred while saving the diagnosis: {str(e)}. Please try again.', 'danger')
     
-    # Get AI prediction if available
-    ai_prediction = None
-    if issue.ai_prediction:
-        try:
-            ai_prediction = json.loads(issue.ai_prediction)
-        except:
-            pass
-    
     # Symptom options for AI prediction
     symptom_options = [
         'Yellowing leaves', 'Brown spots', 'Wilting', 'Stunted growth',
@@ -203,7 +175,7 @@ def diagnose_issue(issue_id):
     
     return render_template('expert/diagnose_issue.html',
                          issue=issue,
-                         ai_prediction=ai_prediction,
+                         ai_prediction=issue.ai_prediction,
                          symptom_options=symptom_options)
 
 # ==================== AI PREDICTIONS ====================
@@ -224,7 +196,7 @@ def ai_disease_prediction():
     
     prediction = predict_disease(image_path, symptoms, crop_type)
     
-    return jsonify(json.loads(prediction))
+    return jsonify(prediction)
 
 @expert_bp.route('/ai/yield-prediction', methods=['POST'])
 @login_required
@@ -255,37 +227,13 @@ def chat_list():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.expert_login'))
     
-    # Get farmers that expert has chatted with with unread counts
-    farmers_with_unread = db.session.query(
-        User,
-        func.count(ChatMessage.id).label('unread_count')
-    ).join(ChatMessage, User.id == ChatMessage.farmer_id)\
-     .filter(ChatMessage.expert_id == current_user.id)\
-     .filter(ChatMessage.sender_role == 'farmer', ChatMessage.is_read == False)\
-     .group_by(User.id).all()
-    
-    # Get all farmers expert has chatted with
-    farmers = db.session.query(User).join(ChatMessage, User.id == ChatMessage.farmer_id)\
-        .filter(ChatMessage.expert_id == current_user.id)\
-        .distinct().all()
-    
-    # Create unread count dict
-    unread_counts = {farmer.id: count for farmer, count in farmers_with_unread}
-    for farmer in farmers:
-        if farmer.id not in unread_counts:
-            unread_counts[farmer.id] = 0
-    
-    # Get total unread count
-    total_unread = ChatMessage.query.filter(
-        ChatMessage.expert_id == current_user.id,
-        ChatMessage.sender_role == 'farmer',
-        ChatMessage.is_read == False
-    ).count()
+    # Conversations with last message and unread count (one query, most recent first)
+    page = request.args.get('page', 1, type=int)
+    conversations = load_conversations(current_user.id, 'expert', page)
     
     return render_template('expert/chat_list.html', 
-                         farmers=farmers,
-                         unread_counts=unread_counts,
-                         total_unread=total_unread)
+                         conversations=conversations,
+                         total_unread=conversations.total_unread)
 
 @expert_bp.route('/chat/<int:farmer_id>', methods=['GET', 'POST'])
 @login_required
@@ -305,16 +253,11 @@ def chat_with_farmer(farmer_id):
         image_path = None
 
         # Handle image upload if present
-        if image:
-            from werkzeug.utils import secure_filename
-            import os
-            from datetime import datetime
-            from flask import current_app
-            upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'chat_images')
-            os.makedirs(upload_dir, exist_ok=True)
-            filename = secure_filename(f"chat_{int(datetime.utcnow().timestamp())}_{image.filename}")
-            image.save(os.path.join(upload_dir, filename))
-            image_path = f"uploads/chat_images/{filename}"
+        if image and image.filename:
+            try:
+                image_path = image_pipeline.ingest(image, 'chat_images')
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
 
         if message or image_path:
             chat_message = ChatMessage(
@@ -345,16 +288,11 @@ def chat_with_farmer(farmer_id):
                 print(f"Error sending message: {str(e)}")
                 return jsonify({'status': 'error', 'message': str(e)}), 500
     
-    # Get chat messages
-    messages = ChatMessage.query.filter(
-        ChatMessage.farmer_id == farmer_id,
-        ChatMessage.expert_id == current_user.id
-    ).order_by(ChatMessage.created_at.asc()).all()
+    # Latest page of the conversation; older messages load on scroll
+    messages, has_more = load_messages_page(farmer_id, current_user.id)
     
-    # Mark messages as read
-    for msg in messages:
-        if msg.sender_role == 'farmer' and not msg.is_read:
-            msg.is_read = True
+    # Mark messages as read up to the newest one shown
+    mark_thread_read(farmer_id, current_user.id, 'expert', messages[-1].id if messages else 0)
     db.session.commit()
     
     # Get farmer's crop issues
@@ -363,9 +301,26 @@ def chat_with_farmer(farmer_id):
     return render_template('expert/chat.html',
                          farmer=farmer,
                          messages=messages,
+                         has_more=has_more,
                          crop_issues=crop_issues,
                          last_message_id=messages[-1].id if messages else 0)
 
+@expert_bp.route('/chat/<int:farmer_id>/history')
+@login_required
+def chat_history(farmer_id):
+    """Older messages for infinite scroll (keyset pagination on message id)"""
+    if not current_user.is_expert():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    before_id = request.args.get('before_id', type=int)
+    limit = request.args.get('limit', CHAT_PAGE_SIZE, type=int)
+    messages, has_more = load_messages_page(farmer_id, current_user.id, before_id, limit)
+    
+    return jsonify({
+        'messages': [serialize_message(msg) for msg in messages],
+        'has_more': has_more
+    })
+
 @expert_bp.route('/chat/<int:farmer_id>/poll')
 @login_required
 def chat_poll(farmer_id):
@@ -392,24 +347,11 @@ def chat_poll(farmer_id):
         if new_messages:
             print(f"[DEBUG] expert.chat_poll found {len(new_messages)} new_messages for farmer_id={farmer_id}: {[m.id for m in new_messages]}")
             # Mark farmer messages as read
-            for msg in new_messages:
-                if msg.sender_role == 'farmer' and not msg.is_read:
-                    msg.is_read = True
+            mark_thread_read(farmer_id, current_user.id, 'expert', new_messages[-1].id)
             db.session.commit()
             
-            messages_data = []
-            for msg in new_messages:
-                messages_data.append({
-                    'id': msg.id,
-                    'message': msg.message,
-                    'image_path': msg.image_path,
-                    'sender_role': msg.sender_role,
-                    'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    'time_display': msg.created_at.strftime('%Y-%m-%d %H:%M')
-                })
-            
             return jsonify({
-                'new_messages': messages_data,
+                'new_messages': [serialize_message(msg) for msg in new_messages],
                 'last_message_id': new_messages[-1].id
             })
         
@@ -425,11 +367,7 @@ def chat_unread_count():
     if not current_user.is_expert():
         return jsonify({'error': 'Access denied'}), 403
     
-    unread_count = ChatMessage.query.filter(
-        ChatMessage.expert_id == current_user.id,
-        ChatMessage.sender_role == 'farmer',
-        ChatMessage.is_read == False
-    ).count()
+    unread_count = unread_total(current_user.id)
     
     return jsonify({'unread_count': unread_count})
 
@@ -500,20 +438,14 @@ def analytics():
      .group_by(DiagnosisReport.severity).all()
     
     # Monthly performance (last 12 months)
-    monthly_performance = db.session.query(
-        func.strftime('%Y-%m', DiagnosisReport.created_at).label('month'),
-        func.count(DiagnosisReport.id).label('diagnoses')
-    ).filter_by(expert_id=current_user.id)\
-     .group_by('month')\
-     .order_by(desc('month'))\
-     .limit(12).all()
+    monthly_performance = monthly_series(
+        func.count(DiagnosisReport.id), DiagnosisReport.created_at,
+        DiagnosisReport.expert_id == current_user.id, months=12
+    )
     
     # Response time (average days from issue creation to diagnosis)
     response_times = db.session.query(
-        func.avg(
-            func.julianday(DiagnosisReport.created_at) - 
-            func.julianday(CropIssue.created_at)
-        )
+        func.avg(days_between(DiagnosisReport.created_at, CropIssue.created_at))
     ).join(CropIssue, DiagnosisReport.crop_issue_id == CropIssue.id)\
      .filter(DiagnosisReport.expert_id == current_user.id).scalar()
     
@@ -525,7 +457,7 @@ def analytics():
                          avg_rating=avg_rating,
                          diagnoses_by_crop=dict(diagnoses_by_crop),
                          diagnoses_by_severity=dict(diagnoses_by_severity),
-                         monthly_performance=dict(monthly_performance),
+                         monthly_performance=monthly_performance,
                          avg_response_days=avg_response_days)
 
 # ==================== REPORTS ====================
@@ -539,9 +471,11 @@ def report_performance_pdf():
     
     from app.utils.reports import generate_pdf_report
     from flask import send_file
+    from sqlalchemy.orm import joinedload
     
-    # Get all diagnoses
+    # Get all diagnoses, with their issue and farmer loaded in the same query
     diagnoses = DiagnosisReport.query.filter_by(expert_id=current_user.id)\
+        .options(joinedload(DiagnosisReport.crop_issue).joinedload(CropIssue.farmer))\
         .order_by(DiagnosisReport.created_at.desc()).all()
     
     data = []
@@ -592,15 +526,15 @@ def report_performance_csv():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.expert_login'))
     
-    from app.utils.reports import generate_csv_report
-    from flask import make_response
+    from app.utils.reports import stream_csv_report
+    from sqlalchemy.orm import joinedload
     
     diagnoses = DiagnosisReport.query.filter_by(expert_id=current_user.id)\
-        .order_by(DiagnosisReport.created_at.desc()).all()
+        .options(joinedload(DiagnosisReport.crop_issue).joinedload(CropIssue.farmer))\
+        .order_by(DiagnosisReport.created_at.desc())
     
-    data = []
-    for diag in diagnoses:
-        data.append({
+    def diagnosis_row(diag):
+        return {
             'Issue ID': diag.crop_issue_id,
             'Crop Type': diag.crop_issue.crop_type if diag.crop_issue else 'N/A',
             'Disease Identified': diag.disease_identified or 'N/A',
@@ -609,13 +543,8 @@ def report_performance_csv():
             'AI Used': 'Yes' if diag.ai_prediction_used else 'No',
             'Date': diag.created_at.strftime('%Y-%m-%d'),
             'Farmer': diag.crop_issue.farmer.full_name if diag.crop_issue else 'N/A'
-        })
-    
-    csv_data = generate_csv_report(data, 'expert_performance')
-    
-    response = make_response(csv_data)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=expert_performance_report_{datetime.now().strftime("%Y%m%d")}.csv'
+        }
     
-    return response
+    return stream_csv_report(diagnoses, f'expert_performance_report_{datetime.now().strftime("%Y%m%d")}.csv',
+                             row_fn=diagnosis_row)
 
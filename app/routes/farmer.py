@@ -2,19 +2,34 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file, session, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from app.models import db, CropIssue, YieldPrediction, Notice, ProductRequest, ChatMessage, User, ExpertRating, DiagnosisReport
+from app.models import (
+    db, CropIssue, YieldPrediction, Notice, ProductRequest, ChatMessage, User, ExpertRating, DiagnosisReport,
+    MarketplaceInquiry
+)
 from app.utils.weather import get_weather_data, get_temperature_for_location
 from app.utils.ml_helpers import predict_disease, predict_yield
-from app.utils.reports import generate_pdf_report, generate_csv_report
+from app.utils.reports import generate_pdf_report, stream_csv_report
+from app.utils.report_datasets import (
+    issue_rows, prediction_rows, disease_history_report, disease_history_record,
+    yield_predictions_report, yield_prediction_record
+)
+from app.utils.chat import (
+    CHAT_PAGE_SIZE, load_messages_page, serialize_message, mark_thread_read, load_conversations,
+    load_experts
+)
+from app.utils.unread_counters import INQUIRY, unread_total, set_unread_counter
+from app.utils.images import image_pipeline
+from app.utils.product_requests import match_product_id
 from datetime import datetime, date
 from sqlalchemy import func
-import json
 import os
 import time
 from pathlib import Path
 
 farmer_bp = Blueprint('farmer', __name__)
 
+INQUIRIES_PER_PAGE = 20
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
@@ -58,11 +73,7 @@ def dashboard():
     unread_notices_count = len(unread_notices)
     
     # Marketplace inquiries count
-    marketplace_inquiries_count = ChatMessage.query.filter_by(
-        farmer_id=current_user.id,
-        sender_role='public',
-        is_read=False
-    ).count()
+    marketplace_inquiries_count = unread_total(current_user.id, INQUIRY)
     
     return render_template('farmer/dashboard.html', 
                          weather=weather,
@@ -114,16 +125,10 @@ def new_crop_issue():
         if 'crop_image' in request.files:
             file = request.files['crop_image']
             if file and file.filename != '' and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{current_user.id}_{timestamp}_{filename}"
-                
-                upload_folder = Path(current_app.config['CROP_IMAGES_FOLDER'])
-                upload_folder.mkdir(parents=True, exist_ok=True)
-                
-                file_path = upload_folder / filename
-                file.save(str(file_path))
-                image_path = f"uploads/crops/{filename}"
+                try:
+                    image_path = image_pipeline.ingest(file, 'crops')
+                except ValueError as e:
+                    flash(str(e), 'danger')
         
         # Validation
         if not all([crop_type, issue_description]):
@@ -137,15 +142,14 @@ def new_crop_issue():
             crop_variety=crop_variety,
             planting_date=datetime.strptime(planting_date, '%Y-%m-%d').date() if planting_date else None,
             issue_description=issue_description,
-            symptoms=json.dumps(symptoms),
+            symptoms=symptoms,
             image_path=image_path,
             location=location or current_user.farm_location
         )
         
         # AI Disease Prediction
         if image_path or symptoms:
-            ai_prediction = predict_disease(image_path, symptoms, crop_type)
-            crop_issue.ai_prediction = ai_prediction
+            crop_issue.ai_prediction = predict_disease(image_path, symptoms, crop_type)
         
         try:
             db.session.add(crop_issue)
@@ -292,13 +296,6 @@ def view_disease_prediction(issue_id):
         flash('Access denied.', 'danger')
         return redirect(url_for('farmer.dashboard'))
     
-    prediction_data = None
-    if issue.ai_prediction:
-        try:
-            prediction_data = json.loads(issue.ai_prediction)
-        except:
-            pass
-    
     # Get diagnosis report if available
     diagnosis_report = DiagnosisReport.query.filter_by(crop_issue_id=issue_id).first()
     
@@ -313,7 +310,7 @@ def view_disease_prediction(issue_id):
     
     return render_template('farmer/view_disease_prediction.html',
                          issue=issue,
-                         prediction=prediction_data,
+                         prediction=issue.ai_prediction,
                          diagnosis_report=diagnosis_report,
                          existing_rating=existing_rating)
 
@@ -429,6 +426,7 @@ def new_product_request():
         
         product_request = ProductRequest(
             farmer_id=current_user.id,
+            product_id=match_product_id(product_name, product_type),
             product_name=product_name,
             product_type=product_type,
             quantity=quantity_int,
@@ -473,41 +471,20 @@ def chat_list():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.farmer_login'))
     
-    # Get unique experts that farmer has chatted with with unread counts
-    experts_with_unread = db.session.query(
-        User,
-        func.count(ChatMessage.id).label('unread_count')
-    ).join(ChatMessage, User.id == ChatMessage.expert_id)\
-     .filter(ChatMessage.farmer_id == current_user.id)\
-     .filter(ChatMessage.sender_role == 'expert', ChatMessage.is_read == False)\
-     .group_by(User.id).all()
-    
-    # Get all experts farmer has chatted with
-    experts = db.session.query(User).join(ChatMessage, User.id == ChatMessage.expert_id)\
-        .filter(ChatMessage.farmer_id == current_user.id)\
-        .distinct().all()
-    
-    # Create unread count dict
-    unread_counts = {expert.id: count for expert, count in experts_with_unread}
-    for expert in experts:
-        if expert.id not in unread_counts:
-            unread_counts[expert.id] = 0
-    
-    # Also get all available experts
-    all_experts = User.query.filter_by(role='expert', is_active=True).all()
-    
-    # Get total unread count
-    total_unread = ChatMessage.query.filter(
-        ChatMessage.farmer_id == current_user.id,
-        ChatMessage.sender_role == 'expert',
-        ChatMessage.is_read == False
-    ).count()
+    # Conversations with last message and unread count (one query, most recent first)
+    page = request.args.get('page', 1, type=int)
+    conversations = load_conversations(current_user.id, 'farmer', page)
+    
+    # Experts to start a new chat with: a bounded list, searchable by name or expertise
+    expert_search = request.args.get('expert_q', '').strip()
+    experts, more_experts = load_experts(expert_search)
     
     return render_template('farmer/chat_list.html',
-                         experts=experts,
-                         all_experts=all_experts,
-                         unread_counts=unread_counts,
-                         total_unread=total_unread)
+                         conversations=conversations,
+                         all_experts=experts,
+                         more_experts=more_experts,
+                         expert_search=expert_search,
+                         total_unread=conversations.total_unread)
 
 @farmer_bp.route('/chat/<int:expert_id>', methods=['GET', 'POST'])
 @login_required
@@ -527,17 +504,11 @@ def chat_with_expert(expert_id):
         image = request.files.get('image')
         image_path = None
         
-        if image:
-            from werkzeug.utils import secure_filename
-            import os
-            
-            # Ensure upload directory exists
-            upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'chat_images')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            filename = secure_filename(f"chat_{int(datetime.utcnow().timestamp())}_{image.filename}")
-            image.save(os.path.join(upload_dir, filename))
-            image_path = f"uploads/chat_images/{filename}"
+        if image and image.filename:
+            try:
+                image_path = image_pipeline.ingest(image, 'chat_images')
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
 
         if message or image_path:
             chat_message = ChatMessage(
@@ -569,16 +540,11 @@ def chat_with_expert(expert_id):
                 print(f"Error sending message: {str(e)}")
                 return jsonify({'status': 'error', 'message': str(e)}), 500
                 
-    # Get chat messages
-    messages = ChatMessage.query.filter(
-        ChatMessage.farmer_id == current_user.id,
-        ChatMessage.expert_id == expert_id
-    ).order_by(ChatMessage.created_at.asc()).all()
-    
-    # Mark messages as read
-    for msg in messages:
-        if msg.sender_role == 'expert' and not msg.is_read:
-            msg.is_read = True
+    # Latest page of the conversation; older messages load on scroll
+    messages, has_more = load_messages_page(current_user.id, expert_id)
+    
+    # Mark messages as read up to the newest one shown
+    mark_thread_read(current_user.id, expert_id, 'farmer', messages[-1].id if messages else 0)
     db.session.commit()
     
     # Get farmer's crop issues for linking
@@ -587,9 +553,26 @@ def chat_with_expert(expert_id):
     return render_template('farmer/chat.html',
                          expert=expert,
                          messages=messages,
+                         has_more=has_more,
                          crop_issues=crop_issues,
                          last_message_id=messages[-1].id if messages else 0)
 
+@farmer_bp.route('/chat/<int:expert_id>/history')
+@login_required
+def chat_history(expert_id):
+    """Older messages for infinite scroll (keyset pagination on message id)"""
+    if not current_user.is_farmer():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    before_id = request.args.get('before_id', type=int)
+    limit = request.args.get('limit', CHAT_PAGE_SIZE, type=int)
+    messages, has_more = load_messages_page(current_user.id, expert_id, before_id, limit)
+    
+    return jsonify({
+        'messages': [serialize_message(msg) for msg in messages],
+        'has_more': has_more
+    })
+
 @farmer_bp.route('/chat/<int:expert_id>/poll')
 @login_required
 def chat_poll(expert_id):
@@ -613,23 +596,11 @@ def chat_poll(expert_id):
         
         if new_messages:
             # Mark expert messages as read
-            for msg in new_messages:
-                if msg.sender_role == 'expert' and not msg.is_read:
-                    msg.is_read = True
+            mark_thread_read(current_user.id, expert_id, 'farmer', new_messages[-1].id)
             db.session.commit()
             
-            messages_data = []
-            for msg in new_messages:
-                messages_data.append({
-                    'id': msg.id,
-                    'message': msg.message,
-                    'sender_role': msg.sender_role,
-                    'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    'time_display': msg.created_at.strftime('%Y-%m-%d %H:%M')
-                })
-            
             return jsonify({
-                'new_messages': messages_data,
+                'new_messages': [serialize_message(msg) for msg in new_messages],
                 'last_message_id': new_messages[-1].id
             })
         
@@ -645,11 +616,7 @@ def chat_unread_count():
     if not current_user.is_farmer():
         return jsonify({'error': 'Access denied'}), 403
     
-    unread_count = ChatMessage.query.filter(
-        ChatMessage.farmer_id == current_user.id,
-        ChatMessage.sender_role == 'expert',
-        ChatMessage.is_read == False
-    ).count()
+    unread_count = unread_total(current_user.id)
     
     return jsonify({'unread_count': unread_count})
 
@@ -744,81 +711,32 @@ def marketplace_inquiries():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.farmer_login'))
     
-    # Get sort parameter
+    # Get sort and page parameters
     sort_by = request.args.get('sort', 'latest')  # latest, oldest
+    page = request.args.get('page', 1, type=int)
     
-    # Get all inquiries (ChatMessages with sender_role='public')
-    query = ChatMessage.query.filter_by(
-        farmer_id=current_user.id,
-        sender_role='public'
-    )
+    # Served by ix_marketplace_inquiries_farmer_created
+    query = MarketplaceInquiry.query.filter_by(farmer_id=current_user.id)\
+                                    .options(db.joinedload(MarketplaceInquiry.product))
     
     # Apply sorting
     if sort_by == 'oldest':
-        query = query.order_by(ChatMessage.created_at.asc())
+        query = query.order_by(MarketplaceInquiry.created_at.asc(), MarketplaceInquiry.id.asc())
     else:  # default: latest first
-        query = query.order_by(ChatMessage.created_at.desc())
+        query = query.order_by(MarketplaceInquiry.created_at.desc(), MarketplaceInquiry.id.desc())
     
-    inquiries_list = query.all()
+    inquiries = query.paginate(page=page, per_page=INQUIRIES_PER_PAGE, error_out=False)
     
     # Get all orders
     from app.models import MarketplaceOrder
     orders = MarketplaceOrder.query.filter_by(farmer_id=current_user.id)\
                                   .order_by(MarketplaceOrder.created_at.desc()).all()
     
-    # Parse inquiry data from message format: "[Public Inquiry] {name} ({phone}): {message}"
-    parsed_inquiries = []
-    for inquiry in inquiries_list:
-        # ... (same parsing logic as before)
-        message_text = inquiry.message
-        if message_text.startswith("[Public Inquiry]"):
-            try:
-                parts = message_text.replace("[Public Inquiry]", "").strip()
-                if "(" in parts and "):" in parts:
-                    name_part = parts.split("(")[0].strip()
-                    phone_part = parts.split("(")[1].split(")")[0].strip()
-                    message_part = parts.split("):", 1)[1].strip() if "):" in parts else ""
-                else:
-                    name_part = "Guest"
-                    phone_part = "N/A"
-                    message_part = parts
-                
-                parsed_inquiries.append({
-                    'id': inquiry.id,
-                    'name': name_part,
-                    'phone': phone_part,
-                    'message': message_part,
-                    'created_at': inquiry.created_at,
-                    'is_read': inquiry.is_read
-                })
-            except:
-                parsed_inquiries.append({
-                    'id': inquiry.id,
-                    'name': 'Guest',
-                    'phone': 'N/A',
-                    'message': message_text,
-                    'created_at': inquiry.created_at,
-                    'is_read': inquiry.is_read
-                })
-        else:
-            parsed_inquiries.append({
-                'id': inquiry.id,
-                'name': 'Guest',
-                'phone': 'N/A',
-                'message': message_text,
-                'created_at': inquiry.created_at,
-                'is_read': inquiry.is_read
-            })
-    
     # Get unread count
-    unread_count = ChatMessage.query.filter_by(
-        farmer_id=current_user.id,
-        sender_role='public',
-        is_read=False
-    ).count()
+    unread_count = unread_total(current_user.id, INQUIRY)
     
     return render_template('farmer/marketplace_inquiries.html',
-                         inquiries=parsed_inquiries,
+                         inquiries=inquiries,
                          orders=orders,
                          sort_by=sort_by,
                          unread_count=unread_count)
@@ -830,9 +748,9 @@ def mark_inquiry_read(inquiry_id):
     if not current_user.is_farmer():
         return jsonify({'status': 'error', 'message': 'Access denied'}), 403
     
-    inquiry = ChatMessage.query.get_or_404(inquiry_id)
+    inquiry = MarketplaceInquiry.query.get_or_404(inquiry_id)
     
-    if inquiry.farmer_id != current_user.id or inquiry.sender_role != 'public':
+    if inquiry.farmer_id != current_user.id:
         return jsonify({'status': 'error', 'message': 'Access denied'}), 403
     
     try:
@@ -843,6 +761,25 @@ def mark_inquiry_read(inquiry_id):
         db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@farmer_bp.route('/marketplace-inquiries/mark-all-read', methods=['POST'])
+@login_required
+def mark_all_inquiries_read():
+    """Mark every unread inquiry as read with a single UPDATE"""
+    if not current_user.is_farmer():
+        return jsonify({'status': 'error', 'message': 'Access denied'}), 403
+    
+    try:
+        updated = MarketplaceInquiry.query.filter(
+            MarketplaceInquiry.farmer_id == current_user.id,
+            MarketplaceInquiry.is_read == False
+        ).update({'is_read': True}, synchronize_session=False)
+        set_unread_counter(current_user.id, INQUIRY, 0, 0)
+        db.session.commit()
+        return jsonify({'status': 'success', 'message': f'{updated} inquiries marked as read'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 # ==================== HISTORY ====================
 
 @farmer_bp.route('/history/issues')
@@ -878,52 +815,7 @@ def report_disease_history_pdf():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.farmer_login'))
     
-    issues = CropIssue.query.filter_by(farmer_id=current_user.id)\
-        .order_by(CropIssue.created_at.desc()).all()
-    
-    data = []
-    for issue in issues:
-        # Parse AI prediction if available
-        disease_name = 'N/A'
-        confidence = 'N/A'
-        if issue.ai_prediction:
-            try:
-                import json
-                pred = json.loads(issue.ai_prediction)
-                disease_name = pred.get('disease_name', 'N/A')
-                confidence = f"{pred.get('confidence', 0) * 100:.1f}%" if pred.get('confidence') else 'N/A'
-            except:
-                pass
-        
-        # Parse symptoms
-        symptoms = 'N/A'
-        if issue.symptoms:
-            try:
-                import json
-                symptoms_list = json.loads(issue.symptoms)
-                symptoms = ', '.join(symptoms_list[:3]) + ('...' if len(symptoms_list) > 3 else '')
-            except:
-                symptoms = issue.symptoms[:50]
-        
-        data.append({
-            'ID': issue.id,
-            'Crop Type': issue.crop_type,
-            'Crop Variety': issue.crop_variety or 'N/A',
-            'Disease Predicted': disease_name,
-            'Confidence': confidence,
-            'Symptoms': symptoms,
-            'Status': issue.status.title(),
-            'Location': issue.location or 'N/A',
-            'Date': issue.created_at.strftime('%Y-%m-%d'),
-            'Expert Response': 'Yes' if issue.expert_response else 'No'
-        })
-    
-    summary = {
-        'Total Issues': len(issues),
-        'Pending': len([i for i in issues if i.status == 'pending']),
-        'Reviewed': len([i for i in issues if i.status == 'reviewed']),
-        'Resolved': len([i for i in issues if i.status == 'resolved'])
-    }
+    data, summary = disease_history_report(list(issue_rows(current_user.id)))
     
     pdf_buffer = generate_pdf_report(
         data, 
@@ -947,51 +839,9 @@ def report_disease_history_csv():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.farmer_login'))
     
-    issues = CropIssue.query.filter_by(farmer_id=current_user.id)\
-        .order_by(CropIssue.created_at.desc()).all()
-    
-    data = []
-    for issue in issues:
-        disease_name = 'N/A'
-        confidence = 'N/A'
-        if issue.ai_prediction:
-            try:
-                import json
-                pred = json.loads(issue.ai_prediction)
-                disease_name = pred.get('disease_name', 'N/A')
-                confidence = f"{pred.get('confidence', 0) * 100:.1f}%" if pred.get('confidence') else 'N/A'
-            except:
-                pass
-        
-        symptoms = 'N/A'
-        if issue.symptoms:
-            try:
-                import json
-                symptoms_list = json.loads(issue.symptoms)
-                symptoms = ', '.join(symptoms_list)
-            except:
-                symptoms = issue.symptoms[:100]
-        
-        data.append({
-            'ID': issue.id,
-            'Crop Type': issue.crop_type,
-            'Crop Variety': issue.crop_variety or 'N/A',
-            'Disease Predicted': disease_name,
-            'Confidence': confidence,
-            'Symptoms': symptoms,
-            'Status': issue.status.title(),
-            'Location': issue.location or 'N/A',
-            'Date': issue.created_at.strftime('%Y-%m-%d'),
-            'Expert Response': 'Yes' if issue.expert_response else 'No'
-        })
-    
-    csv_data = generate_csv_report(data, 'disease_history')
-    
-    response = make_response(csv_data)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=disease_history_report_{datetime.now().strftime("%Y%m%d")}.csv'
-    
-    return response
+    return stream_csv_report(issue_rows(current_user.id),
+                             f'disease_history_report_{datetime.now().strftime("%Y%m%d")}.csv',
+                             row_fn=disease_history_record)
 
 @farmer_bp.route('/reports/issues/pdf')
 @login_required
@@ -1012,34 +862,7 @@ def report_yield_predictions_pdf():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.farmer_login'))
     
-    predictions = YieldPrediction.query.filter_by(farmer_id=current_user.id)\
-        .order_by(YieldPrediction.created_at.desc()).all()
-    
-    data = []
-    for pred in predictions:
-        total_yield = (pred.predicted_yield * pred.farm_size) if pred.predicted_yield else 0
-        data.append({
-            'ID': pred.id,
-            'Crop Type': pred.crop_type,
-            'Crop Variety': pred.crop_variety or 'N/A',
-            'Soil Type': pred.soil_type,
-            'Irrigation': pred.irrigation_type,
-            'Fertilizer': pred.fertilizer_type,
-            'Yield/Acre (tons)': f"{pred.predicted_yield:.2f}" if pred.predicted_yield else 'N/A',
-            'Farm Size (acres)': f"{pred.farm_size:.2f}",
-            'Total Yield (tons)': f"{total_yield:.2f}" if pred.predicted_yield else 'N/A',
-            'Confidence': f"{pred.confidence_score * 100:.1f}%" if pred.confidence_score else 'N/A',
-            'Temperature (°C)': f"{pred.temperature:.1f}" if pred.temperature else 'N/A',
-            'Rainfall (mm)': f"{pred.rainfall:.1f}" if pred.rainfall else 'N/A',
-            'Location': pred.location,
-            'Date': pred.created_at.strftime('%Y-%m-%d')
-        })
-    
-    summary = {
-        'Total Predictions': len(predictions),
-        'Average Yield/Acre': f"{sum(p.predicted_yield for p in predictions if p.predicted_yield) / len([p for p in predictions if p.predicted_yield]):.2f} tons" if predictions else 'N/A',
-        'Total Farm Area': f"{sum(p.farm_size for p in predictions):.2f} acres"
-    }
+    data, summary = yield_predictions_report(list(prediction_rows(current_user.id)))
     
     pdf_buffer = generate_pdf_report(
         data, 
@@ -1063,36 +886,9 @@ def report_yield_predictions_csv():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.farmer_login'))
     
-    predictions = YieldPrediction.query.filter_by(farmer_id=current_user.id)\
-        .order_by(YieldPrediction.created_at.desc()).all()
-    
-    data = []
-    for pred in predictions:
-        total_yield = (pred.predicted_yield * pred.farm_size) if pred.predicted_yield else 0
-        data.append({
-            'ID': pred.id,
-            'Crop Type': pred.crop_type,
-            'Crop Variety': pred.crop_variety or 'N/A',
-            'Soil Type': pred.soil_type,
-            'Irrigation': pred.irrigation_type,
-            'Fertilizer': pred.fertilizer_type,
-            'Yield/Acre (tons)': f"{pred.predicted_yield:.2f}" if pred.predicted_yield else 'N/A',
-            'Farm Size (acres)': f"{pred.farm_size:.2f}",
-            'Total Yield (tons)': f"{total_yield:.2f}" if pred.predicted_yield else 'N/A',
-            'Confidence': f"{pred.confidence_score * 100:.1f}%" if pred.confidence_score else 'N/A',
-            'Temperature (°C)': f"{pred.temperature:.1f}" if pred.temperature else 'N/A',
-            'Rainfall (mm)': f"{pred.rainfall:.1f}" if pred.rainfall else 'N/A',
-            'Location': pred.location,
-            'Date': pred.created_at.strftime('%Y-%m-%d')
-        })
-    
-    csv_data = generate_csv_report(data, 'yield_predictions')
-    
-    response = make_response(csv_data)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=yield_predictions_report_{datetime.now().strftime("%Y%m%d")}.csv'
-    
-    return response
+    return stream_csv_report(prediction_rows(current_user.id),
+                             f'yield_predictions_report_{datetime.now().strftime("%Y%m%d")}.csv',
+                             row_fn=yield_prediction_record)
 
 @farmer_bp.route('/reports/predictions/pdf')
 @login_required
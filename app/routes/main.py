@@ -2,10 +2,12 @@
 from flask import Blueprint, redirect, url_for, render_template, jsonify
 from app.models import db, User, Product
 from flask_login import current_user
+from app.utils.http_cache import public_page
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
+@public_page()
 def index():
     """Home page - Central Portal Landing"""
     # If user is already logged in, redirect to their dashboard
@@ -21,6 +23,7 @@ def index():
 
 
 @main_bp.route('/marketplace')
+@public_page(Product.__tablename__)
 def marketplace():
     """Public Public Marketplace/Notice Page (Krishi Bhavan)"""
     # Get all active products with stock > 0
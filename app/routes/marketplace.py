@@ -4,12 +4,16 @@
 
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import login_required, current_user
-from app.models import db, FarmerProduct, User, ChatMessage, MarketplaceOrder
+from app.models import db, FarmerProduct, User, MarketplaceOrder, MarketplaceInquiry
 import os
 from datetime import datetime
 from flask import current_app
 from werkzeug.utils import secure_filename
-import uuid
+from app.utils.images import image_pipeline
+from app.utils.search import search_products
+from app.utils.marketplace import LISTING_PAGE_SIZE, cached_category_facets, load_listing_page
+from app.utils.http_cache import public_page
+from app.utils.reservations import place_order, confirm_payment, release_expired_reservations
 
 marketplace_bp = Blueprint('marketplace', __name__, url_prefix='/marketplace')
 
@@ -19,37 +23,45 @@ marketplace_bp = Blueprint('marketplace', __name__, url_prefix='/marketplace')
 # ============================================================================
 
 @marketplace_bp.route('/')
+@public_page(FarmerProduct.__tablename__)
 def index():
     """Public marketplace listing page - View all available products"""
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     category = request.args.get('category', '', type=str)
+    after = request.args.get('after')
+    before = request.args.get('before')
     
     query = FarmerProduct.query.filter_by(is_available=True)
     
-    # Search by product name
-    if search:
-        query = query.filter(FarmerProduct.product_name.ilike(f'%{search}%'))
-    
     # Filter by category
     if category:
         query = query.filter_by(category=category)
     
-    # Order by newest first
-    products = query.order_by(FarmerProduct.created_at.desc()).paginate(page=page, per_page=12)
+    # Categories with available counts for the dropdown (cached until a product changes)
+    facets = cached_category_facets()
+    corrected_search = None
     
-    # Get all categories for filter dropdown
-    categories = db.session.query(FarmerProduct.category).distinct().all()
-    categories = [cat[0] for cat in categories if cat[0]]
+    if search:
+        # Full-text search over name, category, location and description (best match first)
+        query, corrected_search = search_products(query, search)
+        products = query.paginate(page=page, per_page=LISTING_PAGE_SIZE)
+    else:
+        # Newest first, keyset paginated; the total comes from the facet counts
+        total = facets.get(category, 0) if category else sum(facets.values())
+        products = load_listing_page(query, after=after, before=before, total=total)
     
     return render_template('marketplace/index.html', 
                          products=products,
-                         categories=categories,
+                         categories=list(facets),
+                         category_counts=facets,
                          search=search,
+                         corrected_search=corrected_search,
                          selected_category=category)
 
 
 @marketplace_bp.route('/product/<int:product_id>')
+@public_page(FarmerProduct.__tablename__, User.__tablename__)
 def product_detail(product_id):
     """Product detail page with farmer contact info"""
     product = FarmerProduct.query.get_or_404(product_id)
@@ -73,10 +85,9 @@ def product_detail(product_id):
 def contact_farmer():
     """
     Public users can contact farmer for product inquiry
-    Creates a chat message without requiring login
+    Creates a marketplace inquiry without requiring login
     """
     product_id = request.form.get('product_id')
-    farmer_id = request.form.get('farmer_id')
     message = request.form.get('message', '').strip()
     visitor_name = request.form.get('visitor_name', 'Guest').strip()
     visitor_phone = request.form.get('visitor_phone', '').strip()
@@ -91,19 +102,16 @@ def contact_farmer():
     product = FarmerProduct.query.get_or_404(product_id)
     
     try:
-        # Create a message (as a public inquiry)
-        # We store visitor info in the message content or create a special record
-        inquiry_message = f"[Public Inquiry] {visitor_name} ({visitor_phone}): {message}"
-        
-        chat_message = ChatMessage(
-            farmer_id=farmer_id,
-            expert_id=None,  # Not an expert conversation
-            message=inquiry_message,
-            sender_role='public',  # New role for public marketplace inquiries
+        inquiry = MarketplaceInquiry(
+            product_id=product.id,
+            farmer_id=product.farmer_id,
+            visitor_name=visitor_name or 'Guest',
+            visitor_phone=visitor_phone,
+            message=message,
             is_read=False
         )
         
-        db.session.add(chat_message)
+        db.session.add(inquiry)
         db.session.commit()
         
         return jsonify({
@@ -120,6 +128,8 @@ def contact_farmer():
 @marketplace_bp.route('/checkout/<int:product_id>', methods=['GET', 'POST'])
 def checkout(product_id):
     """Checkout page for a product"""
+    # Give back stock held by abandoned checkouts before checking availability
+    release_expired_reservations(product_id=product_id)
     product = FarmerProduct.query.get_or_404(product_id)
     
     if not product.is_available or product.quantity <= 0:
@@ -135,32 +145,18 @@ def checkout(product_id):
             city = request.form.get('city')
             qty = request.form.get('quantity', type=float)
             
-            if not all([name, phone, address, postal_code, qty]):
+            if not all([name, phone, address, postal_code, qty]) or qty <= 0:
                 flash('Please fill all required fields.', 'danger')
                 return render_template('marketplace/checkout.html', product=product)
             
-            if qty > product.quantity:
+            # Reserve the stock and create the order in one transaction
+            order = place_order(product, qty, buyer_name=name, buyer_phone=phone,
+                                shipping_address=address, postal_code=postal_code, city=city)
+            if order is None:
+                db.session.rollback()
                 flash(f'Only {product.quantity} {product.unit} available.', 'danger')
                 return render_template('marketplace/checkout.html', product=product)
             
-            total_price = product.price_per_unit * qty
-            
-            # Create Order
-            order = MarketplaceOrder(
-                product_id=product.id,
-                farmer_id=product.farmer_id,
-                buyer_name=name,
-                buyer_phone=phone,
-                shipping_address=address,
-                postal_code=postal_code,
-                city=city,
-                quantity=qty,
-                total_price=total_price,
-                payment_status='pending',
-                order_status='pending'
-            )
-            
-            db.session.add(order)
             db.session.commit()
             
             return redirect(url_for('marketplace.payment', order_id=order.id))
@@ -185,16 +181,12 @@ def payment(order_id):
     if request.method == 'POST':
         # Simulate payment success
         try:
-            # Update order
-            order.payment_status = 'paid'
-            order.transaction_id = f"PAY-{uuid.uuid4().hex[:8].upper()}"
-            
-            # Update product stock
-            product = FarmerProduct.query.get(order.product_id)
-            if product.quantity >= order.quantity:
-                product.quantity -= order.quantity
-                if product.quantity <= 0:
-                    product.is_available = False
+            # Stock was reserved at checkout; an expired order is paid only if it can be re-reserved.
+            # An order paid meanwhile by a concurrent submit counts as paid.
+            if not confirm_payment(order):
+                db.session.rollback()
+                flash('Your reservation expired and this product is no longer available in that quantity.', 'danger')
+                return redirect(url_for('marketplace.product_detail', product_id=order.product_id))
             
             db.session.commit()
             
@@ -260,14 +252,10 @@ def add_product():
         if 'product_image' in request.files:
             file = request.files['product_image']
             if file and file.filename != '':
-                if file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-                    upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'farmer_products')
-                    os.makedirs(upload_dir, exist_ok=True)
-                    filename = secure_filename(f"product_{current_user.id}_{int(datetime.utcnow().timestamp())}_{file.filename}")
-                    file.save(os.path.join(upload_dir, filename))
-                    image_path = f"uploads/farmer_products/{filename}"
-                else:
-                    flash('Only image files are allowed.', 'danger')
+                try:
+                    image_path = image_pipeline.ingest(file, 'farmer_products')
+                except ValueError as e:
+                    flash(str(e), 'danger')
                     return redirect(url_for('marketplace.add_product'))
         
         try:
@@ -331,14 +319,10 @@ def edit_product(product_id):
         if 'product_image' in request.files:
             file = request.files['product_image']
             if file and file.filename != '':
-                if file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-                    upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'farmer_products')
-                    os.makedirs(upload_dir, exist_ok=True)
-                    filename = secure_filename(f"product_{current_user.id}_{int(datetime.utcnow().timestamp())}_{file.filename}")
-                    file.save(os.path.join(upload_dir, filename))
-                    product.product_image_path = f"uploads/farmer_products/{filename}"
-                else:
-                    flash('Only image files are allowed.', 'danger')
+                try:
+                    product.product_image_path = image_pipeline.ingest(file, 'farmer_products')
+                except ValueError as e:
+                    flash(str(e), 'danger')
         
         try:
             product.updated_at = datetime.utcnow()
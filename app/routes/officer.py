@@ -1,15 +1,20 @@
 # Krishi Bhavan Officer Module Routes
-from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, send_file, make_response
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, send_file, make_response, jsonify
 from flask_login import login_required, current_user
-from app.utils.reports import generate_pdf_report, generate_csv_report
+from app.utils.reports import generate_pdf_report, stream_csv_report
+from app.utils.stock import products_with_last_change, record_stock_change, stock_as_of, stock_valuation, apply_stock_batch
+from app.utils.product_requests import apply_request_decisions, process_pending_requests
+from app.utils.batches import read_batch
 from werkzeug.utils import secure_filename
 from app.models import (
-    db, User, ProductRequest, Notice, Product, ProductStockHistory
+    db, User, ProductRequest, Notice, Product, ProductStockHistory, ProductStockSnapshot
 )
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time, timedelta
 from sqlalchemy import func, desc, and_, or_
+from sqlalchemy.orm import joinedload
 from pathlib import Path
 import os
+import uuid
 
 officer_bp = Blueprint('officer', __name__)
 
@@ -18,6 +23,26 @@ ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 def allowed_image_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
 
+def batch_response(applied, results, endpoint):
+    """Per-row results as JSON for API clients; a flash summary and redirect for form uploads"""
+    errors = [r for r in results if r['status'] == 'error']
+    if request.is_json:
+        return jsonify({'applied': applied, 'results': results}), 400 if errors else 200
+    if errors:
+        details = '; '.join(f"row {r['row']}: {r['message']}" for r in errors[:5])
+        more = f' (and {len(errors) - 5} more)' if len(errors) > 5 else ''
+        flash(f'Nothing was applied. {details}{more}', 'danger')
+    else:
+        skipped = len(results) - applied
+        flash(f'{applied} row(s) applied' + (f', {skipped} already applied.' if skipped else '.'), 'success')
+    return redirect(url_for(endpoint))
+
+def batch_error(message, endpoint):
+    if request.is_json:
+        return jsonify({'error': message}), 400
+    flash(message, 'danger')
+    return redirect(url_for(endpoint))
+
 # ==================== DASHBOARD ====================
 
 @officer_bp.route('/dashboard')
@@ -74,7 +99,8 @@ def products():
     
     products_list = Product.query.order_by(Product.created_at.desc()).all()
     
-    return render_template('officer/products.html', products=products_list)
+    # Stock forms carry '<form_key>-<product id>' so a resubmitted form is applied once
+    return render_template('officer/products.html', products=products_list, form_key=uuid.uuid4().hex)
 
 @officer_bp.route('/products/add', methods=['GET', 'POST'])
 @login_required
@@ -125,7 +151,7 @@ def add_product():
             product_type=product_type,
             description=description,
             image_path=image_path,
-            stock_quantity=stock_qty,
+            stock_quantity=0,
             unit=unit,
             is_free=is_free,
             category=category,
@@ -134,21 +160,12 @@ def add_product():
             created_by=current_user.id
         )
         
-        # Create stock history entry
-        stock_history = ProductStockHistory(
-            product_id=product.id,
-            quantity_change=stock_qty,
-            previous_stock=0,
-            new_stock=stock_qty,
-            reason='Initial stock',
-            changed_by=current_user.id
-        )
-        
         try:
             db.session.add(product)
             db.session.flush()  # Get product ID
-            stock_history.product_id = product.id
-            db.session.add(stock_history)
+            # Initial stock goes through the ledger like any other change
+            if record_stock_change(product.id, stock_qty, 'Initial stock', current_user.id) is None:
+                raise ValueError('Stock cannot be negative')
             db.session.commit()
             flash('Product added successfully!', 'success')
             return redirect(url_for('officer.products'))
@@ -176,7 +193,11 @@ def edit_product(product_id):
         product.name = request.form.get('name')
         product.product_type = request.form.get('product_type')
         product.description = request.form.get('description')
-        product.stock_quantity = int(request.form.get('stock_quantity'))
+        # The correction is relative to the stock the form showed, so changes made
+        # by others since the form was opened are kept (applied as an increment)
+        stock_base = request.form.get('stock_base', type=int)
+        stock_quantity = request.form.get('stock_quantity', type=int)
+        stock_correction = stock_quantity - stock_base if None not in (stock_base, stock_quantity) else 0
         product.unit = request.form.get('unit')
         product.is_free = request.form.get('is_free') == 'on'
         product.category = request.form.get('category')
@@ -206,6 +227,10 @@ def edit_product(product_id):
                 product.image_path = f"uploads/products/{filename}"
         
         try:
+            # A new stock figure is recorded as a correction in the ledger
+            if stock_correction and record_stock_change(product.id, stock_correction, 'Manual correction',
+                                                        current_user.id) is None:
+                raise ValueError('Stock cannot be negative')
             db.session.commit()
             flash('Product updated successfully!', 'success')
             return redirect(url_for('officer.products'))
@@ -230,21 +255,25 @@ def delete_product(product_id):
     
     product = Product.query.get_or_404(product_id)
     
-    # Delete image if exists
-    if product.image_path:
-        image_path = Path(current_app.config['UPLOAD_FOLDER'].parent) / 'app' / 'static' / product.image_path
-        if image_path.exists():
-            image_path.unlink()
-    
     try:
-        # Check if product has any requests
-        has_requests = ProductRequest.query.filter_by(product_name=product.name).count() > 0
+        # Pending requests still need the product; decided ones keep its name and type
+        has_requests = db.session.query(ProductRequest.id).filter_by(
+            product_id=product.id, status='pending'
+        ).first() is not None
         if has_requests:
             flash('Cannot delete product. There are pending requests associated with this product.', 'warning')
             return redirect(url_for('officer.products'))
+        ProductRequest.query.filter_by(product_id=product.id).update({'product_id': None})
+        
+        # Delete image if exists
+        if product.image_path:
+            image_path = Path(current_app.config['UPLOAD_FOLDER'].parent) / 'app' / 'static' / product.image_path
+            if image_path.exists():
+                image_path.unlink()
         
-        # Delete associated stock history first
+        # Delete associated stock history and snapshots first
         ProductStockHistory.query.filter_by(product_id=product.id).delete()
+        ProductStockSnapshot.query.filter_by(product_id=product.id).delete()
         
         db.session.delete(product)
         db.session.commit()
@@ -266,27 +295,15 @@ def update_stock(product_id):
     quantity_change = int(request.form.get('quantity_change'))
     reason = request.form.get('reason', 'Stock adjustment')
     
-    previous_stock = product.stock_quantity
-    new_stock = previous_stock + quantity_change
-    
-    if new_stock < 0:
+    # Applied as one atomic increment; a repeated idempotency key is not applied twice
+    entry = record_stock_change(product.id, quantity_change, reason, current_user.id,
+                                idempotency_key=request.form.get('idempotency_key') or None)
+    if entry is None:
+        db.session.rollback()
         flash('Stock cannot be negative.', 'danger')
         return redirect(url_for('officer.products'))
     
-    product.stock_quantity = new_stock
-    
-    # Create stock history entry
-    stock_history = ProductStockHistory(
-        product_id=product_id,
-        quantity_change=quantity_change,
-        previous_stock=previous_stock,
-        new_stock=new_stock,
-        reason=reason,
-        changed_by=current_user.id
-    )
-    
     try:
-        db.session.add(stock_history)
         db.session.commit()
         flash('Stock updated successfully!', 'success')
     except Exception as e:
@@ -295,6 +312,34 @@ def update_stock(product_id):
     
     return redirect(url_for('officer.products'))
 
+@officer_bp.route('/products/bulk-stock', methods=['POST'])
+@login_required
+def bulk_stock():
+    """Stock import from a CSV upload or JSON list: product_id, quantity_change, reason, idempotency_key"""
+    if not current_user.is_krishi_bhavan_officer():
+        if request.is_json:
+            return jsonify({'error': 'Access denied'}), 403
+        flash('Access denied.', 'danger')
+        return redirect(url_for('auth.krishi_bhavan_officer_login'))
+    
+    try:
+        rows = read_batch(request)
+    except ValueError as e:
+        return batch_error(str(e), 'officer.products')
+    
+    # All rows are validated first, then applied together in one transaction
+    try:
+        applied, results = apply_stock_batch(rows, current_user.id)
+        if applied:
+            db.session.commit()
+        else:
+            db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        return batch_error('An error occurred.', 'officer.products')
+    
+    return batch_response(applied, results, 'officer.products')
+
 # ==================== NOTICES MANAGEMENT ====================
 
 @officer_bp.route('/notices')
@@ -304,16 +349,19 @@ def notices():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.krishi_bhavan_officer_login'))
     
-    notices_list = Notice.query.filter_by(posted_by=current_user.id)\
-        .order_by(Notice.created_at.desc()).all()
-    
-    # Check and update expired notices
+    # Deactivate expired notices in one UPDATE, before loading (committing after
+    # loading would expire every notice and reload them one by one)
     now = datetime.utcnow()
-    for notice in notices_list:
-        if notice.expires_at and notice.expires_at < now and notice.is_active:
-            notice.is_active = False
+    Notice.query.filter(
+        Notice.posted_by == current_user.id,
+        Notice.is_active == True,
+        Notice.expires_at < now
+    ).update({'is_active': False}, synchronize_session=False)
     db.session.commit()
     
+    notices_list = Notice.query.filter_by(posted_by=current_user.id)\
+        .order_by(Notice.created_at.desc()).all()
+    
     return render_template('officer/notices.html', notices=notices_list, current_time=now)
 
 @officer_bp.route('/notices/add', methods=['GET', 'POST'])
@@ -477,7 +525,9 @@ def product_requests():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.krishi_bhavan_officer_login'))
     
-    requests_list = ProductRequest.query.order_by(ProductRequest.created_at.desc()).all()
+    requests_list = ProductRequest.query.options(
+        joinedload(ProductRequest.farmer), joinedload(ProductRequest.product)
+    ).order_by(ProductRequest.created_at.desc()).all()
     
     return render_template('officer/product_requests.html', requests=requests_list)
 
@@ -490,13 +540,13 @@ def approve_request(request_id):
     
     product_request = ProductRequest.query.get_or_404(request_id)
     
-    # Check if product exists and has stock
-    # In a real system, you'd match the product request to actual products
-    # For now, we'll just approve it
-    
-    product_request.status = 'approved'
-    product_request.approved_by = current_user.id
-    product_request.approval_date = datetime.utcnow()
+    # Matched to the inventory product; its quantity is reserved from stock in the same transaction
+    applied, results = apply_request_decisions([{'request_id': product_request.id, 'action': 'approve'}],
+                                               current_user.id)
+    if not applied:
+        db.session.rollback()
+        flash(f"Could not approve the request: {results[0]['message']}", 'warning')
+        return redirect(url_for('officer.product_requests'))
     
     try:
         db.session.commit()
@@ -532,8 +582,69 @@ def reject_request(request_id):
     
     return redirect(url_for('officer.product_requests'))
 
+@officer_bp.route('/product-requests/process', methods=['POST'])
+@login_required
+def process_requests():
+    """Approve pending requests oldest first while their products have stock"""
+    if not current_user.is_krishi_bhavan_officer():
+        flash('Access denied.', 'danger')
+        return redirect(url_for('auth.krishi_bhavan_officer_login'))
+    
+    try:
+        summary = process_pending_requests(current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred.', 'danger')
+        return redirect(url_for('officer.product_requests'))
+    
+    flash(f"{summary['approved']} request(s) approved from stock; {summary['waiting']} waiting for stock, "
+          f"{summary['unmatched']} with no matching product.", 'success' if summary['approved'] else 'info')
+    return redirect(url_for('officer.product_requests'))
+
+@officer_bp.route('/product-requests/bulk', methods=['POST'])
+@login_required
+def bulk_decide_requests():
+    """Approve or reject many requests from a CSV upload or JSON list: request_id, action, rejection_reason"""
+    if not current_user.is_krishi_bhavan_officer():
+        if request.is_json:
+            return jsonify({'error': 'Access denied'}), 403
+        flash('Access denied.', 'danger')
+        return redirect(url_for('auth.krishi_bhavan_officer_login'))
+    
+    try:
+        rows = read_batch(request)
+    except ValueError as e:
+        return batch_error(str(e), 'officer.product_requests')
+    
+    try:
+        applied, results = apply_request_decisions(rows, current_user.id)
+        if applied:
+            db.session.commit()
+        else:
+            db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        return batch_error('An error occurred.', 'officer.product_requests')
+    
+    return batch_response(applied, results, 'officer.product_requests')
+
 # ==================== REPORTS ====================
 
+@officer_bp.route('/reports/farmers/bulk')
+@login_required
+def report_farmers_bulk():
+    """ZIP of disease history and yield PDFs for every farmer in a district"""
+    if not current_user.is_krishi_bhavan_officer():
+        flash('Access denied.', 'danger')
+        return redirect(url_for('auth.krishi_bhavan_officer_login'))
+    
+    from app.utils.bulk_reports import stream_farmer_reports_zip, REPORT_KINDS
+    
+    district = request.args.get('district', '').strip() or None
+    kinds = [k for k in request.args.get('reports', ','.join(REPORT_KINDS)).split(',') if k in REPORT_KINDS]
+    return stream_farmer_reports_zip(district, kinds or REPORT_KINDS)
+
+
 @officer_bp.route('/reports/stock/pdf')
 @login_required
 def report_stock_pdf():
@@ -541,33 +652,44 @@ def report_stock_pdf():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.krishi_bhavan_officer_login'))
     
-    products = Product.query.order_by(Product.product_type, Product.name).all()
+    # ?as_of=YYYY-MM-DD reports stock at the end of that day, from the snapshots and stock ledger
+    as_of = None
+    if request.args.get('as_of'):
+        try:
+            as_of = datetime.combine(datetime.strptime(request.args['as_of'], '%Y-%m-%d').date(), time.max)
+        except ValueError:
+            flash('Invalid date.', 'danger')
+            return redirect(url_for('officer.products'))
+    
+    # Latest stock change per product (up to as_of) joined in, not looked up product by product
+    rows = products_with_last_change(until=as_of).order_by(Product.product_type, Product.name).all()
+    stock = stock_as_of(as_of) if as_of else {product.id: product.stock_quantity for product, _ in rows}
+    rows = [(product, last_change_at) for product, last_change_at in rows if product.id in stock]
     
     data = []
-    for product in products:
-        # Get stock history summary
-        stock_changes = ProductStockHistory.query.filter_by(product_id=product.id)\
-            .order_by(ProductStockHistory.created_at.desc()).limit(5).all()
-        recent_change = stock_changes[0] if stock_changes else None
-        
+    for product, last_change_at in rows:
+        quantity = stock[product.id]
         data.append({
             'ID': product.id,
             'Product Name': product.name,
             'Type': product.product_type,
-            'Stock': f"{product.stock_quantity} {product.unit}",
-            'Status': 'Low Stock' if product.stock_quantity < 10 else 'Adequate',
+            'Stock': f"{quantity} {product.unit}",
+            'Status': 'Low Stock' if quantity < 10 else 'Adequate',
             'Category': product.category or 'N/A',
             'Supplier': product.supplier or 'N/A',
             'Free Product': 'Yes' if product.is_free else 'No',
-            'Last Updated': recent_change.created_at.strftime('%Y-%m-%d') if recent_change else 'N/A'
+            'Last Updated': last_change_at.strftime('%Y-%m-%d') if last_change_at else 'N/A'
         })
     
+    total_value = sum(value for _, _, _, value in stock_valuation(as_of))
     summary = {
-        'Total Products': len(products),
-        'Low Stock Items': len([p for p in products if p.stock_quantity < 10]),
-        'Total Stock Value': 'N/A',  # Can be calculated if price_per_unit is set
-        'Free Products': len([p for p in products if p.is_free])
+        'Total Products': len(rows),
+        'Low Stock Items': len([1 for product, _ in rows if stock[product.id] < 10]),
+        'Total Stock Value': f"Rs. {total_value:,.2f}",
+        'Free Products': len([1 for product, _ in rows if product.is_free])
     }
+    if as_of:
+        summary['Stock As Of'] = as_of.strftime('%Y-%m-%d')
     
     pdf_buffer = generate_pdf_report(
         data,
@@ -591,11 +713,10 @@ def report_stock_csv():
         flash('Access denied.', 'danger')
         return redirect(url_for('auth.krishi_bhavan_officer_login'))
     
-    products = Product.query.order_by(Product.product_type, Product.name).all()
+    products = Product.query.order_by(Product.product_type, Product.name)
     
-    data = []
-    for product in products:
-        data.append({
+    def stock_row(product):
+        return {
             'ID': product.id,
             'Product Name': product.name,
             'Type': product.product_type,
@@ -605,13 +726,7 @@ def report_stock_csv():
             'Supplier': product.supplier or 'N/A',
             'Free Product': 'Yes' if product.is_free else 'No',
             'Created': product.created_at.strftime('%Y-%m-%d') if hasattr(product, 'created_at') else 'N/A'
-        })
-    
-    csv_data = generate_csv_report(data, 'stock')
-    
-    response = make_response(csv_data)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=stock_report_{datetime.now().strftime("%Y%m%d")}.csv'
+        }
     
-    return response
+    return stream_csv_report(products, f'stock_report_{datetime.now().strftime("%Y%m%d")}.csv', row_fn=stock_row)
 
@@ -0,0 +1,63 @@
+# Officer Batch Uploads
+"""
+Reading the batches behind the officer bulk endpoints (stock import, request
+decisions). A batch is either a JSON body -- a list of objects, or
+``{"rows": [...]}`` -- or an uploaded CSV file (form field ``batch_file``)
+with a header row. Either way it becomes a list of dicts with string keys;
+each bulk operation validates its own fields.
+
+Bulk operations report one result per row, in input order::
+
+    {'row': 1, 'status': 'applied' | 'skipped' | 'error', 'message': '...'}
+
+Rows are numbered from 1 (for CSV, the first line after the header).
+"""
+import csv
+import io
+
+# Rows accepted in one batch; larger imports should be split
+MAX_BATCH_ROWS = 5000
+
+
+def read_batch(req):
+    """Rows of the batch in a Flask request. Raises ``ValueError`` with a user-facing message."""
+    if req.is_json:
+        data = req.get_json(silent=True)
+        rows = data.get('rows') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('Expected a JSON list of objects.')
+    else:
+        upload = req.files.get('batch_file')
+        if upload is None or upload.filename == '':
+            raise ValueError('No file selected.')
+        try:
+            text = upload.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError('The file must be UTF-8 CSV.')
+        rows = []
+        for number, row in enumerate(csv.DictReader(io.StringIO(text)), 1):
+            # Cells beyond the header are collected under the key None
+            if any((value or '').strip() for value in row.pop(None, None) or []):
+                raise ValueError(f'Row {number} has more columns than the header.')
+            rows.append({(key or '').strip(): (value or '').strip() for key, value in row.items()})
+    if not rows:
+        raise ValueError('The batch is empty.')
+    if len(rows) > MAX_BATCH_ROWS:
+        raise ValueError(f'At most {MAX_BATCH_ROWS} rows per batch.')
+    return rows
+
+
+def row_result(row, status, message='', **extra):
+    return dict(row=row, status=status, message=message, **extra)
+
+
+def parse_int(value):
+    """``int`` from a JSON number or CSV cell, ``None`` if it is not a whole number."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
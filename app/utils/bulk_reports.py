@@ -0,0 +1,153 @@
+# Bulk Farmer Reports
+"""
+End-of-season disease history and yield prediction PDFs for every farmer in
+a district, packed into one ZIP archive.
+
+The database is read once, in the calling process: the ``report_datasets``
+queries fetch all the selected farmers' issues and predictions as named
+tuples, grouped by farmer. Rendering is CPU-bound ReportLab work, so each
+farmer's rows are handed to a ``ProcessPoolExecutor`` worker (tuples pickle
+cheaply; ORM objects would not) and every finished PDF is written into the
+ZIP as soon as its worker returns. ``iter_farmer_reports_zip`` yields the
+archive in pieces so an HTTP response can start before the last farmer is
+done.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import multiprocessing
+import os
+import zipfile
+from flask import Response, current_app
+from sqlalchemy import select
+from werkzeug.utils import secure_filename
+from app.models import db, User
+from app.utils.report_datasets import issue_rows, prediction_rows, disease_history_report, yield_predictions_report
+from app.utils.reports import generate_pdf_report
+
+REPORT_KINDS = ('disease', 'yield')
+
+
+# ==================== DATA (parent process) ====================
+
+def farmer_selection(district=None):
+    """``SELECT id`` of active farmers, optionally those whose farm location mentions ``district``."""
+    query = select(User.id).where(User.role == 'farmer', User.is_active == True)
+    if district:
+        query = query.where(User.farm_location.ilike(f'%{district}%'))
+    return query
+
+
+def load_farmer_report_rows(district=None):
+    """
+    ``[(farmer_id, full_name, issue_rows, prediction_rows)]`` for the selected
+    farmers, with rows as ``report_datasets`` tuples, newest first. Three
+    queries in total.
+    """
+    farmers = farmer_selection(district)
+    names = db.session.execute(
+        select(User.id, User.full_name).where(User.id.in_(farmers)).order_by(User.full_name, User.id)
+    ).all()
+
+    issues = {farmer_id: [] for farmer_id, _ in names}
+    for row in issue_rows(farmers):
+        issues[row.farmer_id].append(row)
+
+    predictions = {farmer_id: [] for farmer_id, _ in names}
+    for row in prediction_rows(farmers):
+        predictions[row.farmer_id].append(row)
+
+    return [(farmer_id, name, issues[farmer_id], predictions[farmer_id]) for farmer_id, name in names]
+
+
+# ==================== RENDERING (worker processes) ====================
+
+def render_farmer_reports(farmer_id, full_name, issues, predictions, kinds=REPORT_KINDS):
+    """
+    Render one farmer's PDFs. Returns ``[(archive name, pdf bytes)]``; a
+    report with no rows is skipped. Runs in a worker process.
+    """
+    folder = f'{secure_filename(full_name) or "farmer"}_{farmer_id}'
+    subtitle = f"Farmer: {full_name}"
+    files = []
+    if 'disease' in kinds and issues:
+        data, summary = disease_history_report(issues)
+        with generate_pdf_report(data, 'Disease History', 'Bulk Export', subtitle=subtitle, summary=summary) as pdf:
+            files.append((f'{folder}/disease_history.pdf', pdf.read()))
+    if 'yield' in kinds and predictions:
+        data, summary = yield_predictions_report(predictions)
+        with generate_pdf_report(data, 'Yield Predictions', 'Bulk Export', subtitle=subtitle, summary=summary) as pdf:
+            files.append((f'{folder}/yield_predictions.pdf', pdf.read()))
+    return files
+
+
+# ==================== ZIP ====================
+
+class _ChunkWriter:
+    """Write-only stream collecting what ``zipfile`` writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_farmer_reports_zip(farmers, kinds=REPORT_KINDS, workers=None):
+    """
+    Yield a ZIP of the farmers' PDFs (``farmers`` as returned by
+    ``load_farmer_report_rows``), one piece per finished farmer. ``workers``
+    defaults to the CPU count; with one worker (or ``0``) everything is
+    rendered in this process.
+    """
+    output = _ChunkWriter()
+    # PDFs are already compressed; storing them keeps the parent process cheap
+    archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED)
+    farmers = [farmer for farmer in farmers if farmer[2] or farmer[3]]
+
+    def add(files):
+        for name, content in files:
+            archive.writestr(name, content)
+        return output.drain()
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(farmers) <= 1:
+        for farmer in farmers:
+            yield add(render_farmer_reports(*farmer, kinds=kinds))
+    elif farmers:
+        # spawn: never fork a process that holds DB connections and worker threads
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(render_farmer_reports, *farmer, kinds=kinds) for farmer in farmers]
+            for future in as_completed(futures):
+                yield add(future.result())
+
+    archive.writestr('README.txt', f"Farmer reports generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                                   f"{len(farmers)} farmers\n")
+    archive.close()
+    yield output.drain()
+
+
+def stream_farmer_reports_zip(district=None, kinds=REPORT_KINDS):
+    """
+    Streaming ZIP download of the district's farmer reports. The rows are
+    read before the response starts; rendering uses ``BULK_REPORT_PROCESSES``
+    worker processes.
+    """
+    farmers = load_farmer_report_rows(district)
+    workers = current_app.config.get('BULK_REPORT_PROCESSES')
+    label = secure_filename(district or '') or 'all'
+    response = Response(iter_farmer_reports_zip(farmers, kinds, workers), mimetype='application/zip')
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename=farmer_reports_{label}_{datetime.now().strftime("%Y%m%d")}.zip'
+    return response
@@ -0,0 +1,247 @@
+# Shared Statistics Cache
+"""
+TTL cache for statistics that are identical for every user (e.g. the global
+issue counts on the expert dashboard).
+
+Entries are tagged with the tables they were computed from. Committing a
+change to a watched table bumps that tag's version, which invalidates every
+entry built from it. Two backends are available:
+
+* ``memory`` (default) - per-process dictionary.
+* ``sqlite`` - a small SQLite file shared by every worker on the host, so
+  gunicorn workers reuse one another's results and invalidations.
+"""
+from collections import defaultdict
+from pathlib import Path
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+from sqlalchemy import event
+from app.models import db
+
+
+class MemoryCacheBackend:
+    """Process-local storage."""
+
+    def __init__(self):
+        self._entries = {}
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+        # Counters restart at 0 with the process; the epoch tells the two lifetimes apart
+        self.epoch = secrets.token_hex(4)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            # Drop expired and superseded entries so the dict stays bounded
+            if len(self._entries) > 512:
+                self._entries = {k: e for k, e in self._entries.items() if e[1] >= now}
+            self._entries[key] = (value, now + ttl)
+
+    def versions(self, tags):
+        with self._lock:
+            return [self._versions[tag] for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self.epoch = secrets.token_hex(4)
+
+
+class SQLiteCacheBackend:
+    """Storage shared by all worker processes through a SQLite file."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entries '
+                         '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_versions '
+                         '(tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO cache_versions (tag, version) VALUES ('__epoch__', ?)",
+                         (secrets.randbits(31),))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    @property
+    def epoch(self):
+        return str(self.versions(['__epoch__'])[0])
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute('SELECT value, expires_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache_entries WHERE expires_at < ?', (now,))
+            conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                         (key, pickle.dumps(value), now + ttl))
+
+    def versions(self, tags):
+        with self._connect() as conn:
+            rows = dict(conn.execute(
+                f"SELECT tag, version FROM cache_versions WHERE tag IN ({','.join('?' * len(tags))})", tags
+            ).fetchall()) if tags else {}
+        return [rows.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._connect() as conn:
+            for tag in tags:
+                conn.execute('INSERT INTO cache_versions (tag, version) VALUES (?, 1) '
+                             'ON CONFLICT(tag) DO UPDATE SET version = version + 1', (tag,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache_entries')
+            conn.execute('DELETE FROM cache_versions')
+            conn.execute("INSERT INTO cache_versions (tag, version) VALUES ('__epoch__', ?)",
+                         (secrets.randbits(31),))
+
+
+class StatsCache:
+    """
+    Tagged TTL cache with single-flight computation.
+
+    Usage::
+
+        stats_cache.get_or_compute('issue_overview', load_fn, tags=('crop_issues',))
+    """
+
+    def __init__(self, app=None):
+        self.backend = MemoryCacheBackend()
+        self.default_ttl = 60
+        self.watched_tables = set()
+        self._key_locks = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.default_ttl = app.config.get('STATS_CACHE_TTL', 60)
+        if app.config.get('STATS_CACHE_BACKEND', 'memory') == 'sqlite':
+            self.backend = SQLiteCacheBackend(app.config['STATS_CACHE_PATH'])
+        else:
+            self.backend = MemoryCacheBackend()
+        register_invalidation_listeners()
+
+    def watch(self, *tables):
+        """Invalidate entries tagged with ``tables`` whenever one of them is committed."""
+        self.watched_tables.update(tables)
+
+    def _storage_key(self, key, tags):
+        versions = self.backend.versions(list(tags))
+        return key + '|' + ','.join(f'{tag}:{version}' for tag, version in zip(tags, versions))
+
+    def _lock_for(self, key):
+        with self._locks_guard:
+            return self._key_locks[key]
+
+    def get_or_compute(self, key, compute, tags=(), ttl=None):
+        """Return the cached value for ``key`` or compute, store and return it."""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return compute()
+
+        storage_key = self._storage_key(key, tags)
+        value = self.backend.get(storage_key)
+        if value is not None:
+            return value
+
+        # Only one thread per process computes a missing entry; the rest wait for it
+        with self._lock_for(key):
+            storage_key = self._storage_key(key, tags)
+            value = self.backend.get(storage_key)
+            if value is None:
+                value = compute()
+                self.backend.set(storage_key, value, ttl)
+        return value
+
+    def get(self, key, tags=()):
+        """Cached value for ``key`` if present and none of ``tags`` changed since it was stored."""
+        return self.backend.get(self._storage_key(key, tags))
+
+    def set(self, key, value, tags=(), ttl=None):
+        self.backend.set(self._storage_key(key, tags), value, self.default_ttl if ttl is None else ttl)
+
+    def versions(self, tags):
+        """Current version counter of each tag; bumped on every committed change."""
+        return self.backend.versions(list(tags))
+
+    def stamp(self, tags):
+        """
+        String identifying the current state of ``tags``, unique across
+        process restarts and cache clears (version counters alone are not).
+        """
+        versions = ','.join(f'{tag}:{version}' for tag, version in zip(tags, self.versions(tags)))
+        return f'{self.backend.epoch}|{versions}'
+
+    def invalidate(self, *tags):
+        self.backend.bump(tags)
+
+    def invalidate_on_commit(self, *tables):
+        """Invalidate ``tables`` when the current transaction commits (for set-based UPDATEs the ORM does not see)."""
+        db.session.info.setdefault('stats_cache_tags', set()).update(tables)
+
+    def clear(self):
+        self.backend.clear()
+
+
+stats_cache = StatsCache()
+
+
+# ==================== COMMIT-TIME INVALIDATION ====================
+
+def _after_flush(session, flush_context):
+    watched = stats_cache.watched_tables
+    if not watched:
+        return
+    changed = session.info.setdefault('stats_cache_tags', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table in watched:
+            changed.add(table)
+
+
+def _after_commit(session):
+    tags = session.info.pop('stats_cache_tags', None)
+    if tags:
+        stats_cache.invalidate(*sorted(tags))
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('stats_cache_tags', None)
+
+
+def register_invalidation_listeners():
+    """Invalidate the watched tables touched by each committed transaction (idempotent)."""
+    if event.contains(db.session, 'after_commit', _after_commit):
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_soft_rollback', _after_rollback)
@@ -0,0 +1,271 @@
+# Chat Helpers
+"""
+Keyset pagination and read tracking for farmer-expert conversations.
+
+Pages are bounded by ``ChatMessage.id`` (``id < before_id`` ordered by id
+descending), which the ``ix_chat_messages_thread`` index serves directly, so
+loading a page costs the same no matter how long the thread is.
+
+Each side of a conversation has a ``ChatReadCursor`` holding the highest
+message id it has read; messages from the other side above it are unread.
+Marking read only moves the cursor, the per-message ``is_read`` flag is no
+longer written. Unread badges read the counters in
+app/utils/unread_counters.py, which count messages above the cursor.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+import sys
+from sqlalchemy import func, and_, or_, select, insert, literal
+from sqlalchemy.exc import IntegrityError
+from app.models import db, ChatMessage, ChatReadCursor, UnreadCounter, User
+from app.utils.unread_counters import CHAT, adjust_unread_counter
+from app.utils.images import image_pipeline
+
+# Messages rendered with the chat page and returned per "load older" request
+CHAT_PAGE_SIZE = 50
+CHAT_PAGE_SIZE_MAX = 200
+
+# Conversations per page of the chat lists
+CONVERSATIONS_PER_PAGE = 20
+
+# Experts offered for a new chat on the farmer chat list; more are found by search
+EXPERT_LIST_SIZE = 20
+
+
+def thread_query(farmer_id, expert_id):
+    return ChatMessage.query.filter(
+        ChatMessage.farmer_id == farmer_id,
+        ChatMessage.expert_id == expert_id
+    )
+
+
+def load_messages_page(farmer_id, expert_id, before_id=None, limit=CHAT_PAGE_SIZE):
+    """
+    Return ``(messages, has_more)``: up to ``limit`` messages older than
+    ``before_id`` (newest page when ``None``), oldest first.
+    """
+    limit = max(1, min(limit, CHAT_PAGE_SIZE_MAX))
+    query = thread_query(farmer_id, expert_id)
+    if before_id:
+        query = query.filter(ChatMessage.id < before_id)
+    rows = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return rows[:limit][::-1], has_more
+
+
+def serialize_message(msg):
+    """JSON shape shared by the send, poll and history endpoints."""
+    return {
+        'id': msg.id,
+        'message': msg.message,
+        'image_path': msg.image_path,
+        'thumb_path': image_pipeline.thumbnail(msg.image_path, 'md'),
+        'sender_role': msg.sender_role,
+        'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'time_display': msg.created_at.strftime('%Y-%m-%d %H:%M')
+    }
+
+
+# ==================== CONVERSATION LIST ====================
+
+@dataclass
+class ConversationSummary:
+    """One row of a chat list: the counterpart and the latest message."""
+    partner: User
+    last_message: str
+    last_sender_role: str
+    last_message_at: datetime
+    unread_count: int
+
+
+@dataclass
+class ConversationPage:
+    items: list
+    page: int
+    per_page: int
+    total: int
+    total_unread: int
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+    @property
+    def prev_num(self):
+        return self.page - 1
+
+    @property
+    def next_num(self):
+        return self.page + 1
+
+
+def load_conversations(user_id, role, page=1, per_page=CONVERSATIONS_PER_PAGE):
+    """
+    Conversations of ``user_id`` (a farmer or expert), most recent first, in
+    one round-trip: ROW_NUMBER() picks each thread's last message, the unread
+    counter is joined in, and window totals give the conversation count and
+    overall unread count for the header and pager.
+    """
+    if role == 'farmer':
+        own, partner = ChatMessage.farmer_id, ChatMessage.expert_id
+    else:
+        own, partner = ChatMessage.expert_id, ChatMessage.farmer_id
+
+    ranked = select(
+        ChatMessage.id,
+        partner.label('partner_id'),
+        ChatMessage.message,
+        ChatMessage.sender_role,
+        ChatMessage.created_at,
+        func.row_number().over(partition_by=partner, order_by=ChatMessage.id.desc()).label('rn')
+    ).where(own == user_id, partner.isnot(None)).subquery('ranked')
+
+    unread = func.coalesce(UnreadCounter.unread_count, 0)
+    page = max(page, 1)
+    rows = db.session.query(
+        User,
+        ranked.c.message,
+        ranked.c.sender_role,
+        ranked.c.created_at,
+        unread.label('unread_count'),
+        func.count().over().label('total'),
+        func.sum(unread).over().label('total_unread')
+    ).join(ranked, User.id == ranked.c.partner_id)\
+     .outerjoin(UnreadCounter, and_(
+         UnreadCounter.user_id == user_id,
+         UnreadCounter.kind == CHAT,
+         UnreadCounter.partner_id == ranked.c.partner_id
+     ))\
+     .filter(ranked.c.rn == 1)\
+     .order_by(ranked.c.id.desc())\
+     .offset((page - 1) * per_page).limit(per_page).all()
+
+    items = [ConversationSummary(user, message, sender_role, created_at, count)
+             for user, message, sender_role, created_at, count, _, _ in rows]
+    total = rows[0].total if rows else 0
+    total_unread = int(rows[0].total_unread or 0) if rows else 0
+    return ConversationPage(items, page, per_page, total, total_unread)
+
+
+def load_experts(search=None, limit=EXPERT_LIST_SIZE):
+    """
+    Active experts for starting a new chat, by name, at most ``limit``;
+    ``search`` matches the name or expertise area. Returns ``(experts, has_more)``.
+    """
+    query = User.query.filter_by(role='expert', is_active=True)
+    if search:
+        pattern = f'%{search}%'
+        query = query.filter(or_(User.full_name.ilike(pattern), User.expertise_area.ilike(pattern)))
+    rows = query.order_by(User.full_name, User.id).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+# ==================== READ CURSORS ====================
+
+def _sender_role(reader_role):
+    """Role whose messages ``reader_role`` reads."""
+    return 'expert' if reader_role == 'farmer' else 'farmer'
+
+
+def _cursor_where(farmer_id, expert_id, reader_role):
+    table = ChatReadCursor.__table__
+    return and_(table.c.farmer_id == farmer_id, table.c.expert_id == expert_id,
+                table.c.reader_role == reader_role)
+
+
+def _create_cursor(farmer_id, expert_id, reader_role, up_to_id):
+    """Insert a reader's first cursor. Returns ``False`` if a concurrent request created it first."""
+    table = ChatReadCursor.__table__
+    values = dict(farmer_id=farmer_id, expert_id=expert_id, reader_role=reader_role,
+                  last_read_id=up_to_id, updated_at=datetime.utcnow())
+    dialect = db.engine.dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(table).values(**values).on_conflict_do_nothing(
+            index_elements=['farmer_id', 'expert_id', 'reader_role'])
+        return db.session.execute(stmt).rowcount == 1
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def mark_thread_read(farmer_id, expert_id, reader_role, up_to_id):
+    """
+    Move the reader's cursor forward to ``up_to_id`` and take the messages it
+    passed over off the reader's unread counter. The cursor is moved with a
+    compare-and-set on its old value, so two requests reading the same
+    messages subtract them once. No message rows are loaded or updated; the
+    caller commits. Returns the number of messages that became read.
+    """
+    if not up_to_id:
+        return 0
+    table = ChatReadCursor.__table__
+    where = _cursor_where(farmer_id, expert_id, reader_role)
+    last_read_id = db.session.execute(select(table.c.last_read_id).where(where)).scalar()
+    if last_read_id is None:
+        moved = _create_cursor(farmer_id, expert_id, reader_role, up_to_id)
+    elif last_read_id >= up_to_id:
+        return 0
+    else:
+        moved = db.session.execute(
+            table.update().where(where, table.c.last_read_id == last_read_id)
+            .values(last_read_id=up_to_id, updated_at=datetime.utcnow())
+        ).rowcount == 1
+    if not moved:
+        # Another request moved the cursor and adjusts the counter itself
+        return 0
+
+    read = db.session.execute(
+        select(func.count(ChatMessage.id)).where(
+            ChatMessage.farmer_id == farmer_id,
+            ChatMessage.expert_id == expert_id,
+            ChatMessage.id > (last_read_id or 0),
+            ChatMessage.id <= up_to_id,
+            ChatMessage.sender_role == _sender_role(reader_role)
+        )
+    ).scalar()
+    if reader_role == 'farmer':
+        adjust_unread_counter(farmer_id, CHAT, expert_id, -read)
+    else:
+        adjust_unread_counter(expert_id, CHAT, farmer_id, -read)
+    return read
+
+
+def ensure_read_cursors_populated():
+    """
+    Seed cursors from the legacy ``is_read`` flags on first start: each
+    side's cursor is the highest id it had read in every conversation.
+    """
+    try:
+        if db.session.query(ChatReadCursor.id).first() is not None:
+            return
+        if db.session.query(ChatMessage.id).filter(ChatMessage.is_read == True,
+                                                   ChatMessage.expert_id.isnot(None)).first() is None:
+            return
+        print("INFO: Backfilling chat read cursors...", file=sys.stderr, flush=True)
+        for reader_role in ('farmer', 'expert'):
+            db.session.execute(insert(ChatReadCursor).from_select(
+                ['farmer_id', 'expert_id', 'reader_role', 'last_read_id'],
+                select(ChatMessage.farmer_id, ChatMessage.expert_id, literal(reader_role),
+                       func.max(ChatMessage.id))
+                .where(ChatMessage.expert_id.isnot(None),
+                       ChatMessage.sender_role == _sender_role(reader_role),
+                       ChatMessage.is_read == True)
+                .group_by(ChatMessage.farmer_id, ChatMessage.expert_id)
+            ))
+        db.session.commit()
+    except Exception as e:
+        print(f"WARNING: Could not backfill chat read cursors: {e}", file=sys.stderr, flush=True)
+        db.session.rollback()
@@ -0,0 +1,85 @@
+# HTTP Caching For Public Pages
+"""
+Response cache and conditional GET support for pages anonymous visitors see
+(landing page, Krishi Bhavan products, the farmer marketplace).
+
+A page's ETag is a hash of its URL (path and query string) and the version
+counters of the tables it is rendered from. The counters live in the shared
+statistics cache and are bumped whenever a change to one of those tables is
+committed, so an ETag stays valid exactly as long as the page content does.
+
+* ``If-None-Match`` with the current ETag gets ``304 Not Modified`` without
+  running the view.
+* Otherwise a rendered 200 is served from (or stored in) the cache under the
+  same URL and versions.
+* ``Cache-Control: public, max-age=0, s-maxage=N`` lets a CDN or reverse
+  proxy hold the page for N seconds while browsers revalidate every time.
+
+Logged-in users, requests carrying flashed messages and non-GET requests
+bypass the cache entirely.
+"""
+from functools import wraps
+import hashlib
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from app.utils.cache import stats_cache
+
+
+def _cacheable():
+    return (
+        current_app.config.get('HTTP_CACHE_ENABLED', True)
+        and request.method in ('GET', 'HEAD')
+        and not current_user.is_authenticated
+        and not session.get('_flashes')
+    )
+
+
+def page_etag(key, tables):
+    salt = current_app.config.get('HTTP_CACHE_VERSION', '1')
+    return hashlib.sha256(f'{salt}|{key}|{stats_cache.stamp(tables)}'.encode()).hexdigest()[:32]
+
+
+def _finish(response, etag, max_age):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age=0, s-maxage={max_age}'
+    response.vary.add('Cookie')
+    return response
+
+
+def public_page(*tables, max_age=None):
+    """
+    Cache an anonymous page rendered from ``tables``::
+
+        @marketplace_bp.route('/')
+        @public_page('farmer_products')
+        def index(): ...
+    """
+    stats_cache.watch(*tables)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _cacheable():
+                return view(*args, **kwargs)
+
+            ttl = max_age if max_age is not None else current_app.config.get('HTTP_CACHE_MAX_AGE', 60)
+            key = f'page:{request.full_path}'
+            etag = page_etag(key, tables)
+
+            if request.if_none_match.contains(etag):
+                return _finish(make_response('', 304), etag, ttl)
+
+            cached = stats_cache.get(key, tables)
+            if cached is not None:
+                body, mimetype = cached
+                response = make_response(body)
+                response.mimetype = mimetype
+                return _finish(response, etag, ttl)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough or session.modified:
+                return response
+            stats_cache.set(key, (response.get_data(), response.mimetype), tables, ttl=ttl)
+            return _finish(response, etag, ttl)
+        return wrapper
+    return decorator
@@ -0,0 +1,195 @@
+# Image Ingestion Pipeline
+"""
+Stores uploaded images (crop issues, chat attachments, marketplace products)
+and builds resized WebP variants for listings.
+
+* The upload is streamed to a temporary file while its SHA-256 is computed;
+  the stored name is the content hash, so re-uploading the same photo reuses
+  the existing file instead of writing a second copy.
+* Originals carrying EXIF (camera, GPS) or XMP metadata are re-encoded
+  with orientation applied and the metadata dropped before they are stored,
+  since the original is linked from detail views and chat.
+* Thumbnail generation runs on a small worker pool after the request has
+  its path. Variants are written next to the original as
+  ``<hash>_<size>.webp`` with orientation applied and EXIF dropped.
+* Templates use the ``thumbnail`` filter, which falls back to the original
+  until the variant exists (fresh uploads, images stored before the pipeline).
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import hashlib
+import os
+from pathlib import Path
+import sys
+import tempfile
+import threading
+from PIL import Image, ImageOps
+
+# Longest edge in pixels of each generated variant
+THUMBNAIL_SIZES = {'sm': 320, 'md': 640, 'lg': 1280}
+
+ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def variant_path(path, size):
+    """``uploads/crops/<hash>.jpg`` -> ``uploads/crops/<hash>_<size>.webp``."""
+    stem, _ = os.path.splitext(path)
+    return f'{stem}_{size}.webp'
+
+
+def make_thumbnails(source, sizes=THUMBNAIL_SIZES, quality=80):
+    """Write the WebP variants of ``source`` that do not exist yet."""
+    source = Path(source)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        for size, edge in sizes.items():
+            target = Path(variant_path(str(source), size))
+            if target.exists():
+                continue
+            variant = image.copy()
+            variant.thumbnail((edge, edge))
+            # Saved without exif=..., so camera metadata (GPS etc.) is not carried over
+            tmp = target.with_suffix('.tmp')
+            variant.save(tmp, 'WEBP', quality=quality, method=4)
+            os.replace(tmp, target)
+
+
+def strip_metadata(path):
+    """
+    Re-encode the image at ``path`` in place without EXIF/XMP (orientation
+    applied first). Images without such metadata, and animations, are left
+    byte-for-byte as uploaded.
+    """
+    with Image.open(path) as image:
+        if getattr(image, 'n_frames', 1) > 1:
+            return
+        if not image.getexif() and not any(key in image.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp')):
+            return
+        image_format = image.format
+        clean = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG' and clean.mode not in ('RGB', 'L', 'CMYK'):
+            clean = clean.convert('RGB')
+        options = {'quality': 92} if image_format in ('JPEG', 'WEBP') else {}
+        clean.info.pop('exif', None)
+        clean.info.pop('xmp', None)
+        clean.info.pop('XML:com.adobe.xmp', None)
+        tmp = f'{path}.clean'
+        try:
+            clean.save(tmp, image_format, **options)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    os.replace(tmp, path)
+
+
+class ImagePipeline:
+    """
+    Upload entry point shared by the routes::
+
+        image_path = image_pipeline.ingest(request.files['crop_image'], 'crops')
+    """
+
+    def __init__(self, app=None):
+        self.upload_folder = None
+        self.workers = 2
+        self.sizes = THUMBNAIL_SIZES
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.upload_folder = Path(app.config['UPLOAD_FOLDER'])
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        app.add_template_filter(self.thumbnail, 'thumbnail')
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnails')
+            return self._executor
+
+    def ingest(self, file, folder):
+        """
+        Store an uploaded ``FileStorage`` under ``uploads/<folder>/`` and
+        queue its thumbnails. Returns the path relative to ``static/``.
+        Raises ``ValueError`` when the file is not a readable image.
+        """
+        ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+        if ext not in ALLOWED_IMAGE_EXTENSIONS:
+            raise ValueError('Only image files are allowed.')
+        target_dir = self.upload_folder / folder
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=target_dir, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            try:
+                with Image.open(tmp_name) as image:
+                    image.verify()
+            except Exception:
+                raise ValueError('The uploaded file is not a valid image.')
+            # The original is served too, so camera metadata (GPS etc.) must not survive
+            strip_metadata(tmp_name)
+
+            filename = f'{digest.hexdigest()[:32]}.{"jpg" if ext == "jpeg" else ext}'
+            target = target_dir / filename
+            if target.exists():
+                os.remove(tmp_name)
+            else:
+                os.replace(tmp_name, target)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+        self.submit(target)
+        return f'uploads/{folder}/{filename}'
+
+    def submit(self, source):
+        """Queue thumbnail generation for a stored image (skipped when already done)."""
+        source = Path(source)
+        if all(Path(variant_path(str(source), size)).exists() for size in self.sizes):
+            return None
+        future = self._pool().submit(self._process, source)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _process(self, source):
+        try:
+            make_thumbnails(source, self.sizes)
+        except Exception as e:
+            print(f"WARNING: Could not create thumbnails for {source}: {e}", file=sys.stderr, flush=True)
+
+    def _discard(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def wait(self, timeout=None):
+        """Block until queued thumbnails are written (scripts and tests)."""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout=timeout)
+
+    def thumbnail(self, path, size='md'):
+        """Template filter: the ``size`` variant of ``path`` once it exists, else ``path``."""
+        if not path or self.upload_folder is None:
+            return path
+        variant = variant_path(path, size)
+        if (self.upload_folder.parent / variant).exists():
+            return variant
+        return path
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,113 @@
+# JSON Document Columns
+"""
+``CropIssue.symptoms``, ``CropIssue.ai_prediction`` and
+``DiagnosisReport.recommended_products`` are JSON columns (``JSONDocument``):
+the ORM hands out lists and dicts, and the documents can be queried in SQL.
+
+* PostgreSQL: ``jsonb`` with GIN indexes (``jsonb_path_ops``, for ``@>``
+  containment) and a btree index on ``ai_prediction ->> 'disease_name'``.
+* SQLite: JSON text read through the JSON1 functions, with an expression
+  index on ``json_extract(ai_prediction, '$.disease_name')``.
+
+Use ``json_field()`` to read a key in a query; it inlines the key so the
+expression matches the indexes above.
+
+``ensure_json_columns()`` upgrades databases created when the columns were
+TEXT: values that are not valid JSON are wrapped (symptoms, products) or
+cleared (predictions), PostgreSQL columns are converted to ``jsonb`` and the
+indexes are created.
+"""
+import json
+import sys
+from sqlalchemy import String, cast, func, inspect, literal_column, text, type_coerce
+from app.models import db
+
+# (table, column, keep_invalid): invalid text is kept as a one-item list, or set to NULL
+JSON_COLUMNS = (
+    ('crop_issues', 'symptoms', True),
+    ('crop_issues', 'ai_prediction', False),
+    ('diagnosis_reports', 'recommended_products', True),
+)
+
+_SQLITE_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_crop_issues_predicted_disease "
+    "ON crop_issues (json_extract(ai_prediction, '$.disease_name'))",
+)
+
+_POSTGRES_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_crop_issues_symptoms ON crop_issues USING GIN (symptoms jsonb_path_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_crop_issues_ai_prediction ON crop_issues USING GIN (ai_prediction jsonb_path_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_crop_issues_predicted_disease ON crop_issues ((ai_prediction ->> 'disease_name'))",
+    "CREATE INDEX IF NOT EXISTS ix_diagnosis_reports_recommended_products "
+    "ON diagnosis_reports USING GIN (recommended_products jsonb_path_ops)",
+)
+
+
+def json_field(column, key, type_=String):
+    """``column ->> key`` as ``type_``; ``key`` must be a trusted identifier (it is inlined)."""
+    if db.engine.dialect.name == 'postgresql':
+        value = column.op('->>')(literal_column(f"'{key}'"))
+    else:
+        value = func.json_extract(column, literal_column(f"'$.{key}'"))
+    return type_coerce(value, String) if type_ is String else cast(value, type_)
+
+
+# ==================== MIGRATION ====================
+
+def _normalize_column(table, column, keep_invalid):
+    """Rewrite values of a TEXT column that are not valid JSON. Returns the number of rows changed."""
+    fixed = 0
+    rows = db.session.execute(text(
+        f"SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL"
+    )).all()
+    for row_id, value in rows:
+        try:
+            json.loads(value)
+            continue
+        except (TypeError, ValueError):
+            pass
+        replacement = json.dumps([value]) if keep_invalid and value.strip() else None
+        db.session.execute(text(f"UPDATE {table} SET {column} = :value WHERE id = :id"),
+                           {'value': replacement, 'id': row_id})
+        fixed += 1
+    return fixed
+
+
+def _sqlite_needs_upgrade():
+    return db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'ix_crop_issues_predicted_disease'")).first() is None
+
+
+def _postgres_text_columns():
+    columns = []
+    for table in {table for table, _, _ in JSON_COLUMNS}:
+        types = {c['name']: c['type'].__class__.__name__ for c in inspect(db.engine).get_columns(table)}
+        columns += [(t, c, keep) for t, c, keep in JSON_COLUMNS if t == table and types.get(c) != 'JSONB']
+    return columns
+
+
+def ensure_json_columns():
+    """Convert the JSON columns of older databases and create their indexes."""
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'sqlite':
+            if _sqlite_needs_upgrade():
+                fixed = sum(_normalize_column(*column) for column in JSON_COLUMNS)
+                if fixed:
+                    print(f"INFO: Rewrote {fixed} non-JSON value(s) in JSON columns", file=sys.stderr, flush=True)
+                for ddl in _SQLITE_DDL:
+                    db.session.execute(text(ddl))
+                db.session.commit()
+        elif dialect == 'postgresql':
+            for table, column, keep_invalid in _postgres_text_columns():
+                print(f"INFO: Converting {table}.{column} to jsonb", file=sys.stderr, flush=True)
+                _normalize_column(table, column, keep_invalid)
+                db.session.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb"))
+                db.session.commit()
+            for ddl in _POSTGRES_DDL:
+                db.session.execute(text(ddl))
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"WARNING: Could not upgrade JSON columns: {e}", file=sys.stderr, flush=True)
@@ -0,0 +1,106 @@
+# Marketplace Listing Helpers
+"""
+Keyset pagination and cached category facets for the public marketplace.
+
+Listings are browsed newest first on ``(created_at, id)``. A page is fetched
+with ``WHERE (created_at, id) < cursor ORDER BY created_at DESC, id DESC
+LIMIT n`` on the ``ix_farmer_products_available_created`` index, so the
+hundredth page costs the same as the first; no COUNT or OFFSET is issued.
+
+The category dropdown and the result total come from one GROUP BY over
+``farmer_products`` kept in the shared statistics cache. Any committed
+change to a product invalidates it.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from sqlalchemy import func, case, and_, or_
+from app.models import db, FarmerProduct
+from app.utils.cache import stats_cache
+
+LISTING_PAGE_SIZE = 12
+
+stats_cache.watch(FarmerProduct.__tablename__)
+
+
+# ==================== CATEGORY FACETS ====================
+
+def load_category_facets():
+    """``{category: available listings}`` for every category, sorted by name."""
+    rows = db.session.query(
+        FarmerProduct.category,
+        func.coalesce(func.sum(case((FarmerProduct.is_available == True, 1), else_=0)), 0)
+    ).group_by(FarmerProduct.category).order_by(FarmerProduct.category).all()
+    return {category: int(count) for category, count in rows if category}
+
+
+def cached_category_facets():
+    """Category facets shared by all visitors until the next committed product change."""
+    return stats_cache.get_or_compute(
+        'marketplace_category_facets', load_category_facets,
+        tags=(FarmerProduct.__tablename__,)
+    )
+
+
+# ==================== KEYSET PAGINATION ====================
+
+def encode_cursor(product):
+    return f'{product.created_at.isoformat()}~{product.id}'
+
+
+def decode_cursor(cursor):
+    """``(created_at, id)`` from a cursor string, or ``None`` when it is malformed."""
+    try:
+        created_at, product_id = cursor.rsplit('~', 1)
+        return datetime.fromisoformat(created_at), int(product_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+@dataclass
+class ListingPage:
+    items: list = field(default_factory=list)
+    total: int = 0
+    next_cursor: str = None
+    prev_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def load_listing_page(query, after=None, before=None, per_page=LISTING_PAGE_SIZE, total=0):
+    """
+    One page of ``query`` (a filtered ``FarmerProduct`` query), newest first.
+    ``after`` continues past the last item of the previous page, ``before``
+    goes back from the first item of the current one. ``total`` is passed
+    through for display (the cached facet count).
+    """
+    created, pk = FarmerProduct.created_at, FarmerProduct.id
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    if before:
+        # Walk backwards (oldest first) from the cursor, then restore newest-first order
+        rows = query.filter(or_(created > before[0], and_(created == before[0], pk > before[1])))\
+                    .order_by(created.asc(), pk.asc()).limit(per_page + 1).all()
+        if len(rows) <= per_page:
+            # Back at the newest listings: show a full first page
+            return load_listing_page(query, per_page=per_page, total=total)
+        items = rows[:per_page][::-1]
+        has_newer, has_older = True, True
+    else:
+        if after:
+            query = query.filter(or_(created < after[0], and_(created == after[0], pk < after[1])))
+        rows = query.order_by(created.desc(), pk.desc()).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_newer, has_older = after is not None, len(rows) > per_page
+
+    return ListingPage(
+        items=items,
+        total=total,
+        next_cursor=encode_cursor(items[-1]) if items and has_older else None,
+        prev_cursor=encode_cursor(items[0]) if items and has_newer else None
+    )
@@ -13,7 +13,7 @@ def predict_disease(image_path, symptoms, crop_type):
         crop_type: Crop type (dropdown selection)
     
     Returns:
-        JSON string with prediction results
+        Dictionary with prediction results
     """
     # Convert symptoms to list if it's a string
     if isinstance(symptoms, str):
@@ -52,7 +52,7 @@ def predict_disease(image_path, symptoms, crop_type):
             'treatment_options': result['recommended_actions']
         }
     
-    return json.dumps(prediction)
+    return prediction
 
 def predict_yield(crop_type, soil_type, irrigation_type, fertilizer_type, 
                   temperature, rainfall, farm_size, location):
@@ -0,0 +1,250 @@
+# Product Request Fulfilment
+"""
+Approving farmers' product requests against Krishi Bhavan inventory.
+
+Each request is linked to the ``Product`` it asks for through
+``ProductRequest.product_id``. New requests are linked when they are made;
+older requests, which only carry a free-text name and type, are linked in
+one set-based UPDATE that looks the product up case-insensitively by type
+and name through the ``ix_products_type_name_lower`` expression index.
+A product with pending requests cannot be deleted; deleting one unlinks
+its decided requests, which keep their name and type.
+
+Approving a request reserves its quantity from the product's stock in the
+same transaction, as a stock ledger entry with the idempotency key
+``product-request-<id>``, so a request can never take stock twice.
+``apply_request_decisions()`` approves and rejects batches of requests (see
+``app.utils.batches``): all rows are validated against one SELECT, stock is
+reserved with ``apply_stock_batch()`` and the statuses are set with one
+``executemany`` UPDATE per action, limited to requests still pending.
+
+``process_pending_requests()`` works through the pending queue oldest first,
+``FULFILMENT_BATCH_SIZE`` requests at a time, approving every request whose
+product has enough stock left and leaving the rest pending.
+"""
+from datetime import datetime
+import sys
+from sqlalchemy import and_, bindparam, func, inspect, or_, select, text, update
+from sqlalchemy.schema import CreateIndex
+from app.models import db, Product, ProductRequest
+from app.utils.batches import parse_int, row_result
+from app.utils.stock import apply_stock_batch
+
+ACTIONS = {'approve': 'approved', 'reject': 'rejected'}
+
+DEFAULT_REJECTION_REASON = 'Request rejected by officer'
+
+# Pending requests approved per transaction by process_pending_requests()
+FULFILMENT_BATCH_SIZE = 200
+
+
+def reservation_key(request_id):
+    """Idempotency key of the stock ledger entry reserving a request's quantity."""
+    return f'product-request-{request_id}'
+
+
+# ==================== MATCHING ====================
+
+def _matching_product(product_name, product_type):
+    """``SELECT id`` of the active product with this type and name (any case), oldest first."""
+    return select(Product.id).where(
+        func.lower(Product.product_type) == func.lower(product_type),
+        func.lower(Product.name) == func.lower(product_name),
+        Product.is_active == True
+    ).order_by(Product.id).limit(1)
+
+
+def match_product_id(product_name, product_type):
+    """Id of the inventory product a new request asks for, or ``None``."""
+    return db.session.execute(_matching_product(product_name.strip(), product_type.strip())).scalar()
+
+
+def link_requests(request_ids=None):
+    """
+    Set ``product_id`` on unlinked requests (``request_ids``, or all pending
+    ones) whose name and type match a product, in one UPDATE. Returns the
+    number of requests linked.
+    """
+    table = ProductRequest.__table__
+    match = _matching_product(table.c.product_name, table.c.product_type)
+    query = update(table).where(table.c.product_id.is_(None), match.exists())\
+        .values(product_id=match.scalar_subquery())
+    if request_ids is None:
+        query = query.where(table.c.status == 'pending')
+    else:
+        query = query.where(table.c.id.in_(request_ids))
+    return db.session.execute(query).rowcount
+
+
+# ==================== DECISIONS ====================
+
+def _validate_decisions(rows):
+    request_ids = {parse_int(row.get('request_id')) for row in rows} - {None}
+    if request_ids:
+        link_requests(request_ids)
+    requests = {row.id: row for row in db.session.execute(
+        select(ProductRequest.id, ProductRequest.status, ProductRequest.product_id, ProductRequest.quantity)
+        .where(ProductRequest.id.in_(request_ids))
+    )} if request_ids else {}
+
+    results, decisions, seen = [], [], set()
+    for number, row in enumerate(rows, 1):
+        request_id = parse_int(row.get('request_id'))
+        action = str(row.get('action') or '').strip().lower()
+        found = requests.get(request_id)
+        if found is None:
+            results.append(row_result(number, 'error', 'Unknown request.'))
+        elif action not in ACTIONS:
+            results.append(row_result(number, 'error', 'action must be approve or reject.', request_id=request_id))
+        elif request_id in seen:
+            results.append(row_result(number, 'error', 'Request appears more than once.', request_id=request_id))
+        elif found.status == ACTIONS[action]:
+            results.append(row_result(number, 'skipped', f'Already {found.status}.', request_id=request_id))
+        elif found.status != 'pending':
+            results.append(row_result(number, 'error', f'Request is {found.status}.', request_id=request_id))
+        elif action == 'approve' and found.product_id is None:
+            results.append(row_result(number, 'error', 'No matching product in inventory.', request_id=request_id))
+        else:
+            reason = str(row.get('rejection_reason') or '').strip() or DEFAULT_REJECTION_REASON
+            decisions.append((number, found, action, reason))
+            results.append(row_result(number, 'applied', request_id=request_id, decision=ACTIONS[action]))
+        if request_id is not None:
+            seen.add(request_id)
+    return results, decisions
+
+
+def _not_applied(results, errors=None):
+    """Report the rows that would have been applied as errors (``{row: message}``) or skipped."""
+    for result in results:
+        if result['status'] != 'applied':
+            continue
+        if errors and result['row'] in errors:
+            result.update(status='error', message=errors[result['row']])
+        else:
+            result.update(status='skipped', message='Not applied: other rows have errors.')
+    return 0, results
+
+
+def apply_request_decisions(rows, officer_id):
+    """
+    Approve or reject a batch of pending requests in the current transaction,
+    reserving stock for the approvals. Returns ``(applied, results)``; if any
+    row is invalid or a product lacks the stock, nothing is applied. The
+    caller commits when ``applied`` is non-zero and rolls back otherwise.
+    """
+    results, decisions = _validate_decisions(rows)
+    if any(result['status'] == 'error' for result in results):
+        return _not_applied(results)
+    if not decisions:
+        return 0, results
+
+    approvals = [(number, found) for number, found, action, _ in decisions if action == 'approve']
+    if approvals:
+        _, stock_results = apply_stock_batch([{
+            'product_id': found.product_id,
+            'quantity_change': -found.quantity,
+            'reason': f'Product request #{found.id}',
+            'idempotency_key': reservation_key(found.id)
+        } for _, found in approvals], officer_id)
+        errors = {number: f"Stock: {stock['message']}"
+                  for (number, _), stock in zip(approvals, stock_results) if stock['status'] == 'error'}
+        if errors:
+            return _not_applied(results, errors)
+
+    now = datetime.utcnow()
+    table = ProductRequest.__table__
+    for action, status in ACTIONS.items():
+        params = [{'b_id': found.id, 'b_reason': reason if action == 'reject' else None}
+                  for _, found, decision, reason in decisions if decision == action]
+        if not params:
+            continue
+        updated = db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('b_id'), table.c.status == 'pending')
+            .values(status=status, approved_by=officer_id, approval_date=now,
+                    rejection_reason=bindparam('b_reason')),
+            params
+        )
+        if updated.supports_sane_multi_rowcount() and updated.rowcount != len(params):
+            db.session.rollback()
+            message = 'Requests were decided concurrently; nothing was applied.'
+            return _not_applied(results, {number: message for number, _, _, _ in decisions})
+    return len(decisions), results
+
+
+# ==================== QUEUE ====================
+
+def process_pending_requests(officer_id, batch_size=FULFILMENT_BATCH_SIZE):
+    """
+    Approve pending requests oldest first while their products have stock,
+    committing every ``batch_size`` requests. Requests that cannot be filled
+    stay pending. Returns ``{'approved': n, 'waiting': n, 'unmatched': n}``.
+    """
+    if link_requests():
+        db.session.commit()
+
+    summary = {'approved': 0, 'waiting': 0, 'unmatched': 0}
+    after = None
+    while True:
+        query = select(ProductRequest.id, ProductRequest.product_id, ProductRequest.quantity,
+                       ProductRequest.created_at).where(ProductRequest.status == 'pending')
+        if after is not None:
+            query = query.where(or_(ProductRequest.created_at > after[0],
+                                    and_(ProductRequest.created_at == after[0], ProductRequest.id > after[1])))
+        batch = db.session.execute(
+            query.order_by(ProductRequest.created_at, ProductRequest.id).limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        after = (batch[-1].created_at, batch[-1].id)
+
+        product_ids = {row.product_id for row in batch if row.product_id is not None}
+        stock = dict(db.session.execute(
+            select(Product.id, Product.stock_quantity).where(Product.id.in_(product_ids))
+        ).all()) if product_ids else {}
+
+        # Served in order; a request too large for the remaining stock waits without blocking smaller ones
+        approve = []
+        for row in batch:
+            if row.product_id is None:
+                summary['unmatched'] += 1
+            elif 0 < row.quantity <= stock.get(row.product_id, 0):
+                stock[row.product_id] -= row.quantity
+                approve.append({'request_id': row.id, 'action': 'approve'})
+            else:
+                summary['waiting'] += 1
+        if not approve:
+            continue
+
+        applied, _ = apply_request_decisions(approve, officer_id)
+        if applied:
+            db.session.commit()
+            summary['approved'] += applied
+        else:
+            # Stock or statuses changed since the batch was read; leave it for the next run
+            db.session.rollback()
+            summary['waiting'] += len(approve)
+    return summary
+
+
+# ==================== MIGRATION ====================
+
+def ensure_request_product_link():
+    """Add ``product_requests.product_id`` and the matching indexes to older databases, then link pending requests."""
+    try:
+        columns = {c['name'] for c in inspect(db.engine).get_columns('product_requests')}
+        if 'product_id' in columns:
+            return
+        print("INFO: Adding product_requests.product_id", file=sys.stderr, flush=True)
+        db.session.execute(text("ALTER TABLE product_requests ADD COLUMN product_id INTEGER REFERENCES products (id)"))
+        db.session.commit()
+        # IF NOT EXISTS: the expression index is invisible to reflection, so checkfirst cannot see it
+        for table in (ProductRequest.__table__, Product.__table__):
+            for index in table.indexes:
+                db.session.execute(CreateIndex(index, if_not_exists=True))
+        linked = link_requests()
+        db.session.commit()
+        print(f"INFO: Linked {linked} pending product request(s) to inventory", file=sys.stderr, flush=True)
+    except Exception as e:
+        print(f"WARNING: Could not link product requests to products: {e}", file=sys.stderr, flush=True)
+        db.session.rollback()
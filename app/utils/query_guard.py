@@ -0,0 +1,81 @@
+# Repeated Query Detector
+"""
+Catches N+1 query patterns: the same SELECT (parameters aside) executed over
+and over within one request or app context, usually a per-row query or a
+lazy relationship inside a loop.
+
+Enable by setting ``QUERY_REPEAT_LIMIT`` (test configurations). When a
+statement runs more than that many times in one app context the next
+execution raises ``RepeatedQueryError``, so the offending route fails
+loudly instead of getting slower as tables grow. Statements are compared
+after collapsing whitespace and inlined literals, so ``... WHERE id = 1``
+and ``... WHERE id = 2`` count as the same query.
+
+``capture_statements()`` records every statement an engine runs inside a
+block, for tests that pin down how many round-trips a code path makes.
+"""
+import re
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from app.models import db
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+
+class RepeatedQueryError(RuntimeError):
+    """A statement ran more often than ``QUERY_REPEAT_LIMIT`` allows."""
+
+
+def normalize_statement(statement):
+    """SQL text with literals replaced by ``?`` and whitespace collapsed."""
+    return _WHITESPACE.sub(' ', _LITERALS.sub('?', statement)).strip()
+
+
+def query_counts():
+    """Per-statement SELECT counts for the current app context."""
+    if 'query_counts' not in g:
+        g.query_counts = Counter()
+    return g.query_counts
+
+
+def enable_query_guard(app):
+    """Count SELECTs per app context on ``app``'s engine and enforce ``QUERY_REPEAT_LIMIT`` (idempotent)."""
+    with app.app_context():
+        engine = db.engine
+    if getattr(engine, '_query_guard', False):
+        return
+    engine._query_guard = True
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not has_app_context():
+            return
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return
+        limit = current_app.config.get('QUERY_REPEAT_LIMIT')
+        if not limit:
+            return
+        key = normalize_statement(statement)
+        counts = query_counts()
+        counts[key] += 1
+        if counts[key] > limit:
+            raise RepeatedQueryError(f'Statement ran {counts[key]} times (limit {limit}), likely N+1: {key[:300]}')
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def capture_statements(engine):
+    """Collect the SQL of every statement ``engine`` executes inside the block, in order."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
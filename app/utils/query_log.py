@@ -0,0 +1,40 @@
+# SQL Query Recorder
+"""
+Appends every SELECT the application runs to a JSON-lines file so it can be
+replayed through EXPLAIN by scripts/utils/index_advisor.py.
+
+Enable by setting ``QUERY_LOG_PATH`` (environment or config). Each line is
+``{"dialect": ..., "statement": ..., "parameters": ...}``.
+"""
+import json
+import threading
+from sqlalchemy import event
+
+_lock = threading.Lock()
+
+
+def enable_query_log(engine, path):
+    """Record SELECT statements executed on ``engine`` to ``path`` (idempotent per engine)."""
+    if getattr(engine, '_query_log_path', None):
+        return
+    engine._query_log_path = str(path)
+    dialect = engine.dialect.name
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return
+        line = json.dumps({'dialect': dialect, 'statement': statement, 'parameters': parameters}, default=str)
+        with _lock, open(engine._query_log_path, 'a', encoding='utf-8') as fh:
+            fh.write(line + '\n')
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def read_query_log(path):
+    """Yield ``(dialect, statement, parameters)`` from a recorded log."""
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                yield entry['dialect'], entry['statement'], entry['parameters']
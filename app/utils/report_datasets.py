@@ -0,0 +1,167 @@
+# Report Datasets
+"""
+Rows behind the farmer disease history and yield prediction reports, shared
+by the PDF, CSV and bulk ZIP exports.
+
+Each dataset is one column-projected ``SELECT`` returning named tuples (no
+ORM objects are built). The predicted disease and confidence are extracted
+from ``ai_prediction`` in SQL; symptom lists are read as text and decoded
+through an LRU cache keyed on that text, since they come from a fixed
+checklist and most rows repeat a combination already seen.
+
+The ``*_record`` and ``*_summary`` functions turn rows into the dicts the
+report renderers take; ``*_record`` is shaped to be passed as the ``row_fn``
+of ``stream_csv_report``.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import json
+from sqlalchemy import Float, Text, cast, func, select
+from app.models import db, CropIssue, YieldPrediction
+from app.utils.json_columns import json_field
+
+# Rows are fetched from the database this many at a time
+FETCH_SIZE = 1000
+
+# PDF tables keep the symptoms column short; CSV exports list all of them
+PDF_SYMPTOM_LIMIT = 3
+
+IssueRow = namedtuple('IssueRow', [
+    'farmer_id', 'id', 'crop_type', 'crop_variety', 'disease_name', 'confidence', 'symptoms',
+    'status', 'location', 'created_at', 'has_response'
+])
+
+PredictionRow = namedtuple('PredictionRow', [
+    'farmer_id', 'id', 'crop_type', 'crop_variety', 'soil_type', 'irrigation_type', 'fertilizer_type',
+    'predicted_yield', 'farm_size', 'confidence_score', 'temperature', 'rainfall', 'location', 'created_at'
+])
+
+
+# ==================== JSON COLUMNS ====================
+
+@lru_cache(maxsize=4096)
+def decode_symptoms(raw):
+    """Tuple of symptoms from the text of ``CropIssue.symptoms``; anything but a JSON list is kept as one item."""
+    if not raw:
+        return ()
+    try:
+        symptoms = json.loads(raw)
+    except ValueError:
+        return (raw[:100],)
+    if isinstance(symptoms, list):
+        return tuple(str(s) for s in symptoms)
+    return (str(symptoms)[:100],)
+
+
+# ==================== QUERIES ====================
+
+def _farmer_filter(column, farmers):
+    """``farmers`` is one farmer id or a ``SELECT`` of ids."""
+    return column == farmers if isinstance(farmers, int) else column.in_(farmers)
+
+
+def issue_rows(farmers):
+    """``IssueRow`` tuples for the farmer(s), newest first per farmer, read ``FETCH_SIZE`` at a time."""
+    result = db.session.execute(
+        select(CropIssue.farmer_id, CropIssue.id, CropIssue.crop_type, CropIssue.crop_variety,
+               json_field(CropIssue.ai_prediction, 'disease_name'),
+               json_field(CropIssue.ai_prediction, 'confidence', Float),
+               cast(CropIssue.symptoms, Text), CropIssue.status, CropIssue.location,
+               CropIssue.created_at, func.length(CropIssue.expert_response) > 0)
+        .where(_farmer_filter(CropIssue.farmer_id, farmers))
+        .order_by(CropIssue.farmer_id, CropIssue.created_at.desc()),
+        execution_options={'yield_per': FETCH_SIZE}
+    )
+    for (farmer_id, issue_id, crop_type, crop_variety, disease_name, confidence, symptoms,
+         status, location, created_at, has_response) in result:
+        yield IssueRow(farmer_id, issue_id, crop_type, crop_variety, disease_name, confidence or None,
+                       decode_symptoms(symptoms), status, location, created_at, bool(has_response))
+
+
+def prediction_rows(farmers):
+    """``PredictionRow`` tuples for the farmer(s), newest first per farmer, read ``FETCH_SIZE`` at a time."""
+    result = db.session.execute(
+        select(YieldPrediction.farmer_id, YieldPrediction.id, YieldPrediction.crop_type,
+               YieldPrediction.crop_variety, YieldPrediction.soil_type, YieldPrediction.irrigation_type,
+               YieldPrediction.fertilizer_type, YieldPrediction.predicted_yield, YieldPrediction.farm_size,
+               YieldPrediction.confidence_score, YieldPrediction.temperature, YieldPrediction.rainfall,
+               YieldPrediction.location, YieldPrediction.created_at)
+        .where(_farmer_filter(YieldPrediction.farmer_id, farmers))
+        .order_by(YieldPrediction.farmer_id, YieldPrediction.created_at.desc()),
+        execution_options={'yield_per': FETCH_SIZE}
+    )
+    for row in result:
+        yield PredictionRow(*row)
+
+
+# ==================== REPORT RECORDS ====================
+
+def disease_history_record(row, symptom_limit=None):
+    """Report dict for an ``IssueRow``; the PDF lists at most ``symptom_limit`` symptoms."""
+    symptoms = row.symptoms
+    if symptom_limit and len(symptoms) > symptom_limit:
+        symptoms_text = ', '.join(symptoms[:symptom_limit]) + '...'
+    else:
+        symptoms_text = ', '.join(symptoms) or 'N/A'
+    return {
+        'ID': row.id,
+        'Crop Type': row.crop_type,
+        'Crop Variety': row.crop_variety or 'N/A',
+        'Disease Predicted': row.disease_name or 'N/A',
+        'Confidence': f"{row.confidence * 100:.1f}%" if row.confidence else 'N/A',
+        'Symptoms': symptoms_text,
+        'Status': row.status.title(),
+        'Location': row.location or 'N/A',
+        'Date': row.created_at.strftime('%Y-%m-%d'),
+        'Expert Response': 'Yes' if row.has_response else 'No'
+    }
+
+
+def disease_history_summary(rows):
+    statuses = [row.status for row in rows]
+    return {
+        'Total Issues': len(rows),
+        'Pending': statuses.count('pending'),
+        'Reviewed': statuses.count('reviewed'),
+        'Resolved': statuses.count('resolved')
+    }
+
+
+def yield_prediction_record(row):
+    """Report dict for a ``PredictionRow``."""
+    total_yield = (row.predicted_yield * row.farm_size) if row.predicted_yield else 0
+    return {
+        'ID': row.id,
+        'Crop Type': row.crop_type,
+        'Crop Variety': row.crop_variety or 'N/A',
+        'Soil Type': row.soil_type,
+        'Irrigation': row.irrigation_type,
+        'Fertilizer': row.fertilizer_type,
+        'Yield/Acre (tons)': f"{row.predicted_yield:.2f}" if row.predicted_yield else 'N/A',
+        'Farm Size (acres)': f"{row.farm_size:.2f}",
+        'Total Yield (tons)': f"{total_yield:.2f}" if row.predicted_yield else 'N/A',
+        'Confidence': f"{row.confidence_score * 100:.1f}%" if row.confidence_score else 'N/A',
+        'Temperature (°C)': f"{row.temperature:.1f}" if row.temperature else 'N/A',
+        'Rainfall (mm)': f"{row.rainfall:.1f}" if row.rainfall else 'N/A',
+        'Location': row.location,
+        'Date': row.created_at.strftime('%Y-%m-%d')
+    }
+
+
+def yield_predictions_summary(rows):
+    yields = [row.predicted_yield for row in rows if row.predicted_yield]
+    return {
+        'Total Predictions': len(rows),
+        'Average Yield/Acre': f"{sum(yields) / len(yields):.2f} tons" if yields else 'N/A',
+        'Total Farm Area': f"{sum(row.farm_size for row in rows):.2f} acres"
+    }
+
+
+def disease_history_report(rows):
+    """``(data, summary)`` for the disease history PDF."""
+    return [disease_history_record(row, PDF_SYMPTOM_LIMIT) for row in rows], disease_history_summary(rows)
+
+
+def yield_predictions_report(rows):
+    """``(data, summary)`` for the yield predictions PDF."""
+    return [yield_prediction_record(row) for row in rows], yield_predictions_summary(rows)
@@ -0,0 +1,201 @@
+# Background Report Jobs
+"""
+Large reports (admin region-wise and users PDFs) are built on a local worker
+pool instead of inside the request, and the finished file is kept on disk.
+
+A job id is the artifact key: a hash of the report type, its parameters and
+the data stamp of the tables the report reads (``StatsCache.stamp``). Asking
+for the same report again while those tables are unchanged returns the same
+job - queued, running or finished - so each report is built once per data
+version. Job state lives in a JSON file next to the artifact, so any worker
+process can answer status requests and serve the file.
+
+Artifacts older than ``REPORT_RETENTION_HOURS`` are pruned when new jobs are
+queued.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from app.utils.cache import stats_cache
+
+# Queued/running jobs not updated for this long are assumed lost (worker restart) and run again
+STALE_JOB_SECONDS = 15 * 60
+
+# A failed job is retried by the next request for it after this long
+FAILED_RETRY_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class ReportType:
+    name: str
+    build: object
+    tables: tuple
+    filename: str
+    mimetype: str = 'application/pdf'
+
+    @property
+    def extension(self):
+        return self.filename.rsplit('.', 1)[-1]
+
+
+class ReportJobs:
+    """
+    Registry and worker pool for background reports::
+
+        @report_jobs.report('admin_users', tables=('users',), filename='users_report_{date}.pdf')
+        def build_users_report():
+            return generate_pdf_report(...)
+
+        job_id = report_jobs.submit('admin_users')
+        report_jobs.status(job_id)['status']   # queued, running, done or failed
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.folder = None
+        self.workers = 2
+        self.retention = 24 * 3600
+        self.types = {}
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = Path(app.config['REPORT_FOLDER'])
+        self.workers = app.config.get('REPORT_WORKERS', 2)
+        self.retention = app.config.get('REPORT_RETENTION_HOURS', 24) * 3600
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reports')
+            return self._executor
+
+    # ==================== REGISTRY ====================
+
+    def report(self, name, tables, filename, mimetype='application/pdf'):
+        """Register the decorated function as the builder of report ``name``; it returns a file object."""
+        def decorator(build):
+            self.types[name] = ReportType(name, build, tuple(tables), filename, mimetype)
+            stats_cache.watch(*tables)
+            return build
+        return decorator
+
+    def job_id(self, name, params=None):
+        """Artifact key of report ``name`` with ``params`` at the current data version."""
+        report = self.types[name]
+        payload = json.dumps({'report': name, 'params': params or {}, 'data': stats_cache.stamp(report.tables)},
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    # ==================== JOBS ====================
+
+    def submit(self, name, **params):
+        """Queue report ``name`` unless a job for the current data already exists. Returns the job id."""
+        job_id = self.job_id(name, params)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            state = self.status(job_id)
+            if state is not None and not self._needs_run(job_id, state):
+                return job_id
+            self._write_state(job_id, report=name, params=params, status='queued', error=None,
+                              created_at=time.time())
+        future = self._pool().submit(self._run, job_id, name, params)
+        with self._lock:
+            self._pending[job_id] = future
+        future.add_done_callback(lambda _: self._discard(job_id))
+        self.prune()
+        return job_id
+
+    def _needs_run(self, job_id, state):
+        if state['status'] == 'failed':
+            return time.time() - state['updated_at'] > FAILED_RETRY_SECONDS
+        if state['status'] == 'done':
+            return not self.artifact_path(job_id).exists()
+        # Queued or running here, or recently in another worker process
+        return job_id not in self._pending and time.time() - state['updated_at'] > STALE_JOB_SECONDS
+
+    def _discard(self, job_id):
+        with self._lock:
+            self._pending.pop(job_id, None)
+
+    def _run(self, job_id, name, params):
+        report = self.types[name]
+        with self.app.app_context():
+            self._write_state(job_id, status='running')
+            try:
+                output = report.build(**params)
+                fd, tmp_name = tempfile.mkstemp(dir=self.folder, suffix='.part')
+                with os.fdopen(fd, 'wb') as tmp:
+                    shutil.copyfileobj(output, tmp)
+                output.close()
+                os.replace(tmp_name, self.artifact_path(job_id))
+                self._write_state(job_id, status='done')
+            except Exception as e:
+                print(f"WARNING: Report job {name} ({job_id}) failed: {e}", file=sys.stderr, flush=True)
+                self._write_state(job_id, status='failed', error=str(e))
+
+    def wait(self, timeout=None):
+        """Block until queued jobs finish (scripts and tests)."""
+        with self._lock:
+            pending = list(self._pending.values())
+        wait(pending, timeout=timeout)
+
+    # ==================== STATE AND ARTIFACTS ====================
+
+    def _state_path(self, job_id):
+        return self.folder / f'{job_id}.json'
+
+    def artifact_path(self, job_id):
+        state = self.status(job_id)
+        extension = self.types[state['report']].extension if state and state['report'] in self.types else 'pdf'
+        return self.folder / f'{job_id}.{extension}'
+
+    def status(self, job_id):
+        """Job state (``report``, ``params``, ``status``, ``error``, timestamps) or ``None`` for unknown ids."""
+        if not job_id.isalnum():
+            return None
+        try:
+            return json.loads(self._state_path(job_id).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, job_id, **changes):
+        state = self.status(job_id) or {}
+        state.update(changes, updated_at=time.time())
+        fd, tmp_name = tempfile.mkstemp(dir=self.folder, suffix='.state')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(state, tmp)
+        os.replace(tmp_name, self._state_path(job_id))
+
+    def download_name(self, job_id):
+        state = self.status(job_id)
+        return self.types[state['report']].filename.format(date=datetime.now().strftime('%Y%m%d'))
+
+    def mimetype(self, job_id):
+        return self.types[self.status(job_id)['report']].mimetype
+
+    def prune(self):
+        """Delete artifacts and job state older than the retention period."""
+        cutoff = time.time() - self.retention
+        for path in self.folder.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+report_jobs = ReportJobs()
@@ -2,29 +2,44 @@
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, KeepTogether
+from reportlab.platypus import (
+    BaseDocTemplate, Frame, PageTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+)
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.utils import simpleSplit
+from flask import Response, stream_with_context
+from xml.sax.saxutils import escape
+from functools import lru_cache
 from datetime import datetime
+import itertools
+import tempfile
 import csv
 import io
 
+# Rows fetched per round-trip and written per streamed chunk of a CSV export
+CSV_CHUNK_SIZE = 1000
+
 def generate_pdf_report(data, report_type, generated_by="System", subtitle=None, summary=None):
     """
     Generate PDF report with enhanced formatting
     
     Args:
-        data: List of dictionaries with report data
+        data: List (or any iterable) of dictionaries with report data
         report_type: Type of report (e.g., "Disease History", "Yield Predictions")
         generated_by: Name of person/system generating report
         subtitle: Optional subtitle
         summary: Optional summary statistics dict
+    
+    Returns:
+        Temporary file with the PDF, positioned at the start
     """
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    # Rendered straight to a temp file so large reports are not held as bytes in memory
+    output = tempfile.TemporaryFile()
     story = []
     
-    styles = getSampleStyleSheet()
+    styles = _pdf_styles()
     
     # Title Style
     title_style = ParagraphStyle(
@@ -95,66 +110,16 @@ def generate_pdf_report(data, report_type, generated_by="System", subtitle=None,
         story.append(Spacer(1, 0.2*inch))
     
     # Add data tables
-    if isinstance(data, list) and len(data) > 0:
-        if isinstance(data[0], dict):
-            # Create Paragraph style for table cells
-            normal_cell_style = ParagraphStyle(
-                'TableCell',
-                parent=styles['Normal'],
-                fontSize=9,
-                leading=11,
-                alignment=TA_LEFT
-            )
-            
-            header_cell_style = ParagraphStyle(
-                'TableHeader',
-                parent=styles['Normal'],
-                fontSize=10,
-                leading=12,
-                textColor=colors.whitesmoke,
-                fontName='Helvetica-Bold',
-                alignment=TA_CENTER
-            )
-
-            # Prepare table data with Paragraphs
-            headers = list(data[0].keys())
-            table_data = [[Paragraph(h, header_cell_style) for h in headers]]
-            
-            for row in data:
-                row_data = []
-                for h in headers:
-                    cell_text = str(row.get(h, 'N/A'))
-                    # Wrap in Paragraph for auto-wrapping
-                    row_data.append(Paragraph(cell_text, normal_cell_style))
-                table_data.append(row_data)
-            
-            # Calculate column widths
-            num_cols = len(headers)
-            # Use nearly full width (A4 width - margins)
-            # A4 width is ~595 points. Margins are 0.5 inch * 2 = 1 inch = 72 points.
-            # Available width ~ 523 points.
-            col_width = (A4[0] - 1.0*inch) / num_cols
-            col_widths = [col_width] * num_cols
-            
-            # Create table
-            table = Table(table_data, colWidths=col_widths, repeatRows=1)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a7c59')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('TOPPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-            ]))
-            
-            story.append(KeepTogether(table))
-    else:
+    rows = iter(data) if data is not None else iter(())
+    first_row = next(rows, None)
+    header_table = None
+    if isinstance(first_row, dict):
+        headers = list(first_row.keys())
+        # Use nearly full width (A4 width - margins)
+        col_width = (A4[0] - 1.0*inch) / len(headers)
+        header_table = _pdf_header_table(headers, col_width)
+        story.extend(_pdf_data_tables(header_table, headers, col_width, itertools.chain([first_row], rows)))
+    elif first_row is None:
         no_data_style = ParagraphStyle(
             'NoData',
             parent=styles['Normal'],
@@ -177,9 +142,125 @@ def generate_pdf_report(data, report_type, generated_by="System", subtitle=None,
     story.append(Paragraph(footer_text, footer_style))
     
     # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    _pdf_document(output, header_table).build(story)
+    output.seek(0)
+    return output
+
+
+def _pdf_document(output, header_table=None):
+    """
+    A4 document whose first page uses the full frame; later pages draw the
+    column header at the top and start their frame below it.
+    """
+    doc = BaseDocTemplate(output, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    header_height = header_table.wrap(A4[0], A4[1])[1] if header_table else 0
+    
+    def draw_page_header(canv, doc):
+        if header_table:
+            header_table.drawOn(canv, doc.leftMargin, A4[1] - doc.topMargin - header_height)
+    
+    doc.addPageTemplates([
+        PageTemplate('First', [Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id='first')],
+                     autoNextPageTemplate='Later'),
+        PageTemplate('Later', [Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height - header_height,
+                                     id='later')], onPage=draw_page_header),
+    ])
+    return doc
+
+
+@lru_cache(maxsize=1)
+def _pdf_styles():
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(
+        'TableHeader',
+        parent=styles['Normal'],
+        fontSize=10,
+        leading=12,
+        textColor=colors.whitesmoke,
+        fontName='Helvetica-Bold',
+        alignment=TA_CENTER
+    ))
+    return styles
+
+
+# Shared by every chunk of every report table
+PDF_HEADER_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#4a7c59')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ('TOPPADDING', (0, 0), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+])
+
+PDF_BODY_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('LEADING', (0, 0), (-1, -1), 11),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+])
+
+# Rows per table in PDF reports (about a page). Small tables keep ReportLab's
+# layout linear: a page split only ever copies the rows of one chunk.
+PDF_TABLE_CHUNK_ROWS = 40
+
+# Horizontal padding ReportLab puts inside a table cell
+_CELL_PADDING = 12
+
+
+def _pdf_header_table(headers, col_width):
+    style = _pdf_styles()['TableHeader']
+    table = Table([[Paragraph(escape(h), style) for h in headers]], colWidths=[col_width] * len(headers))
+    table.setStyle(PDF_HEADER_STYLE)
+    return table
+
+
+def _wrap_cell(text, width):
+    """
+    Break ``text`` into lines no wider than ``width`` (Helvetica 9), splitting
+    words that are too long on their own (emails, ids) by character.
+    """
+    if stringWidth(text, 'Helvetica', 9) <= width:
+        return text
+    lines = []
+    for line in simpleSplit(text, 'Helvetica', 9, width):
+        line_width = stringWidth(line, 'Helvetica', 9)
+        while len(line) > 1 and line_width > width:
+            cut = max(1, int(len(line) * width / line_width))
+            while cut > 1 and stringWidth(line[:cut], 'Helvetica', 9) > width:
+                cut -= 1
+            lines.append(line[:cut])
+            line = line[cut:]
+            line_width = stringWidth(line, 'Helvetica', 9)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _pdf_data_tables(header_table, headers, col_width, rows):
+    """
+    Yield the report table as chunks of ``PDF_TABLE_CHUNK_ROWS`` rows, the
+    first preceded by the header. Cells are plain (pre-wrapped) strings drawn
+    with the shared body style rather than one Paragraph per cell.
+    """
+    text_width = col_width - _CELL_PADDING
+    col_widths = [col_width] * len(headers)
+    
+    def cell(value):
+        return _wrap_cell(str(value), text_width)
+    
+    yield header_table
+    chunk = []
+    for row in rows:
+        chunk.append([cell(row.get(h, 'N/A')) for h in headers])
+        if len(chunk) == PDF_TABLE_CHUNK_ROWS:
+            yield Table(chunk, colWidths=col_widths, style=PDF_BODY_STYLE)
+            chunk = []
+    if chunk:
+        yield Table(chunk, colWidths=col_widths, style=PDF_BODY_STYLE)
 
 def generate_csv_report(data, report_type="Report"):
     """
@@ -195,20 +276,61 @@ def generate_csv_report(data, report_type="Report"):
     if not isinstance(data, list) or len(data) == 0:
         return "No data available"
     
+    return b''.join(iter_csv_report(data)).decode('utf-8')
+
+
+def iter_csv_report(rows, row_fn=None, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Yield a CSV report as UTF-8 encoded chunks
+    
+    Args:
+        rows: SQLAlchemy query (iterated with ``yield_per``) or any iterable
+        row_fn: Optional callable turning each item into a row dict
+        chunk_size: Rows fetched per round-trip and written per chunk
+    
+    The header goes out as soon as the first row arrives; after that at most
+    ``chunk_size`` rows are held in memory, however long the export is.
+    """
+    if hasattr(rows, 'yield_per'):
+        rows = rows.yield_per(chunk_size)
+    
     output = io.StringIO()
+    writer = None
+    pending = 0
     
-    # Write header row
-    if isinstance(data[0], dict):
-        fieldnames = list(data[0].keys())
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        # Write data rows
-        for row in data:
-            # Convert all values to strings and handle None
-            cleaned_row = {k: str(v) if v is not None else 'N/A' for k, v in row.items()}
-            writer.writerow(cleaned_row)
+    def flush():
+        chunk = output.getvalue().encode('utf-8')
+        output.seek(0)
+        output.truncate()
+        return chunk
     
-    output.seek(0)
-    return output.getvalue()
+    for item in rows:
+        row = row_fn(item) if row_fn else item
+        if writer is None:
+            writer = csv.DictWriter(output, fieldnames=list(row.keys()))
+            writer.writeheader()
+            yield flush()
+        # Convert all values to strings and handle None
+        writer.writerow({k: str(v) if v is not None else 'N/A' for k, v in row.items()})
+        pending += 1
+        if pending >= chunk_size:
+            yield flush()
+            pending = 0
+    
+    if writer is None:
+        yield b"No data available"
+    elif pending:
+        yield flush()
+
+
+def stream_csv_report(rows, filename, row_fn=None, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Streaming CSV download for ``rows`` (see ``iter_csv_report``)
+    
+    The request context stays open while the body is sent, so ``row_fn`` may
+    use ``current_user`` and lazy relationships.
+    """
+    response = Response(stream_with_context(iter_csv_report(rows, row_fn, chunk_size)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
@@ -0,0 +1,180 @@
+# Marketplace Stock Reservations
+"""
+Race-free stock handling for marketplace orders.
+
+Checkout reserves stock with a single conditional UPDATE::
+
+    UPDATE farmer_products SET quantity = quantity - :qty
+    WHERE id = :id AND is_available AND quantity >= :qty
+
+so two buyers can never both take the last units: the database serialises
+the row update and the loser sees ``rowcount == 0``. The order is created in
+the same transaction with ``reserved_until`` set.
+
+Payment flips the order from ``pending`` to ``paid`` with another
+conditional UPDATE. Orders still ``pending`` after ``reserved_until`` are
+marked ``expired`` by ``release_expired_reservations()`` and their stock is
+returned; because both paths are conditional on ``payment_status =
+'pending'``, exactly one of them wins for any order.
+"""
+from datetime import datetime, timedelta
+import sys
+import uuid
+from flask import current_app
+from sqlalchemy import update, case, inspect, text
+from app.models import db, FarmerProduct, MarketplaceOrder
+from app.utils.cache import stats_cache
+
+DEFAULT_RESERVATION_MINUTES = 15
+SWEEP_BATCH_SIZE = 200
+
+
+def reservation_window():
+    return timedelta(minutes=current_app.config.get('STOCK_RESERVATION_MINUTES', DEFAULT_RESERVATION_MINUTES))
+
+
+# ==================== STOCK ====================
+
+def reserve_stock(product_id, qty):
+    """
+    Take ``qty`` units of a listing if that many are available. A listing
+    that reaches zero is marked unavailable. Returns ``True`` on success;
+    the caller commits.
+    """
+    table = FarmerProduct.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == product_id, table.c.is_available == True, table.c.quantity >= qty)
+        .values(
+            quantity=table.c.quantity - qty,
+            is_available=case((table.c.quantity - qty <= 0, False), else_=table.c.is_available)
+        )
+    )
+    if result.rowcount != 1:
+        return False
+    stats_cache.invalidate_on_commit(FarmerProduct.__tablename__)
+    return True
+
+
+def release_stock(product_id, qty):
+    """Return ``qty`` units to a listing; one that had sold out becomes available again."""
+    table = FarmerProduct.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == product_id)
+        .values(
+            quantity=table.c.quantity + qty,
+            is_available=case((table.c.quantity <= 0, True), else_=table.c.is_available)
+        )
+    )
+    stats_cache.invalidate_on_commit(FarmerProduct.__tablename__)
+
+
+def _refresh(product):
+    if product is not None and inspect(product).persistent:
+        db.session.expire(product, ['quantity', 'is_available'])
+
+
+# ==================== ORDERS ====================
+
+def place_order(product, qty, **buyer):
+    """
+    Reserve ``qty`` of ``product`` and create a pending order holding it.
+    Returns the order, or ``None`` when there is not enough stock. The
+    caller commits (or rolls back) both together.
+    """
+    if qty is None or qty <= 0 or not reserve_stock(product.id, qty):
+        _refresh(product)
+        return None
+    order = MarketplaceOrder(
+        product_id=product.id,
+        farmer_id=product.farmer_id,
+        quantity=qty,
+        total_price=product.price_per_unit * qty,
+        payment_status='pending',
+        order_status='pending',
+        reserved_until=datetime.utcnow() + reservation_window(),
+        **buyer
+    )
+    db.session.add(order)
+    _refresh(product)
+    return order
+
+
+def confirm_payment(order):
+    """
+    Mark a pending order paid. An order whose reservation already expired
+    (or one placed before reservations existed) is paid only if its stock
+    can be reserved now. Returns ``True`` when the order is now paid, also
+    if it already was; the caller commits, or rolls back on ``False``.
+    """
+    orders = MarketplaceOrder.__table__
+    transaction_id = f"PAY-{uuid.uuid4().hex[:8].upper()}"
+
+    def mark_paid(from_status):
+        return db.session.execute(
+            update(orders)
+            .where(orders.c.id == order.id, orders.c.payment_status == from_status)
+            .values(payment_status='paid', transaction_id=transaction_id, reserved_until=None)
+        ).rowcount == 1
+
+    # Orders placed before reservations existed hold no stock yet
+    legacy = order.payment_status == 'pending' and order.reserved_until is None
+    if legacy and not reserve_stock(order.product_id, order.quantity):
+        return False
+    paid = mark_paid('pending')
+    if not paid:
+        status = db.session.query(MarketplaceOrder.payment_status).filter_by(id=order.id).scalar()
+        if legacy:
+            release_stock(order.product_id, order.quantity)
+        # A re-submitted or concurrent payment finds the order already paid
+        paid = status == 'paid' or (
+            status == 'expired' and reserve_stock(order.product_id, order.quantity) and mark_paid('expired')
+        )
+    db.session.expire(order)
+    return paid
+
+
+def release_expired_reservations(product_id=None, now=None):
+    """
+    Expire pending orders past ``reserved_until`` and give their stock back,
+    optionally only for one listing. Returns the number of orders released.
+    """
+    now = now or datetime.utcnow()
+    orders = MarketplaceOrder.__table__
+    query = db.session.query(MarketplaceOrder.id, MarketplaceOrder.product_id, MarketplaceOrder.quantity).filter(
+        MarketplaceOrder.payment_status == 'pending',
+        MarketplaceOrder.reserved_until < now
+    )
+    if product_id is not None:
+        query = query.filter(MarketplaceOrder.product_id == product_id)
+
+    released = 0
+    for order_id, order_product_id, qty in query.limit(SWEEP_BATCH_SIZE).all():
+        expired = db.session.execute(
+            update(orders)
+            .where(orders.c.id == order_id, orders.c.payment_status == 'pending')
+            .values(payment_status='expired', reserved_until=None)
+        ).rowcount == 1
+        if expired:
+            release_stock(order_product_id, qty)
+            released += 1
+    db.session.commit()
+    return released
+
+
+def ensure_reservation_column():
+    """Add ``marketplace_orders.reserved_until`` (and its index) to databases created before it existed."""
+    try:
+        columns = {c['name'] for c in inspect(db.engine).get_columns('marketplace_orders')}
+        if 'reserved_until' in columns:
+            return
+        print("INFO: Adding marketplace_orders.reserved_until", file=sys.stderr, flush=True)
+        db.session.execute(text("ALTER TABLE marketplace_orders ADD COLUMN reserved_until TIMESTAMP"))
+        db.session.commit()
+        for index in MarketplaceOrder.__table__.indexes:
+            if index.name == 'ix_marketplace_orders_reservation':
+                index.create(db.engine, checkfirst=True)
+    except Exception as e:
+        print(f"WARNING: Could not add reservation column: {e}", file=sys.stderr, flush=True)
+        db.session.rollback()
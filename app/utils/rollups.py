@@ -0,0 +1,274 @@
+# Statistics Rollup Maintenance
+"""
+Keeps the rollup tables in app/models/admin.py in step with crop issues,
+yield predictions and diagnosis reports.
+
+Changes are folded into the rollups from a session ``after_flush`` hook, so
+they are written in the same transaction as the rows they summarise.
+Diagnosis rollups are keyed by the crop type of the report's issue, so
+editing an issue's crop type moves its diagnosis counts as well. Use
+``rebuild_rollups()`` (scripts/utils/rebuild_rollups.py) to backfill or to
+repair drift after bulk SQL edits that bypass the ORM.
+"""
+from collections import defaultdict
+from datetime import datetime
+import sys
+from sqlalchemy import event, func, select, insert, delete, and_
+from sqlalchemy.orm.attributes import get_history
+from app.models import (
+    db, CropIssue, YieldPrediction, DiagnosisReport,
+    IssueRollup, RegionFarmerRollup, YieldRollup, DiseaseRollup
+)
+from app.utils.timeseries import month_bucket
+
+# Columns whose changes move a row to a different rollup key
+TRACKED_ATTRIBUTES = {
+    CropIssue: ('location', 'crop_type', 'created_at', 'farmer_id'),
+    YieldPrediction: ('location', 'crop_type', 'created_at', 'predicted_yield'),
+    DiagnosisReport: ('disease_identified', 'severity', 'crop_issue_id'),
+}
+
+
+def _key(value):
+    return value or ''
+
+
+def _month(value):
+    return (value or datetime.utcnow()).strftime('%Y-%m')
+
+
+def _value(obj, attr, old):
+    """Current attribute value, or the value before this flush when ``old``."""
+    if old:
+        history = get_history(obj, attr)
+        if history.deleted:
+            return history.deleted[0]
+    return getattr(obj, attr)
+
+
+def _changed(obj):
+    return any(get_history(obj, attr).has_changes() for attr in TRACKED_ATTRIBUTES[type(obj)])
+
+
+def _issue_crop_type(session, crop_issue_id, old=False):
+    """
+    Crop type of a diagnosis report's issue; with ``old``, the crop type it
+    had before this flush (what the report was last counted under).
+    """
+    if crop_issue_id is None:
+        return ''
+    issue = session.identity_map.get(session.identity_key(CropIssue, crop_issue_id))
+    if issue is None:
+        # Issues deleted in this flush may already be gone from the identity map and the table
+        issue = next((obj for obj in session.deleted
+                      if isinstance(obj, CropIssue) and obj.id == crop_issue_id), None)
+    if issue is not None:
+        return _key(_value(issue, 'crop_type', old))
+    crop_type = session.connection().execute(
+        select(CropIssue.crop_type).where(CropIssue.id == crop_issue_id)
+    ).scalar()
+    return _key(crop_type)
+
+
+def _move_diagnoses(session, deltas, issue, handled):
+    """
+    Move the diagnosis counts of ``issue``'s reports from its old crop type to
+    the new one. Reports in ``handled`` are part of this flush and counted by
+    ``_collect`` already.
+    """
+    old_crop, new_crop = _key(_value(issue, 'crop_type', True)), _key(issue.crop_type)
+    if old_crop == new_crop:
+        return
+    disease = func.coalesce(DiagnosisReport.disease_identified, '')
+    severity = func.coalesce(DiagnosisReport.severity, '')
+    query = select(disease, severity, func.count(DiagnosisReport.id))\
+        .where(DiagnosisReport.crop_issue_id == issue.id)
+    if handled:
+        query = query.where(DiagnosisReport.id.notin_(handled))
+    for disease_name, severity_name, count in session.connection().execute(query.group_by(disease, severity)):
+        deltas[(DiseaseRollup, (disease_name, old_crop, severity_name))]['diagnosis_count'] -= count
+        deltas[(DiseaseRollup, (disease_name, new_crop, severity_name))]['diagnosis_count'] += count
+
+
+def _collect(session, deltas, obj, sign, old=False):
+    """Add the contribution of ``obj`` (times ``sign``) to ``deltas``."""
+    if isinstance(obj, CropIssue):
+        location = _key(_value(obj, 'location', old))
+        crop_type = _key(_value(obj, 'crop_type', old))
+        month = _month(_value(obj, 'created_at', old))
+        farmer_id = _value(obj, 'farmer_id', old)
+        deltas[(IssueRollup, (location, crop_type, month))]['issue_count'] += sign
+        deltas[(RegionFarmerRollup, (location, farmer_id))]['issue_count'] += sign
+    elif isinstance(obj, YieldPrediction):
+        location = _key(_value(obj, 'location', old))
+        crop_type = _key(_value(obj, 'crop_type', old))
+        month = _month(_value(obj, 'created_at', old))
+        predicted_yield = _value(obj, 'predicted_yield', old)
+        bucket = deltas[(YieldRollup, (location, crop_type, month))]
+        bucket['prediction_count'] += sign
+        if predicted_yield is not None:
+            bucket['yield_sum'] += sign * predicted_yield
+            bucket['yield_count'] += sign
+    elif isinstance(obj, DiagnosisReport):
+        disease = _key(_value(obj, 'disease_identified', old))
+        severity = _key(_value(obj, 'severity', old))
+        crop_type = _issue_crop_type(session, _value(obj, 'crop_issue_id', old), old)
+        deltas[(DiseaseRollup, (disease, crop_type, severity))]['diagnosis_count'] += sign
+
+
+ROLLUP_KEYS = {
+    IssueRollup: ('location', 'crop_type', 'month'),
+    RegionFarmerRollup: ('location', 'farmer_id'),
+    YieldRollup: ('location', 'crop_type', 'month'),
+    DiseaseRollup: ('disease', 'crop_type', 'severity'),
+}
+
+# Column whose value drops to zero once a rollup key has no source rows left
+ROLLUP_COUNTERS = {
+    IssueRollup: 'issue_count',
+    RegionFarmerRollup: 'issue_count',
+    YieldRollup: 'prediction_count',
+    DiseaseRollup: 'diagnosis_count',
+}
+
+
+def _apply_delta(connection, model, key_values, changes):
+    """Add ``changes`` to the rollup row identified by ``key_values``, creating it if needed."""
+    table = model.__table__
+    key = dict(zip(ROLLUP_KEYS[model], key_values))
+    dialect = connection.dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(table).values(**key, **changes)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={col: table.c[col] + stmt.excluded[col] for col in changes}
+        )
+        connection.execute(stmt)
+    else:
+        where = and_(*[table.c[col] == val for col, val in key.items()])
+        result = connection.execute(
+            table.update().where(where).values({col: table.c[col] + val for col, val in changes.items()})
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**key, **changes))
+
+    if any(val < 0 for val in changes.values()):
+        where = and_(*[table.c[col] == val for col, val in key.items()])
+        connection.execute(delete(table).where(where, table.c[ROLLUP_COUNTERS[model]] <= 0))
+
+
+def _after_flush(session, flush_context):
+    deltas = defaultdict(lambda: defaultdict(int))
+
+    for obj in session.new:
+        if type(obj) in TRACKED_ATTRIBUTES:
+            _collect(session, deltas, obj, 1)
+    for obj in session.dirty:
+        if type(obj) in TRACKED_ATTRIBUTES and _changed(obj):
+            _collect(session, deltas, obj, -1, old=True)
+            _collect(session, deltas, obj, 1)
+    for obj in session.deleted:
+        if type(obj) in TRACKED_ATTRIBUTES:
+            _collect(session, deltas, obj, -1, old=True)
+
+    # Diagnosis rollups are keyed by the issue's crop type: a changed crop type
+    # moves the counts of reports that are not part of this flush
+    moved = [obj for obj in session.dirty
+             if isinstance(obj, CropIssue) and get_history(obj, 'crop_type').has_changes()]
+    if moved:
+        handled = [obj.id for obj in session.new | session.deleted
+                   if isinstance(obj, DiagnosisReport)]
+        handled += [obj.id for obj in session.dirty if isinstance(obj, DiagnosisReport) and _changed(obj)]
+        for issue in moved:
+            _move_diagnoses(session, deltas, issue, handled)
+
+    if not deltas:
+        return
+
+    connection = session.connection()
+    for (model, key_values), changes in deltas.items():
+        changes = {col: val for col, val in changes.items() if val}
+        if changes:
+            _apply_delta(connection, model, key_values, changes)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def register_rollup_listeners():
+    """Attach the rollup maintenance hook to the application session (idempotent)."""
+    if event.contains(db.session, 'after_flush', _after_flush):
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    # Load the previous value on assignment so expired rows still report
+    # which rollup key they are leaving
+    for model, attrs in TRACKED_ATTRIBUTES.items():
+        for attr in attrs:
+            event.listen(getattr(model, attr), 'set', _load_old_value, active_history=True, retval=True)
+
+
+def rebuild_rollups():
+    """Recompute every rollup table from the source tables in one transaction."""
+    for model in ROLLUP_KEYS:
+        db.session.execute(delete(model))
+
+    issue_location = func.coalesce(CropIssue.location, '')
+    issue_crop = func.coalesce(CropIssue.crop_type, '')
+    issue_month = month_bucket(CropIssue.created_at)
+    db.session.execute(insert(IssueRollup).from_select(
+        ['location', 'crop_type', 'month', 'issue_count'],
+        select(issue_location, issue_crop, issue_month, func.count(CropIssue.id))
+        .group_by(issue_location, issue_crop, issue_month)
+    ))
+
+    db.session.execute(insert(RegionFarmerRollup).from_select(
+        ['location', 'farmer_id', 'issue_count'],
+        select(issue_location, CropIssue.farmer_id, func.count(CropIssue.id))
+        .group_by(issue_location, CropIssue.farmer_id)
+    ))
+
+    yield_location = func.coalesce(YieldPrediction.location, '')
+    yield_crop = func.coalesce(YieldPrediction.crop_type, '')
+    yield_month = month_bucket(YieldPrediction.created_at)
+    db.session.execute(insert(YieldRollup).from_select(
+        ['location', 'crop_type', 'month', 'prediction_count', 'yield_sum', 'yield_count'],
+        select(
+            yield_location, yield_crop, yield_month,
+            func.count(YieldPrediction.id),
+            func.coalesce(func.sum(YieldPrediction.predicted_yield), 0.0),
+            func.count(YieldPrediction.predicted_yield)
+        ).group_by(yield_location, yield_crop, yield_month)
+    ))
+
+    disease = func.coalesce(DiagnosisReport.disease_identified, '')
+    disease_crop = func.coalesce(CropIssue.crop_type, '')
+    severity = func.coalesce(DiagnosisReport.severity, '')
+    db.session.execute(insert(DiseaseRollup).from_select(
+        ['disease', 'crop_type', 'severity', 'diagnosis_count'],
+        select(disease, disease_crop, severity, func.count(DiagnosisReport.id))
+        .select_from(DiagnosisReport)
+        .outerjoin(CropIssue, CropIssue.id == DiagnosisReport.crop_issue_id)
+        .group_by(disease, disease_crop, severity)
+    ))
+
+    db.session.commit()
+
+
+def ensure_rollups_populated():
+    """Backfill the rollups on startup when they are empty but source data exists."""
+    try:
+        has_rollups = db.session.query(IssueRollup.id).first() or db.session.query(YieldRollup.id).first() \
+            or db.session.query(DiseaseRollup.id).first()
+        has_data = db.session.query(CropIssue.id).first() or db.session.query(YieldPrediction.id).first()
+        if has_data and not has_rollups:
+            print("INFO: Backfilling statistics rollups...", file=sys.stderr, flush=True)
+            rebuild_rollups()
+    except Exception as e:
+        print(f"WARNING: Could not backfill statistics rollups: {e}", file=sys.stderr, flush=True)
+        db.session.rollback()
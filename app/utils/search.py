@@ -0,0 +1,205 @@
+# Marketplace Product Search
+"""
+Full-text search over marketplace listings (name, category, location and
+description) with ranking, prefix matching and a typo fallback.
+
+* SQLite: an external-content FTS5 table ``farmer_products_fts`` kept in
+  sync by triggers on ``farmer_products``, ranked with bm25(). When nothing
+  matches, each word is replaced by its closest indexed term (fts5vocab).
+* PostgreSQL: a generated ``search_vector`` tsvector column with a GIN
+  index, ranked with ts_rank(); the fallback is a pg_trgm similarity match
+  on the product name.
+* Anything else, or SQLite builds without FTS5: ILIKE over the same columns.
+
+``ensure_search_index()`` creates the index on startup; ``search_products()``
+applies a search term to a ``FarmerProduct`` query.
+"""
+import difflib
+import re
+import sys
+from flask import current_app
+from sqlalchemy import text, func, or_, literal_column, Integer, Float
+from app.models import db, FarmerProduct
+
+FTS5 = 'fts5'
+TSVECTOR = 'tsvector'
+LIKE = 'like'
+
+# Words per query that are matched; anything past this is ignored
+MAX_TERMS = 8
+
+# bm25() column weights: product_name, description, category, location
+BM25_WEIGHTS = (10.0, 1.0, 4.0, 2.0)
+
+_SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS farmer_products_fts USING fts5(
+        product_name, description, category, location,
+        content='farmer_products', content_rowid='id',
+        tokenize='porter unicode61', prefix='2 3')""",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS farmer_products_fts_vocab USING fts5vocab(farmer_products_fts, 'row')",
+    """CREATE TRIGGER IF NOT EXISTS farmer_products_fts_ai AFTER INSERT ON farmer_products BEGIN
+        INSERT INTO farmer_products_fts(rowid, product_name, description, category, location)
+        VALUES (new.id, new.product_name, new.description, new.category, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS farmer_products_fts_ad AFTER DELETE ON farmer_products BEGIN
+        INSERT INTO farmer_products_fts(farmer_products_fts, rowid, product_name, description, category, location)
+        VALUES ('delete', old.id, old.product_name, old.description, old.category, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS farmer_products_fts_au
+    AFTER UPDATE OF product_name, description, category, location ON farmer_products BEGIN
+        INSERT INTO farmer_products_fts(farmer_products_fts, rowid, product_name, description, category, location)
+        VALUES ('delete', old.id, old.product_name, old.description, old.category, old.location);
+        INSERT INTO farmer_products_fts(rowid, product_name, description, category, location)
+        VALUES (new.id, new.product_name, new.description, new.category, new.location);
+    END""",
+)
+
+_POSTGRES_DDL = (
+    """ALTER TABLE farmer_products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(product_name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(location, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'D')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_farmer_products_search ON farmer_products USING GIN (search_vector)",
+)
+
+_POSTGRES_TRIGRAM_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_farmer_products_name_trgm ON farmer_products USING GIN (product_name gin_trgm_ops)",
+)
+
+
+def _settings():
+    return current_app.extensions.setdefault('product_search', {'backend': LIKE, 'trigram': False})
+
+
+def search_terms(term):
+    """Lower-cased words of a user query, punctuation and FTS syntax removed."""
+    return re.findall(r'\w+', (term or '').lower())[:MAX_TERMS]
+
+
+# ==================== INDEX MAINTENANCE ====================
+
+def rebuild_search_index():
+    """Re-index every listing from ``farmer_products`` (SQLite only; PostgreSQL is generated)."""
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text("INSERT INTO farmer_products_fts(farmer_products_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+
+def ensure_search_index():
+    """Create the search index and its sync triggers if they are missing."""
+    settings = _settings()
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'sqlite':
+            existed = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'farmer_products_fts'")).first() is not None
+            for ddl in _SQLITE_DDL:
+                db.session.execute(text(ddl))
+            db.session.commit()
+            if not existed and db.session.query(FarmerProduct.id).first() is not None:
+                print("INFO: Building marketplace search index...", file=sys.stderr, flush=True)
+                rebuild_search_index()
+            settings['backend'] = FTS5
+        elif dialect == 'postgresql':
+            for ddl in _POSTGRES_DDL:
+                db.session.execute(text(ddl))
+            db.session.commit()
+            settings['backend'] = TSVECTOR
+            try:
+                for ddl in _POSTGRES_TRIGRAM_DDL:
+                    db.session.execute(text(ddl))
+                db.session.commit()
+                settings['trigram'] = True
+            except Exception as e:
+                db.session.rollback()
+                print(f"WARNING: pg_trgm unavailable, typo tolerance disabled: {e}", file=sys.stderr, flush=True)
+    except Exception as e:
+        db.session.rollback()
+        settings['backend'] = LIKE
+        print(f"WARNING: Could not create marketplace search index, using LIKE: {e}", file=sys.stderr, flush=True)
+
+
+# ==================== QUERYING ====================
+
+def _fts5_match(words):
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _fts5_has_hits(match):
+    return db.session.execute(text(
+        "SELECT 1 FROM farmer_products_fts WHERE farmer_products_fts MATCH :match LIMIT 1"
+    ), {'match': match}).first() is not None
+
+
+def _fts5_correct(words):
+    """Replace each word by the closest indexed term starting with the same letter."""
+    corrected = []
+    for word in words:
+        candidates = [row[0] for row in db.session.execute(text(
+            "SELECT term FROM farmer_products_fts_vocab WHERE term >= :lo AND term < :hi"
+        ), {'lo': word[0], 'hi': chr(ord(word[0]) + 1)})]
+        match = difflib.get_close_matches(word, candidates, n=1, cutoff=0.7)
+        corrected.append(match[0] if match else word)
+    return corrected
+
+
+def _search_fts5(query, words):
+    match = _fts5_match(words)
+    corrected = None
+    if not _fts5_has_hits(match):
+        fixed = _fts5_correct(words)
+        if fixed != words:
+            match, corrected = _fts5_match(fixed), ' '.join(fixed)
+
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    hits = text(
+        f"SELECT rowid AS product_id, bm25(farmer_products_fts, {weights}) AS rank "
+        "FROM farmer_products_fts WHERE farmer_products_fts MATCH :match"
+    ).bindparams(match=match).columns(product_id=Integer, rank=Float).subquery('hits')
+    query = query.join(hits, hits.c.product_id == FarmerProduct.id)\
+                 .order_by(hits.c.rank, FarmerProduct.created_at.desc())
+    return query, corrected
+
+
+def _search_tsvector(query, words):
+    vector = literal_column('farmer_products.search_vector')
+    tsquery = func.to_tsquery('english', ' & '.join(f'{word}:*' for word in words))
+    matched = vector.op('@@')(tsquery)
+
+    has_hits = db.session.query(FarmerProduct.id).filter(matched).limit(1).first() is not None
+    if not has_hits and _settings()['trigram']:
+        phrase = ' '.join(words)
+        similar = FarmerProduct.product_name.op('%')(phrase)
+        return query.filter(similar).order_by(func.similarity(FarmerProduct.product_name, phrase).desc(),
+                                              FarmerProduct.created_at.desc()), None
+
+    return query.filter(matched).order_by(func.ts_rank(vector, tsquery).desc(),
+                                          FarmerProduct.created_at.desc()), None
+
+
+def _search_like(query, words):
+    columns = (FarmerProduct.product_name, FarmerProduct.description, FarmerProduct.category, FarmerProduct.location)
+    for word in words:
+        query = query.filter(or_(*[column.ilike(f'%{word}%') for column in columns]))
+    return query.order_by(FarmerProduct.created_at.desc()), None
+
+
+def search_products(query, term):
+    """
+    Restrict a ``FarmerProduct`` query to listings matching ``term``, best
+    match first. Returns ``(query, corrected)`` where ``corrected`` is the
+    spelling actually searched when the typo fallback rewrote the term.
+    """
+    words = search_terms(term)
+    if not words:
+        return query.order_by(FarmerProduct.created_at.desc()), None
+    backend = _settings()['backend']
+    if backend == FTS5:
+        return _search_fts5(query, words)
+    if backend == TSVECTOR:
+        return _search_tsvector(query, words)
+    return _search_like(query, words)
@@ -0,0 +1,301 @@
+# Aggregate Statistics Utilities
+from dataclasses import dataclass, field
+from sqlalchemy import Float, func, desc, case, select, true
+from app.models import (
+    db, User, CropIssue, YieldPrediction, DiagnosisReport, ProductRequest,
+    IssueRollup, RegionFarmerRollup, YieldRollup, DiseaseRollup
+)
+from app.utils.cache import stats_cache
+from app.utils.json_columns import json_field
+from app.utils.timeseries import last_months, zero_fill
+
+# Weights used to average diagnosis severity
+SEVERITY_WEIGHTS = {'Critical': 4, 'High': 3, 'Medium': 2, 'Low': 1}
+
+
+def _count_where(condition):
+    """Conditional COUNT that works on every backend (SUM(CASE ...))."""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+@dataclass
+class SystemTotals:
+    """System-wide counters shared by the admin dashboard and system reports."""
+    total_farmers: int = 0
+    total_experts: int = 0
+    total_officers: int = 0
+    active_users: int = 0
+    total_issues: int = 0
+    pending_issues: int = 0
+    resolved_issues: int = 0
+    total_yield_predictions: int = 0
+    avg_yield: float = 0
+    total_diagnoses: int = 0
+    total_product_requests: int = 0
+    pending_requests: int = 0
+
+    def as_report_rows(self):
+        """Rows used by the system PDF/CSV reports."""
+        return [
+            {'Category': 'Total Farmers', 'Value': self.total_farmers},
+            {'Category': 'Total Experts', 'Value': self.total_experts},
+            {'Category': 'Total Officers', 'Value': self.total_officers},
+            {'Category': 'Total Crop Issues', 'Value': self.total_issues},
+            {'Category': 'Total Yield Predictions', 'Value': self.total_yield_predictions},
+            {'Category': 'Total Diagnoses', 'Value': self.total_diagnoses}
+        ]
+
+
+@dataclass
+class DashboardStats:
+    """Everything rendered by the admin dashboard."""
+    totals: SystemTotals
+    region_stats: dict = field(default_factory=dict)
+    disease_frequency: dict = field(default_factory=dict)
+    crop_distribution: dict = field(default_factory=dict)
+    monthly_issues: dict = field(default_factory=dict)
+
+    def template_context(self):
+        """Flatten into the keyword arguments expected by admin/dashboard.html."""
+        context = dict(vars(self.totals))
+        context.update(
+            region_stats=self.region_stats,
+            disease_frequency=self.disease_frequency,
+            crop_distribution=self.crop_distribution,
+            monthly_issues=self.monthly_issues
+        )
+        return context
+
+
+def load_system_totals():
+    """
+    Compute all system counters in a single round-trip.
+
+    Each table is reduced to one row with conditional aggregation and the
+    one-row results are cross joined, so the database scans every table once.
+    """
+    users = select(
+        _count_where(User.role == 'farmer').label('total_farmers'),
+        _count_where(User.role == 'expert').label('total_experts'),
+        _count_where(User.role == 'krishi_bhavan_officer').label('total_officers'),
+        _count_where(User.is_active == True).label('active_users')
+    ).subquery('user_totals')
+
+    issues = select(
+        func.count(CropIssue.id).label('total_issues'),
+        _count_where(CropIssue.status == 'pending').label('pending_issues'),
+        _count_where(CropIssue.status == 'resolved').label('resolved_issues')
+    ).subquery('issue_totals')
+
+    yields = select(
+        func.count(YieldPrediction.id).label('total_yield_predictions'),
+        func.avg(YieldPrediction.predicted_yield).label('avg_yield')
+    ).subquery('yield_totals')
+
+    diagnoses = select(
+        func.count(DiagnosisReport.id).label('total_diagnoses')
+    ).subquery('diagnosis_totals')
+
+    product_requests = select(
+        func.count(ProductRequest.id).label('total_product_requests'),
+        _count_where(ProductRequest.status == 'pending').label('pending_requests')
+    ).subquery('request_totals')
+
+    stmt = select(users, issues, yields, diagnoses, product_requests).select_from(
+        users.join(issues, true())
+             .join(yields, true())
+             .join(diagnoses, true())
+             .join(product_requests, true())
+    )
+    row = db.session.execute(stmt).mappings().one()
+
+    values = {k: int(v or 0) for k, v in row.items() if k != 'avg_yield'}
+    values['avg_yield'] = round(row['avg_yield'], 2) if row['avg_yield'] else 0
+    return SystemTotals(**values)
+
+
+def load_dashboard_stats():
+    """Load the admin dashboard: one totals query plus four rollup queries."""
+    totals = load_system_totals()
+
+    issue_total = func.sum(IssueRollup.issue_count)
+
+    # Region statistics
+    region_stats = db.session.query(IssueRollup.location, issue_total)\
+        .filter(IssueRollup.location != '')\
+        .group_by(IssueRollup.location)\
+        .order_by(desc(issue_total))\
+        .limit(10).all()
+
+    # Disease frequency
+    diagnosis_total = func.sum(DiseaseRollup.diagnosis_count)
+    disease_frequency = db.session.query(DiseaseRollup.disease, diagnosis_total)\
+        .filter(DiseaseRollup.disease != '')\
+        .group_by(DiseaseRollup.disease)\
+        .order_by(desc(diagnosis_total))\
+        .limit(10).all()
+
+    # Crop type distribution
+    crop_distribution = db.session.query(IssueRollup.crop_type, issue_total)\
+        .group_by(IssueRollup.crop_type).all()
+
+    # Monthly trends (last 6 months, zero-filled from the precomputed month column)
+    monthly_issues = db.session.query(IssueRollup.month, issue_total)\
+        .filter(IssueRollup.month.in_(last_months(6)))\
+        .group_by(IssueRollup.month).all()
+
+    return DashboardStats(
+        totals=totals,
+        region_stats=dict(region_stats),
+        disease_frequency=dict(disease_frequency),
+        crop_distribution=dict(crop_distribution),
+        monthly_issues=zero_fill(monthly_issues, 6)
+    )
+
+
+# ==================== ROLLUP READERS ====================
+# These read O(#groups) rows from the rollup tables maintained by
+# app/utils/rollups.py instead of scanning the source tables.
+
+def _avg_yield():
+    return (func.sum(YieldRollup.yield_sum) / func.nullif(func.sum(YieldRollup.yield_count), 0))
+
+
+def region_issue_stats():
+    """Issues and distinct farmers per region, busiest region first."""
+    issues = db.session.query(
+        IssueRollup.location.label('location'),
+        func.sum(IssueRollup.issue_count).label('total_issues')
+    ).filter(IssueRollup.location != '')\
+     .group_by(IssueRollup.location).subquery()
+
+    farmers = db.session.query(
+        RegionFarmerRollup.location.label('location'),
+        func.count(RegionFarmerRollup.farmer_id).label('farmers_count')
+    ).filter(RegionFarmerRollup.location != '', RegionFarmerRollup.issue_count > 0)\
+     .group_by(RegionFarmerRollup.location).subquery()
+
+    return db.session.query(
+        issues.c.location,
+        issues.c.total_issues,
+        func.coalesce(farmers.c.farmers_count, 0).label('farmers_count')
+    ).outerjoin(farmers, farmers.c.location == issues.c.location)\
+     .order_by(desc(issues.c.total_issues)).all()
+
+
+def region_yield_stats():
+    """Average predicted yield and prediction count per region."""
+    return db.session.query(
+        YieldRollup.location,
+        _avg_yield().label('avg_yield'),
+        func.sum(YieldRollup.prediction_count).label('prediction_count')
+    ).group_by(YieldRollup.location)\
+     .order_by(desc('avg_yield')).all()
+
+
+def disease_frequency_stats():
+    """Diagnoses per disease with the average severity weight."""
+    weight = case(
+        *[(DiseaseRollup.severity == name, value) for name, value in SEVERITY_WEIGHTS.items()],
+        else_=0
+    )
+    total = func.sum(DiseaseRollup.diagnosis_count)
+    return db.session.query(
+        DiseaseRollup.disease.label('disease_identified'),
+        total.label('count'),
+        (func.sum(DiseaseRollup.diagnosis_count * weight) * 1.0 / total).label('avg_severity')
+    ).filter(DiseaseRollup.disease != '')\
+     .group_by(DiseaseRollup.disease)\
+     .order_by(desc('count')).all()
+
+
+def disease_by_crop_stats():
+    """(crop_type, disease, count) rows, most frequent first."""
+    total = func.sum(DiseaseRollup.diagnosis_count)
+    return db.session.query(
+        DiseaseRollup.crop_type,
+        DiseaseRollup.disease.label('disease_identified'),
+        total
+    ).filter(DiseaseRollup.disease != '')\
+     .group_by(DiseaseRollup.crop_type, DiseaseRollup.disease)\
+     .order_by(desc(total)).all()
+
+
+def yield_by_crop_stats():
+    """Average predicted yield and prediction count per crop type."""
+    return db.session.query(
+        YieldRollup.crop_type,
+        _avg_yield().label('avg_yield'),
+        func.sum(YieldRollup.prediction_count).label('count')
+    ).group_by(YieldRollup.crop_type)\
+     .order_by(desc('avg_yield')).all()
+
+
+def yield_trend_stats(months=12, end=None):
+    """``{month: (avg_yield, count)}`` for the last ``months`` months up to ``end``, oldest first, zero-filled."""
+    rows = db.session.query(
+        YieldRollup.month,
+        func.coalesce(_avg_yield(), 0),
+        func.sum(YieldRollup.prediction_count)
+    ).filter(YieldRollup.month.in_(last_months(months, end)))\
+     .group_by(YieldRollup.month).all()
+    return zero_fill(rows, months, default=(0, 0), end=end)
+
+
+# ==================== AI PREDICTIONS ====================
+
+def predicted_disease_stats(limit=10):
+    """Issues per AI-predicted disease with the average prediction confidence, most frequent first."""
+    disease = json_field(CropIssue.ai_prediction, 'disease_name')
+    count = func.count(CropIssue.id)
+    return db.session.query(
+        disease.label('disease'),
+        count.label('count'),
+        func.avg(json_field(CropIssue.ai_prediction, 'confidence', Float)).label('avg_confidence')
+    ).filter(disease.isnot(None))\
+     .group_by(disease)\
+     .order_by(desc(count))\
+     .limit(limit).all()
+
+
+# ==================== SHARED ISSUE OVERVIEW ====================
+
+# Issues change status when they are diagnosed, so both tables invalidate it
+stats_cache.watch(CropIssue.__tablename__, DiagnosisReport.__tablename__)
+
+
+@dataclass
+class IssueOverview:
+    """Global issue counters shown on every expert dashboard."""
+    total_issues: int = 0
+    pending_issues: int = 0
+    issues_by_status: dict = field(default_factory=dict)
+    issues_by_crop: dict = field(default_factory=dict)
+
+
+def load_issue_overview(top_crops=5):
+    """Compute the issue overview from one GROUP BY (status, crop_type) query."""
+    rows = db.session.query(
+        CropIssue.status, CropIssue.crop_type, func.count(CropIssue.id)
+    ).group_by(CropIssue.status, CropIssue.crop_type).all()
+
+    by_status, by_crop = {}, {}
+    for status, crop_type, count in rows:
+        by_status[status] = by_status.get(status, 0) + count
+        by_crop[crop_type] = by_crop.get(crop_type, 0) + count
+
+    top = sorted(by_crop.items(), key=lambda item: item[1], reverse=True)[:top_crops]
+    return IssueOverview(
+        total_issues=sum(by_status.values()),
+        pending_issues=by_status.get('pending', 0),
+        issues_by_status=by_status,
+        issues_by_crop=dict(top)
+    )
+
+
+def cached_issue_overview():
+    """Issue overview shared by all experts until the next committed issue/diagnosis change."""
+    return stats_cache.get_or_compute(
+        'issue_overview', load_issue_overview,
+        tags=(CropIssue.__tablename__, DiagnosisReport.__tablename__)
+    )
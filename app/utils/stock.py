@@ -0,0 +1,337 @@
+# Krishi Bhavan Stock Ledger
+"""
+Stock of Krishi Bhavan products, kept as an append-only ledger.
+
+Every change goes through ``record_stock_change()``: a single conditional
+UPDATE::
+
+    UPDATE products SET stock_quantity = stock_quantity + :change
+    WHERE id = :id AND stock_quantity + :change >= 0
+
+applies it atomically (concurrent officers cannot overwrite each other's
+changes), and a ``ProductStockHistory`` row records it in the same
+transaction. A change may carry an idempotency key: submitting the same key
+again returns the original entry instead of applying the change twice.
+
+``ProductStockSnapshot`` rows hold every product's stock at a point in time
+(``take_stock_snapshot()``, run periodically by
+scripts/utils/take_stock_snapshot.py). Stock at any date is then the latest
+snapshot before it plus the ledger entries since, computed for all products
+in one query (``stock_as_of()``); ``stock_valuation()`` aggregates it by
+product type. Both use the ``(product_id, taken_at)`` and
+``(product_id, created_at)`` indexes.
+
+``apply_stock_batch()`` imports many changes at once: every row is validated
+first, then the per-product totals are applied with one ``executemany``
+UPDATE and the ledger rows bulk-inserted, all in one transaction.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+import sys
+from sqlalchemy import and_, bindparam, func, insert, inspect, literal, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Product, ProductStockHistory, ProductStockSnapshot
+from app.utils.batches import parse_int, row_result
+from app.utils.cache import stats_cache
+
+# Snapshots are computed for a cutoff this far in the past, so changes still
+# being committed when the snapshot runs are not missed
+SNAPSHOT_SETTLE_SECONDS = 60
+
+
+# ==================== CHANGES ====================
+
+def record_stock_change(product_id, quantity_change, reason, changed_by, idempotency_key=None):
+    """
+    Add ``quantity_change`` (negative to take stock out) to a product and
+    append the ledger entry. Returns the entry, or ``None`` when the change
+    would make stock negative (or the product does not exist). A repeated
+    ``idempotency_key`` returns the entry of the first change. The caller
+    commits. The change runs in a savepoint: if a concurrent request with
+    the same key wins the race, only this change is undone and the rest of
+    the caller's transaction is kept.
+    """
+    if idempotency_key:
+        existing = _entry_for_key(idempotency_key)
+        if existing is not None:
+            return existing
+
+    table = Product.__table__
+    try:
+        with db.session.begin_nested():
+            result = db.session.execute(
+                update(table)
+                .where(table.c.id == product_id, table.c.stock_quantity + quantity_change >= 0)
+                .values(stock_quantity=table.c.stock_quantity + quantity_change, updated_at=datetime.utcnow())
+            )
+            if result.rowcount != 1:
+                return None
+            # The UPDATE holds the row lock, so this is the stock our change produced
+            new_stock = db.session.execute(
+                select(table.c.stock_quantity).where(table.c.id == product_id)).scalar_one()
+
+            entry = ProductStockHistory(
+                product_id=product_id,
+                quantity_change=quantity_change,
+                previous_stock=new_stock - quantity_change,
+                new_stock=new_stock,
+                reason=reason,
+                changed_by=changed_by,
+                idempotency_key=idempotency_key
+            )
+            db.session.add(entry)
+            db.session.flush()
+    except IntegrityError:
+        # The savepoint (this UPDATE and entry) is rolled back; the caller's changes are not
+        if idempotency_key:
+            return _entry_for_key(idempotency_key)
+        raise
+
+    _stock_changed([product_id])
+    return entry
+
+
+def _entry_for_key(idempotency_key):
+    return ProductStockHistory.query.filter_by(idempotency_key=idempotency_key).first()
+
+
+def _stock_changed(product_ids):
+    """Invalidate cached stock and expire loaded products so they reload their stock."""
+    stats_cache.invalidate_on_commit(Product.__tablename__)
+    for product_id in product_ids:
+        product = db.session.identity_map.get(db.session.identity_key(Product, product_id))
+        if product is not None and inspect(product).persistent:
+            db.session.expire(product, ['stock_quantity', 'updated_at'])
+
+
+# ==================== BATCHES ====================
+
+def _validate_stock_batch(rows, default_reason):
+    """Per-row results and the ``(row, product_id, change, reason, key)`` changes that passed."""
+    keys = [str(row.get('idempotency_key') or '').strip() for row in rows]
+    product_ids = {parse_int(row.get('product_id')) for row in rows} - {None}
+    # FOR UPDATE (ignored by SQLite, which serializes writers) keeps the validated stock until commit
+    stock = dict(db.session.execute(
+        select(Product.id, Product.stock_quantity).where(Product.id.in_(product_ids)).with_for_update()
+    ).all()) if product_ids else {}
+    used = set(db.session.execute(
+        select(ProductStockHistory.idempotency_key)
+        .where(ProductStockHistory.idempotency_key.in_([key for key in keys if key]))
+    ).scalars())
+
+    results, changes = [], []
+    for number, (row, key) in enumerate(zip(rows, keys), 1):
+        product_id = parse_int(row.get('product_id'))
+        change = parse_int(row.get('quantity_change'))
+        reason = str(row.get('reason') or '').strip()[:200] or default_reason
+        if product_id not in stock:
+            results.append(row_result(number, 'error', 'Unknown product.'))
+        elif not change:
+            results.append(row_result(number, 'error', 'quantity_change must be a non-zero whole number.'))
+        elif len(key) > 64:
+            results.append(row_result(number, 'error', 'idempotency_key is longer than 64 characters.'))
+        elif key and key in used:
+            results.append(row_result(number, 'skipped', 'Already applied.', product_id=product_id))
+        elif stock[product_id] + change < 0:
+            results.append(row_result(number, 'error', f'Stock would go negative ({stock[product_id] + change}).',
+                                      product_id=product_id))
+        else:
+            stock[product_id] += change
+            if key:
+                used.add(key)
+            changes.append((number, product_id, change, reason, key or None))
+            results.append(row_result(number, 'applied', product_id=product_id))
+    return results, changes
+
+
+def apply_stock_batch(rows, changed_by, default_reason='Bulk import'):
+    """
+    Apply a batch of stock changes (dicts with ``product_id``,
+    ``quantity_change`` and optional ``reason`` and ``idempotency_key``) in
+    the current transaction. Returns ``(applied, results)``. If any row is
+    invalid nothing is applied and the valid rows are reported as skipped.
+    Rows whose idempotency key was already used are skipped. The caller
+    commits when ``applied`` is non-zero and rolls back otherwise.
+    """
+    results, changes = _validate_stock_batch(rows, default_reason)
+    if any(result['status'] == 'error' for result in results):
+        for result in results:
+            if result['status'] == 'applied':
+                result.update(status='skipped', message='Not applied: other rows have errors.')
+        return 0, results
+    if not changes:
+        return 0, results
+
+    now = datetime.utcnow()
+    totals = Counter()
+    for _, product_id, change, _, _ in changes:
+        totals[product_id] += change
+    table = Product.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('b_id'), table.c.stock_quantity + bindparam('b_change') >= 0)
+        .values(stock_quantity=table.c.stock_quantity + bindparam('b_change'), updated_at=now),
+        [{'b_id': product_id, 'b_change': total} for product_id, total in totals.items()]
+    )
+    conflict = result.supports_sane_multi_rowcount() and result.rowcount != len(totals)
+
+    if not conflict:
+        # Walk each product's changes forward from the stock before the batch
+        stock = dict(db.session.execute(select(table.c.id, table.c.stock_quantity)
+                                        .where(table.c.id.in_(totals))).all())
+        running = {product_id: stock[product_id] - total for product_id, total in totals.items()}
+        entries = []
+        for _, product_id, change, reason, key in changes:
+            entries.append({'product_id': product_id, 'quantity_change': change,
+                            'previous_stock': running[product_id], 'new_stock': running[product_id] + change,
+                            'reason': reason, 'changed_by': changed_by, 'idempotency_key': key, 'created_at': now})
+            running[product_id] += change
+        try:
+            db.session.execute(insert(ProductStockHistory), entries)
+        except IntegrityError:
+            conflict = True
+
+    if conflict:
+        db.session.rollback()
+        for result in results:
+            if result['status'] == 'applied':
+                result.update(status='error', message='Stock changed while the batch was applied; nothing was applied.')
+        return 0, results
+
+    new_stock = {number: entry['new_stock'] for (number, *_), entry in zip(changes, entries)}
+    for result in results:
+        if result['row'] in new_stock:
+            result['new_stock'] = new_stock[result['row']]
+    _stock_changed(totals)
+    return len(changes), results
+
+
+# ==================== READING ====================
+
+def last_stock_changes(until=None):
+    """
+    Subquery of ``(product_id, last_change_at)`` for every product with stock
+    history, only counting changes up to ``until`` when given.
+    """
+    query = db.session.query(
+        ProductStockHistory.product_id,
+        func.max(ProductStockHistory.created_at).label('last_change_at')
+    )
+    if until is not None:
+        query = query.filter(ProductStockHistory.created_at <= until)
+    return query.group_by(ProductStockHistory.product_id).subquery()
+
+
+def products_with_last_change(query=None, until=None):
+    """
+    ``(Product, last_change_at)`` rows from ``query`` (all products by
+    default) in a single statement; ``last_change_at`` is ``None`` for
+    products that were never changed (up to ``until``, when given).
+    """
+    last = last_stock_changes(until)
+    if query is None:
+        query = Product.query
+    return query.add_columns(last.c.last_change_at).outerjoin(last, last.c.product_id == Product.id)
+
+
+def stock_as_of_query(when):
+    """
+    ``SELECT product_id, stock_quantity`` as of ``when`` for every product
+    that existed then: the latest snapshot at or before ``when`` plus the
+    ledger entries after the snapshot up to ``when`` (all entries when there
+    is no snapshot yet).
+    """
+    latest = select(
+        ProductStockSnapshot.product_id,
+        func.max(ProductStockSnapshot.taken_at).label('taken_at')
+    ).where(ProductStockSnapshot.taken_at <= when)\
+     .group_by(ProductStockSnapshot.product_id).subquery()
+    base = select(ProductStockSnapshot.product_id, ProductStockSnapshot.taken_at, ProductStockSnapshot.stock_quantity)\
+        .join(latest, and_(latest.c.product_id == ProductStockSnapshot.product_id,
+                           latest.c.taken_at == ProductStockSnapshot.taken_at)).subquery()
+    history = ProductStockHistory.__table__
+
+    return select(
+        Product.id.label('product_id'),
+        (func.coalesce(base.c.stock_quantity, 0) + func.coalesce(func.sum(history.c.quantity_change), 0))
+        .label('stock_quantity')
+    ).select_from(Product)\
+     .outerjoin(base, base.c.product_id == Product.id)\
+     .outerjoin(history, and_(
+         history.c.product_id == Product.id,
+         history.c.created_at <= when,
+         or_(base.c.taken_at.is_(None), history.c.created_at > base.c.taken_at)
+     )).where(Product.created_at <= when)\
+     .group_by(Product.id, base.c.stock_quantity)
+
+
+def stock_as_of(when):
+    """``{product_id: stock_quantity}`` at ``when``."""
+    return dict(db.session.execute(stock_as_of_query(when)).all())
+
+
+def stock_valuation(when=None):
+    """
+    ``[(product_type, products, units, value)]`` with value as stock times
+    price, now or as of ``when``; one aggregate query.
+    """
+    if when is None:
+        stock = select(Product.id.label('product_id'), Product.stock_quantity).subquery()
+    else:
+        stock = stock_as_of_query(when).subquery()
+    return db.session.execute(
+        select(
+            Product.product_type,
+            func.count(Product.id),
+            func.coalesce(func.sum(stock.c.stock_quantity), 0),
+            func.coalesce(func.sum(stock.c.stock_quantity * func.coalesce(Product.price_per_unit, 0)), 0)
+        ).join(stock, stock.c.product_id == Product.id)
+        .group_by(Product.product_type)
+        .order_by(Product.product_type)
+    ).all()
+
+
+# ==================== SNAPSHOTS ====================
+
+def take_stock_snapshot(now=None):
+    """
+    Snapshot every product's stock. The first snapshot copies the current
+    stock; later ones are derived from the ledger at a cutoff
+    ``SNAPSHOT_SETTLE_SECONDS`` ago. Returns ``(taken_at, rows)``.
+    """
+    now = now or datetime.utcnow()
+    if db.session.query(ProductStockSnapshot.id).first() is None:
+        taken_at = now
+        source = select(Product.id, Product.stock_quantity, literal(taken_at, ProductStockSnapshot.taken_at.type))
+    else:
+        taken_at = now - timedelta(seconds=SNAPSHOT_SETTLE_SECONDS)
+        stock = stock_as_of_query(taken_at).subquery()
+        source = select(stock.c.product_id, stock.c.stock_quantity,
+                        literal(taken_at, ProductStockSnapshot.taken_at.type))\
+            .where(~select(ProductStockSnapshot.id).where(
+                ProductStockSnapshot.product_id == stock.c.product_id,
+                ProductStockSnapshot.taken_at == taken_at).exists())
+    result = db.session.execute(
+        insert(ProductStockSnapshot).from_select(['product_id', 'stock_quantity', 'taken_at'], source)
+    )
+    db.session.commit()
+    return taken_at, result.rowcount
+
+
+def ensure_stock_ledger():
+    """Add the idempotency key column to older databases and take the baseline snapshot."""
+    try:
+        columns = {c['name'] for c in inspect(db.engine).get_columns('product_stock_history')}
+        if 'idempotency_key' not in columns:
+            print("INFO: Adding product_stock_history.idempotency_key", file=sys.stderr, flush=True)
+            db.session.execute(text("ALTER TABLE product_stock_history ADD COLUMN idempotency_key VARCHAR(64)"))
+            db.session.commit()
+            for index in ProductStockHistory.__table__.indexes:
+                if index.name == 'ix_product_stock_history_idempotency_key':
+                    index.create(db.engine, checkfirst=True)
+        if db.session.query(ProductStockSnapshot.id).first() is None and db.session.query(Product.id).first():
+            print("INFO: Taking baseline stock snapshot", file=sys.stderr, flush=True)
+            take_stock_snapshot()
+    except Exception as e:
+        print(f"WARNING: Could not prepare stock ledger: {e}", file=sys.stderr, flush=True)
+        db.session.rollback()
@@ -0,0 +1,89 @@
+# Time-Series Bucketing Utilities
+"""
+Dialect-aware helpers for monthly analytics.
+
+``month_bucket()`` renders a ``'YYYY-MM'`` label on SQLite, PostgreSQL and
+MySQL. Queries filter on the raw timestamp (``column >= month_start(n)``) so
+an index on the date column can bound the scan; the bucket expression only
+appears in GROUP BY. ``zero_fill()`` turns sparse GROUP BY results into a
+dense, oldest-first series with one entry per month.
+"""
+from datetime import datetime
+from sqlalchemy import func, cast, literal_column, String
+from app.models import db
+
+
+def _dialect(bind=None):
+    return (bind or db.engine).dialect.name
+
+
+def month_bucket(column, dialect=None):
+    """SQL expression rendering ``column`` as a ``'YYYY-MM'`` string."""
+    dialect = dialect or _dialect()
+    if dialect == 'sqlite':
+        return func.strftime('%Y-%m', column)
+    if dialect == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    if dialect in ('mysql', 'mariadb'):
+        return func.date_format(column, '%Y-%m')
+    year = cast(func.extract('year', column), String)
+    month = func.lpad(cast(func.extract('month', column), String), 2, '0')
+    return year + '-' + month
+
+
+def days_between(later, earlier, dialect=None):
+    """SQL expression for the (fractional) number of days from ``earlier`` to ``later``."""
+    dialect = dialect or _dialect()
+    if dialect == 'sqlite':
+        return func.julianday(later) - func.julianday(earlier)
+    if dialect in ('mysql', 'mariadb'):
+        return func.timestampdiff(literal_column('SECOND'), earlier, later) / 86400.0
+    return func.extract('epoch', later - earlier) / 86400.0
+
+
+def last_months(months, end=None):
+    """``'YYYY-MM'`` labels for the last ``months`` months, oldest first, ending at ``end``."""
+    end = end or datetime.utcnow()
+    year, month = end.year, end.month
+    labels = []
+    for _ in range(months):
+        labels.append(f'{year:04d}-{month:02d}')
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return labels[::-1]
+
+
+def month_start(months, end=None):
+    """First instant of the oldest month in ``last_months(months, end)``."""
+    first = last_months(months, end)[0]
+    return datetime.strptime(first, '%Y-%m')
+
+
+def zero_fill(rows, months, default=0, end=None):
+    """
+    Dense ``{month: value}`` dict for the last ``months`` months, oldest first.
+
+    ``rows`` are ``(month, value)`` pairs (or ``(month, v1, v2, ...)``, giving
+    tuple values); months without a row get ``default``.
+    """
+    found = {}
+    for row in rows:
+        month, *values = row
+        found[month] = values[0] if len(values) == 1 else tuple(values)
+    return {month: found.get(month, default) for month in last_months(months, end)}
+
+
+def monthly_series(value, date_column, *criteria, months=12, default=0, end=None):
+    """
+    Aggregate ``value`` per month of ``date_column`` over the last ``months`` months.
+
+    Example::
+
+        monthly_series(func.count(DiagnosisReport.id), DiagnosisReport.created_at,
+                       DiagnosisReport.expert_id == expert_id, months=6)
+    """
+    bucket = month_bucket(date_column).label('month')
+    rows = db.session.query(bucket, value)\
+        .filter(date_column >= month_start(months, end), *criteria)\
+        .group_by(bucket).all()
+    return zero_fill(rows, months, default=default, end=end)
+
@@ -0,0 +1,184 @@
+# Unread Counter Maintenance
+"""
+Keeps ``UnreadCounter`` rows in step with chat messages and marketplace
+inquiries so unread badges are a keyed lookup instead of a COUNT over
+``chat_messages``.
+
+A chat message is unread while its id is above the recipient's
+``ChatReadCursor`` (see app/utils/chat.py); an inquiry is unread while its
+``is_read`` flag is false. The hook, the set-based paths and the rebuild all
+use these same definitions.
+
+* New messages/inquiries, deletions and ORM inquiry ``is_read`` flips are
+  folded in from a session ``after_flush`` hook, in the same transaction as
+  the row.
+* Set-based reads apply their own change: ``mark_thread_read`` subtracts the
+  messages its cursor move passed over (``adjust_unread_counter()``), "mark
+  all inquiries read" sets the counter to 0 (``set_unread_counter()``).
+* ``rebuild_unread_counters()`` (scripts/utils/rebuild_unread_counters.py)
+  recomputes everything from the source rows.
+"""
+from collections import defaultdict
+import sys
+from sqlalchemy import event, func, select, insert, delete, and_, case, literal
+from sqlalchemy.orm.attributes import get_history
+from app.models import db, ChatMessage, ChatReadCursor, MarketplaceInquiry, UnreadCounter
+
+CHAT = 'chat'
+INQUIRY = 'inquiry'
+
+
+def _recipient_key(msg):
+    """``(user_id, kind, partner_id)`` of the counter a message or inquiry counts towards."""
+    if isinstance(msg, MarketplaceInquiry):
+        return (msg.farmer_id, INQUIRY, 0)
+    if msg.expert_id is None:
+        return None
+    if msg.sender_role == 'expert':
+        return (msg.farmer_id, CHAT, msg.expert_id)
+    return (msg.expert_id, CHAT, msg.farmer_id)
+
+
+def _upsert(connection, key, value, increment):
+    """Add ``value`` to (or, when not ``increment``, set) the counter at ``key``."""
+    table = UnreadCounter.__table__
+    row = dict(zip(('user_id', 'kind', 'partner_id'), key))
+    if increment:
+        new_value = case((table.c.unread_count + value < 0, 0), else_=table.c.unread_count + value)
+    else:
+        new_value = value
+    dialect = connection.dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(table).values(**row, unread_count=max(value, 0))
+        connection.execute(stmt.on_conflict_do_update(index_elements=list(row), set_={'unread_count': new_value}))
+        return
+
+    where = and_(*[table.c[col] == val for col, val in row.items()])
+    result = connection.execute(table.update().where(where).values(unread_count=new_value))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**row, unread_count=max(value, 0)))
+
+
+def set_unread_counter(user_id, kind, partner_id, value):
+    _upsert(db.session.connection(), (user_id, kind, partner_id), value, increment=False)
+
+
+def adjust_unread_counter(user_id, kind, partner_id, delta):
+    """Add ``delta`` (negative when messages were read) to a counter, never going below 0."""
+    if delta:
+        _upsert(db.session.connection(), (user_id, kind, partner_id), delta, increment=True)
+
+
+def _is_unread(connection, msg):
+    """Whether a chat message is above its recipient's read cursor, or an inquiry is unread."""
+    if isinstance(msg, MarketplaceInquiry):
+        return not msg.is_read
+    last_read_id = connection.execute(select(ChatReadCursor.last_read_id).where(
+        ChatReadCursor.farmer_id == msg.farmer_id,
+        ChatReadCursor.expert_id == msg.expert_id,
+        ChatReadCursor.reader_role == ('farmer' if msg.sender_role == 'expert' else 'expert')
+    )).scalar()
+    return msg.id > (last_read_id or 0)
+
+
+def _after_flush(session, flush_context):
+    deltas = defaultdict(int)
+
+    for obj in session.new:
+        # A new message is above every cursor of its conversation
+        if isinstance(obj, ChatMessage) or (isinstance(obj, MarketplaceInquiry) and not obj.is_read):
+            key = _recipient_key(obj)
+            if key:
+                deltas[key] += 1
+    for obj in session.dirty:
+        if isinstance(obj, MarketplaceInquiry):
+            history = get_history(obj, 'is_read')
+            if history.has_changes() and history.deleted and bool(history.deleted[0]) != bool(obj.is_read):
+                deltas[_recipient_key(obj)] += -1 if obj.is_read else 1
+    for obj in session.deleted:
+        if isinstance(obj, (ChatMessage, MarketplaceInquiry)):
+            key = _recipient_key(obj)
+            if key and _is_unread(session.connection(), obj):
+                deltas[key] -= 1
+
+    if not deltas:
+        return
+    connection = session.connection()
+    for key, delta in deltas.items():
+        if delta:
+            _upsert(connection, key, delta, increment=True)
+
+
+def register_unread_counter_listeners():
+    """Attach the counter maintenance hook to the application session (idempotent)."""
+    if event.contains(db.session, 'after_flush', _after_flush):
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+
+
+# ==================== READERS ====================
+
+def unread_by_partner(user_id, kind=CHAT):
+    """``{partner_id: unread}`` for conversations of ``user_id`` with unread messages."""
+    return dict(db.session.query(UnreadCounter.partner_id, UnreadCounter.unread_count).filter(
+        UnreadCounter.user_id == user_id,
+        UnreadCounter.kind == kind,
+        UnreadCounter.unread_count > 0
+    ).all())
+
+
+def unread_total(user_id, kind=CHAT):
+    return db.session.query(func.coalesce(func.sum(UnreadCounter.unread_count), 0)).filter(
+        UnreadCounter.user_id == user_id,
+        UnreadCounter.kind == kind
+    ).scalar()
+
+
+# ==================== RECONCILIATION ====================
+
+def rebuild_unread_counters():
+    """Recompute every counter from the chat read cursors and the inquiries' ``is_read`` flags."""
+    db.session.execute(delete(UnreadCounter))
+
+    for user_col, partner_col, sender_role, reader_role in (
+        (ChatMessage.farmer_id, ChatMessage.expert_id, 'expert', 'farmer'),
+        (ChatMessage.expert_id, ChatMessage.farmer_id, 'farmer', 'expert'),
+    ):
+        db.session.execute(insert(UnreadCounter).from_select(
+            ['user_id', 'kind', 'partner_id', 'unread_count'],
+            select(user_col, literal(CHAT), partner_col, func.count(ChatMessage.id))
+            .outerjoin(ChatReadCursor, and_(
+                ChatReadCursor.farmer_id == ChatMessage.farmer_id,
+                ChatReadCursor.expert_id == ChatMessage.expert_id,
+                ChatReadCursor.reader_role == reader_role
+            ))
+            .where(ChatMessage.expert_id.isnot(None),
+                   ChatMessage.sender_role == sender_role,
+                   ChatMessage.id > func.coalesce(ChatReadCursor.last_read_id, 0))
+            .group_by(user_col, partner_col)
+        ))
+
+    db.session.execute(insert(UnreadCounter).from_select(
+        ['user_id', 'kind', 'partner_id', 'unread_count'],
+        select(MarketplaceInquiry.farmer_id, literal(INQUIRY), literal(0), func.count(MarketplaceInquiry.id))
+        .where(MarketplaceInquiry.is_read == False)
+        .group_by(MarketplaceInquiry.farmer_id)
+    ))
+    db.session.commit()
+
+
+def ensure_unread_counters_populated():
+    """Build the counters on startup when they are empty but messages or inquiries exist."""
+    try:
+        if db.session.query(UnreadCounter.id).first() is None and (
+                db.session.query(ChatMessage.id).first() or db.session.query(MarketplaceInquiry.id).first()):
+            print("INFO: Building unread counters...", file=sys.stderr, flush=True)
+            rebuild_unread_counters()
+    except Exception as e:
+        print(f"WARNING: Could not build unread counters: {e}", file=sys.stderr, flush=True)
+        db.session.rollback()
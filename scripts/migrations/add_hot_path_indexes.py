@@ -0,0 +1,39 @@
+"""
+Add the composite indexes declared in the models to an existing database.
+
+db.create_all() only creates indexes together with new tables, so databases
+created before the indexes were declared need this once. Safe to re-run:
+indexes that already exist are skipped. Works on SQLite and PostgreSQL.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from sqlalchemy import inspect
+from app import create_app
+from app.models import db
+
+
+def add_indexes():
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = 0
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            print(f"Creating {index.name} on {table.name}({', '.join(c.name for c in index.columns)})")
+            index.create(db.engine)
+            created += 1
+
+    print(f"Done. {created} index(es) created.")
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        add_indexes()
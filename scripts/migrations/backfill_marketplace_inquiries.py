@@ -0,0 +1,76 @@
+"""
+Move public marketplace inquiries out of chat_messages.
+
+Inquiries used to be stored as ChatMessage rows with sender_role='public' and
+the visitor details packed into the text:
+
+    [Public Inquiry] <name> (<phone>): <message>
+
+This parses each of those rows once, copies it into marketplace_inquiries
+(keeping created_at and is_read), deletes the original message and rebuilds
+the unread counters. Safe to re-run: moved messages no longer exist.
+
+Usage:
+  python scripts/migrations/backfill_marketplace_inquiries.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from sqlalchemy import insert, delete
+from app import create_app
+from app.models import db, ChatMessage, MarketplaceInquiry
+from app.utils.unread_counters import rebuild_unread_counters
+
+PREFIX = '[Public Inquiry]'
+BATCH_SIZE = 1000
+
+
+def parse_inquiry(text):
+    """Return ``(name, phone, message)`` from a legacy inquiry message."""
+    if not text.startswith(PREFIX):
+        return 'Guest', None, text
+    parts = text[len(PREFIX):].strip()
+    if '(' not in parts or '):' not in parts:
+        return 'Guest', None, parts
+    name = parts.split('(')[0].strip() or 'Guest'
+    phone = parts.split('(')[1].split(')')[0].strip() or None
+    message = parts.split('):', 1)[1].strip()
+    return name, phone, message
+
+
+def backfill():
+    legacy = ChatMessage.query.filter(ChatMessage.sender_role == 'public').order_by(ChatMessage.id)
+    moved = 0
+
+    while True:
+        batch = legacy.limit(BATCH_SIZE).all()
+        if not batch:
+            break
+        rows = []
+        for msg in batch:
+            name, phone, message = parse_inquiry(msg.message)
+            rows.append({
+                'farmer_id': msg.farmer_id,
+                'visitor_name': name,
+                'visitor_phone': phone,
+                'message': message,
+                'is_read': msg.is_read,
+                'created_at': msg.created_at
+            })
+        ids = [msg.id for msg in batch]
+        db.session.execute(insert(MarketplaceInquiry), rows)
+        db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_(ids)))
+        db.session.commit()
+        moved += len(rows)
+        print(f"Moved {moved} inquiries...")
+
+    if moved:
+        rebuild_unread_counters()
+    print(f"Done. {moved} inquiry message(s) moved to marketplace_inquiries.")
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        backfill()
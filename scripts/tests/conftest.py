@@ -0,0 +1,58 @@
+"""
+Shared harness for the scripts/tests suite: an in-memory test configuration,
+``app``/``client`` fixtures, session login and a statement counter. Test
+modules import the helpers with ``from conftest import ...``; a module that
+needs extra settings defines ``AppConfig`` (a ``TestConfig`` subclass) and
+the ``app`` fixture uses it.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app import create_app
+from app.config import Config
+from app.models import db, User
+from app.utils.query_guard import capture_statements
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+@pytest.fixture
+def app(request):
+    return create_app(getattr(request.module, 'AppConfig', TestConfig))
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, user):
+    """Log ``client`` in as ``user``: a ``User``, a user id, or a role (its first user)."""
+    if isinstance(user, str):
+        with client.application.app_context():
+            user = User.query.filter_by(role=user).first()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(getattr(user, 'id', user))
+        sess['_fresh'] = True
+
+
+def count_statements(fn, app=None, selects_only=False):
+    """
+    Run ``fn`` and return ``(result, statements)`` with the SQL it executed,
+    on ``app``'s engine or the current app's.
+    """
+    if app is None:
+        engine = db.engine
+    else:
+        with app.app_context():
+            engine = db.engine
+    with capture_statements(engine) as statements:
+        result = fn()
+    if selects_only:
+        statements = [st for st in statements if st.lstrip().upper().startswith('SELECT')]
+    return result, statements
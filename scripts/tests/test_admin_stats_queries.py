@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, CropIssue, YieldPrediction, DiagnosisReport, ProductRequest
+from app.utils.stats import load_dashboard_stats, load_system_totals
+from conftest import count_statements
+
+# Ceilings for the number of SQL statements issued per page
+SYSTEM_TOTALS_MAX_QUERIES = 1
+DASHBOARD_MAX_QUERIES = 5
+
+
+def seed_data():
+    farmer = User.query.filter_by(role='farmer').first()
+    expert = User.query.filter_by(role='expert').first()
+    for i in range(12):
+        issue = CropIssue(
+            farmer_id=farmer.id,
+            crop_type='Rice' if i % 2 else 'Wheat',
+            issue_description='Test issue',
+            location='Kottayam' if i % 3 else 'Thrissur',
+            status=['pending', 'reviewed', 'resolved'][i % 3]
+        )
+        db.session.add(issue)
+        db.session.flush()
+        if i % 2:
+            db.session.add(DiagnosisReport(
+                crop_issue_id=issue.id, expert_id=expert.id, diagnosis='d',
+                disease_identified='Blight', severity='High', treatment_plan='t'
+            ))
+    db.session.add(YieldPrediction(
+        farmer_id=farmer.id, crop_type='Rice', soil_type='Loamy', irrigation_type='Drip',
+        fertilizer_type='Organic', planting_date=CropIssue.query.first().created_at.date(),
+        farm_size=2.0, location='Kerala', predicted_yield=3.456
+    ))
+    db.session.add(ProductRequest(farmer_id=farmer.id, product_name='Urea', product_type='Fertilizer', quantity=5))
+    db.session.commit()
+
+
+def test_system_totals_single_query(app):
+    with app.app_context():
+        seed_data()
+        totals, statements = count_statements(load_system_totals)
+        print('System totals queries:', len(statements))
+        assert len(statements) <= SYSTEM_TOTALS_MAX_QUERIES
+        assert totals.total_farmers == User.query.filter_by(role='farmer').count()
+        assert totals.total_issues == 12
+        assert totals.pending_issues == 4
+        assert totals.resolved_issues == 4
+        assert totals.total_diagnoses == 6
+        assert totals.pending_requests == 1
+        assert totals.avg_yield == 3.46
+
+
+def test_dashboard_query_ceiling(app):
+    with app.app_context():
+        seed_data()
+        stats, statements = count_statements(load_dashboard_stats)
+        print('Dashboard queries:', len(statements))
+        assert len(statements) <= DASHBOARD_MAX_QUERIES
+        assert stats.region_stats == {'Kottayam': 8, 'Thrissur': 4}
+        assert stats.disease_frequency == {'Blight': 6}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
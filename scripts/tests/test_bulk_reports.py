@@ -0,0 +1,95 @@
+import sys
+import os
+import io
+import zipfile
+from datetime import date
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, CropIssue, YieldPrediction
+from app.utils.bulk_reports import load_farmer_report_rows, iter_farmer_reports_zip
+from conftest import TestConfig, login
+
+
+class AppConfig(TestConfig):
+    BULK_REPORT_PROCESSES = 0
+
+
+def add_farmers(app):
+    with app.app_context():
+        ids = []
+        for i, district in enumerate(['Idukki', 'Idukki', 'Wayanad']):
+            farmer = User(username=f'bulk{i}', email=f'bulk{i}@example.com', full_name=f'Bulk Farmer {i}',
+                          role='farmer', farm_location=f'Ward {i}, {district}')
+            farmer.set_password('x')
+            db.session.add(farmer)
+            db.session.flush()
+            db.session.add(CropIssue(farmer_id=farmer.id, crop_type='Rice', issue_description='Spots',
+                                     symptoms=['spots', 'wilting'], status='pending',
+                                     ai_prediction={'disease_name': 'Blast', 'confidence': 0.8}))
+            if i != 1:
+                db.session.add(YieldPrediction(farmer_id=farmer.id, crop_type='Rice', soil_type='Loamy',
+                                               irrigation_type='Canal', fertilizer_type='Organic',
+                                               planting_date=date(2024, 6, 1), farm_size=2.0,
+                                               location='Kerala', predicted_yield=3.5))
+            ids.append(farmer.id)
+        db.session.commit()
+        return ids
+
+
+def zip_names(chunks):
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    for name in archive.namelist():
+        if name.endswith('.pdf'):
+            assert archive.read(name).startswith(b'%PDF')
+    return sorted(archive.namelist())
+
+
+def test_rows_are_plain_tuples_grouped_by_farmer(app):
+    ids = add_farmers(app)
+    with app.app_context():
+        farmers = load_farmer_report_rows('idukki')
+    assert [f[0] for f in farmers] == ids[:2]
+    farmer_id, name, issues, predictions = farmers[0]
+    assert name == 'Bulk Farmer 0' and len(issues) == 1 and len(predictions) == 1
+    assert isinstance(issues[0], tuple) and isinstance(predictions[0], tuple)
+    assert farmers[1][3] == []
+
+
+def test_serial_and_process_pool_archives_match(app):
+    ids = add_farmers(app)
+    with app.app_context():
+        farmers = load_farmer_report_rows()
+    serial = zip_names(iter_farmer_reports_zip(farmers, workers=0))
+    assert f'Bulk_Farmer_0_{ids[0]}/disease_history.pdf' in serial
+    assert f'Bulk_Farmer_0_{ids[0]}/yield_predictions.pdf' in serial
+    # No predictions, no yield PDF
+    assert f'Bulk_Farmer_1_{ids[1]}/yield_predictions.pdf' not in serial
+    assert 'README.txt' in serial
+    assert zip_names(iter_farmer_reports_zip(farmers, workers=2)) == serial
+    assert zip_names(iter_farmer_reports_zip(farmers, kinds=('yield',), workers=0)) == \
+        [name for name in serial if not name.endswith('disease_history.pdf')]
+
+
+def test_bulk_routes(app, client):
+    ids = add_farmers(app)
+    with app.app_context():
+        officer_id = User.query.filter_by(role='krishi_bhavan_officer').first().id
+        admin_id = User.query.filter_by(role='admin').first().id
+
+    login(client, officer_id)
+    response = client.get('/officer/reports/farmers/bulk?district=Wayanad&reports=disease')
+    assert response.status_code == 200 and response.mimetype == 'application/zip'
+    assert 'farmer_reports_Wayanad_' in response.headers['Content-Disposition']
+    assert zip_names([response.get_data()]) == [f'Bulk_Farmer_2_{ids[2]}/disease_history.pdf', 'README.txt']
+
+    login(client, admin_id)
+    response = client.get('/admin/reports/farmers/bulk?district=Idukki')
+    assert response.status_code == 200 and len(zip_names([response.get_data()])) == 4
+
+    login(client, ids[0])
+    assert client.get('/officer/reports/farmers/bulk').status_code == 302
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,58 @@
+import sys
+import os
+import re
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, ChatMessage
+from app.utils.chat import CHAT_PAGE_SIZE
+from app.utils.unread_counters import unread_total
+from conftest import login
+
+
+def seed_thread(count):
+    farmer = User.query.filter_by(role='farmer').first()
+    expert = User.query.filter_by(role='expert').first()
+    db.session.add_all([
+        ChatMessage(farmer_id=farmer.id, expert_id=expert.id, message=f'msg {i}',
+                    sender_role='expert' if i % 2 else 'farmer')
+        for i in range(count)
+    ])
+    db.session.commit()
+    return farmer, expert
+
+
+def test_chat_page_renders_latest_page_and_marks_thread_read(app, client):
+    with app.app_context():
+        farmer, expert = seed_thread(CHAT_PAGE_SIZE * 2 + 5)
+        login(client, farmer)
+
+        html = client.get(f'/farmer/chat/{expert.id}').get_data(as_text=True)
+        assert len(re.findall(r'data-msg-id="\d+"', html)) == CHAT_PAGE_SIZE
+        assert f'msg {CHAT_PAGE_SIZE * 2 + 4}<' in html and 'msg 0<' not in html
+        assert unread_total(farmer.id) == 0
+
+
+def test_history_endpoint_walks_back_to_the_first_message(app, client):
+    with app.app_context():
+        total = CHAT_PAGE_SIZE * 2 + 5
+        farmer, expert = seed_thread(total)
+        login(client, expert)
+
+        seen = []
+        before_id = None
+        has_more = True
+        while has_more:
+            url = f'/expert/chat/{farmer.id}/history' + (f'?before_id={before_id}' if before_id else '')
+            data = client.get(url).get_json()
+            ids = [m['id'] for m in data['messages']]
+            assert ids == sorted(ids)
+            seen = ids + seen
+            before_id = ids[0]
+            has_more = data['has_more']
+
+        assert len(seen) == total and len(set(seen)) == total
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,100 @@
+import sys
+import os
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, ChatMessage, ChatReadCursor
+from app.utils.chat import mark_thread_read, ensure_read_cursors_populated
+from app.utils.unread_counters import (
+    CHAT, adjust_unread_counter, unread_by_partner, unread_total, rebuild_unread_counters
+)
+from conftest import count_statements
+
+
+def send(farmer, expert, sender_role, count):
+    messages = [ChatMessage(farmer_id=farmer.id, expert_id=expert.id, message='m', sender_role=sender_role)
+                for _ in range(count)]
+    db.session.add_all(messages)
+    db.session.commit()
+    return messages
+
+
+def test_mark_read_is_set_based_and_bounded_by_cursor(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        first = send(farmer, expert, 'expert', 5)
+        send(farmer, expert, 'farmer', 2)
+        later = send(farmer, expert, 'expert', 3)
+
+        assert unread_total(farmer.id) == 8
+        assert unread_by_partner(expert.id) == {farmer.id: 2}
+
+        farmer_id, expert_id, up_to_id = farmer.id, expert.id, first[-1].id
+        updated, statements = count_statements(lambda: mark_thread_read(farmer_id, expert_id, 'farmer', up_to_id))
+        db.session.commit()
+        assert updated == 5
+        # Read the cursor, create it, count the messages it passed, subtract them from the counter
+        assert len(statements) == 4
+        assert not any(st.lstrip().startswith(('SELECT chat_messages.id', 'UPDATE chat_messages'))
+                       for st in statements)
+
+        assert unread_total(farmer.id) == 3
+
+        # The cursor never moves backwards
+        mark_thread_read(farmer.id, expert.id, 'farmer', first[0].id)
+        db.session.commit()
+        cursor = ChatReadCursor.query.filter_by(farmer_id=farmer.id, expert_id=expert.id, reader_role='farmer').one()
+        assert cursor.last_read_id == first[-1].id
+
+        assert mark_thread_read(farmer.id, expert.id, 'farmer', later[-1].id) == 3
+        db.session.commit()
+        assert unread_by_partner(farmer.id) == {}
+        incremental = unread_by_partner(expert.id)
+        rebuild_unread_counters()
+        assert unread_by_partner(farmer.id) == {} and unread_by_partner(expert.id) == incremental
+
+
+def test_concurrent_reads_subtract_messages_once(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        first = send(farmer, expert, 'expert', 4)
+        mark_thread_read(farmer.id, expert.id, 'farmer', first[0].id)
+        db.session.commit()
+        assert unread_total(farmer.id) == 3
+
+        # Another request moves the cursor between this one's read of it and its update
+        farmer_id, expert_id = farmer.id, expert.id
+        real_execute = db.session.execute
+
+        def execute_after_concurrent_read(statement, *args, **kwargs):
+            if getattr(statement, 'is_dml', False) and statement.table.name == 'chat_read_cursors':
+                real_execute(ChatReadCursor.__table__.update().values(last_read_id=first[-1].id))
+                adjust_unread_counter(farmer_id, CHAT, expert_id, -3)
+            return real_execute(statement, *args, **kwargs)
+
+        with mock.patch.object(db.session, 'execute', side_effect=execute_after_concurrent_read):
+            assert mark_thread_read(farmer_id, expert_id, 'farmer', first[-1].id) == 0
+        db.session.commit()
+        assert unread_total(farmer.id) == 0
+
+
+def test_cursors_backfilled_from_is_read(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        read = send(farmer, expert, 'expert', 3)
+        for msg in read:
+            msg.is_read = True
+        send(farmer, expert, 'expert', 2)
+        db.session.commit()
+
+        ensure_read_cursors_populated()
+        rebuild_unread_counters()
+        assert unread_total(farmer.id) == 2
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
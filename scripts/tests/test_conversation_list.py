@@ -0,0 +1,98 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, ChatMessage
+from app.utils.chat import EXPERT_LIST_SIZE, load_conversations, load_experts
+from conftest import count_statements, login
+
+
+def make_experts(count):
+    experts = []
+    for i in range(count):
+        expert = User(username=f'listexpert{i}', email=f'listexpert{i}@test.com',
+                      role='expert', full_name=f'Expert {i}')
+        expert.set_password('x')
+        experts.append(expert)
+    db.session.add_all(experts)
+    db.session.commit()
+    return experts
+
+
+def test_conversation_list_is_one_query(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        experts = make_experts(3)
+
+        # Expert 0 gets 2 unread replies, expert 1 none, expert 2 is the most recent thread
+        for expert, replies in zip(experts, (2, 0, 1)):
+            db.session.add(ChatMessage(farmer_id=farmer.id, expert_id=expert.id,
+                                       message=f'question for {expert.full_name}', sender_role='farmer'))
+            db.session.commit()
+            for n in range(replies):
+                db.session.add(ChatMessage(farmer_id=farmer.id, expert_id=expert.id,
+                                           message=f'reply {n}', sender_role='expert'))
+                db.session.commit()
+
+        farmer_id = farmer.id
+        page, statements = count_statements(lambda: load_conversations(farmer_id, 'farmer'))
+        assert len(statements) == 1
+        assert page.total == 3
+        assert page.total_unread == 3
+        assert [c.partner.full_name for c in page.items] == ['Expert 2', 'Expert 1', 'Expert 0']
+        assert [(c.last_message, c.last_sender_role, c.unread_count) for c in page.items] == [
+            ('reply 0', 'expert', 1),
+            ('question for Expert 1', 'farmer', 0),
+            ('reply 1', 'expert', 2),
+        ]
+
+        # The expert side sees the farmer and the question it has not opened yet
+        expert_page = load_conversations(experts[0].id, 'expert')
+        assert [(c.partner.id, c.unread_count) for c in expert_page.items] == [(farmer.id, 1)]
+
+        second = load_conversations(farmer.id, 'farmer', page=2, per_page=2)
+        assert second.total == 3 and second.has_prev and not second.has_next
+        assert [c.partner.full_name for c in second.items] == ['Expert 0']
+
+
+def test_chat_list_pages_render(app, client):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        db.session.add(ChatMessage(farmer_id=farmer.id, expert_id=expert.id,
+                                   message='How much water for paddy?', sender_role='farmer'))
+        db.session.commit()
+        farmer_id, expert_id = farmer.id, expert.id
+
+    # Requests run outside the app context so each one resolves its own user
+    login(client, farmer_id)
+    html = client.get('/farmer/chat').get_data(as_text=True)
+    assert 'How much water for paddy?' in html
+
+    login(client, expert_id)
+    html = client.get('/expert/chat').get_data(as_text=True)
+    assert '1 Active Chats' in html
+    assert 'How much water for paddy?' in html
+
+
+
+def test_new_chat_expert_list_is_bounded_and_searchable(app, client):
+    with app.app_context():
+        farmer_id = User.query.filter_by(role='farmer').first().id
+        make_experts(EXPERT_LIST_SIZE + 5)
+        total = User.query.filter_by(role='expert', is_active=True).count()
+        experts, has_more = load_experts()
+        assert len(experts) == EXPERT_LIST_SIZE < total and has_more
+        experts, has_more = load_experts('Expert 24')
+        assert [e.full_name for e in experts] == ['Expert 24'] and not has_more
+
+    login(client, farmer_id)
+    html = client.get('/farmer/chat').get_data(as_text=True)
+    assert 'search to find them' in html
+    html = client.get('/farmer/chat?expert_q=Expert+24').get_data(as_text=True)
+    assert 'Expert 24' in html and 'Expert 23' not in html
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,72 @@
+import sys
+import os
+import csv
+import io
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from sqlalchemy import insert
+from app.models import db, User, CropIssue
+from app.utils.reports import iter_csv_report, generate_csv_report
+from conftest import login
+
+
+def test_header_goes_out_before_the_rows_are_read():
+    consumed = []
+
+    def rows():
+        for i in range(10):
+            consumed.append(i)
+            yield {'ID': i, 'Note': None}
+
+    chunks = iter_csv_report(rows(), chunk_size=4)
+    assert next(chunks) == b'ID,Note\r\n' and consumed == [0]
+    assert next(chunks).count(b'\r\n') == 4 and consumed == [0, 1, 2, 3]
+    rest = b''.join(chunks).decode()
+    assert rest.splitlines()[-1] == '9,N/A'
+    assert b''.join(iter_csv_report([])) == b'No data available'
+    assert generate_csv_report([{'A': 1}]) == 'A\r\n1\r\n'
+
+
+def test_queries_are_fetched_in_chunks(app):
+    with app.app_context():
+        db.session.execute(insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+             'full_name': f'User {i}', 'role': 'farmer'}
+            for i in range(2500)
+        ])
+        db.session.commit()
+        query = User.query.order_by(User.id)
+        chunks = list(iter_csv_report(query, row_fn=lambda u: {'ID': u.id, 'Username': u.username},
+                                      chunk_size=1000))
+        # header, three chunks of rows
+        assert len(chunks) == 4
+        rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+        assert len(rows) == User.query.count() and rows[-1]['Username'] == 'user2499'
+
+
+def test_report_routes_stream_csv(app, client):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        admin_id = User.query.filter_by(role='admin').first().id
+        farmer_id = farmer.id
+        db.session.add(CropIssue(farmer_id=farmer.id, crop_type='Rice', issue_description='Yellow leaves',
+                                 symptoms=['yellowing', 'spots'],
+                                 ai_prediction={'disease_name': 'Blast', 'confidence': 0.9}))
+        db.session.commit()
+
+    login(client, farmer_id)
+    response = client.get('/farmer/reports/disease-history/csv')
+    assert response.status_code == 200 and response.is_streamed
+    assert response.mimetype == 'text/csv' and 'disease_history_report_' in response.headers['Content-Disposition']
+    row = next(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert row['Disease Predicted'] == 'Blast' and row['Symptoms'] == 'yellowing, spots'
+    assert client.get('/farmer/reports/yield-predictions/csv').get_data() == b'No data available'
+
+    login(client, admin_id)
+    users = list(csv.DictReader(io.StringIO(client.get('/admin/reports/users/csv').get_data(as_text=True))))
+    assert {u['Role'] for u in users} >= {'farmer', 'admin'}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import (
+    db, CropIssue, ChatMessage, YieldPrediction, MarketplaceOrder, FarmerNoticeRead, FarmerProduct
+)
+
+
+def plan(query):
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')).all()]
+
+
+def assert_uses_index(query, index_name):
+    details = plan(query)
+    assert any(index_name in detail for detail in details), details
+
+
+def test_hot_paths_use_composite_indexes(app):
+    with app.app_context():
+        assert_uses_index(
+            CropIssue.query.filter_by(farmer_id=1).order_by(CropIssue.created_at.desc()),
+            'ix_crop_issues_farmer_created')
+        assert_uses_index(
+            CropIssue.query.filter_by(status='pending').order_by(CropIssue.created_at.desc()),
+            'ix_crop_issues_status_created')
+        assert_uses_index(
+            ChatMessage.query.filter_by(farmer_id=1, expert_id=2).order_by(ChatMessage.id),
+            'ix_chat_messages_thread')
+        assert_uses_index(
+            ChatMessage.query.filter_by(farmer_id=1, sender_role='expert', is_read=False),
+            'ix_chat_messages_')
+        assert_uses_index(
+            FarmerNoticeRead.query.filter_by(farmer_id=1, notice_id=3),
+            'ix_farmer_notice_reads_farmer_notice')
+        assert_uses_index(
+            YieldPrediction.query.filter_by(farmer_id=1).order_by(YieldPrediction.created_at.desc()),
+            'ix_yield_predictions_farmer_created')
+        assert_uses_index(
+            MarketplaceOrder.query.filter_by(farmer_id=1).order_by(MarketplaceOrder.created_at.desc()),
+            'ix_marketplace_orders_farmer_created')
+        assert_uses_index(
+            FarmerProduct.query.filter_by(is_available=True)
+            .order_by(FarmerProduct.created_at.desc(), FarmerProduct.id.desc()),
+            'ix_farmer_products_available_created')
+        assert_uses_index(
+            FarmerProduct.query.filter_by(category='Fruits', is_available=True)
+            .order_by(FarmerProduct.created_at.desc(), FarmerProduct.id.desc()),
+            'ix_farmer_products_category_available_created')
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
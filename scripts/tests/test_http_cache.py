@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, FarmerProduct, Product
+from conftest import count_statements, login
+
+
+def test_marketplace_etag_304_and_invalidation(app, client):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        product = FarmerProduct(farmer_id=farmer.id, product_name='Tomato', category='Vegetables',
+                                quantity=10, unit='kg', price_per_unit=40)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+
+    first = client.get('/marketplace/')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert 'public' in first.headers['Cache-Control'] and 's-maxage=' in first.headers['Cache-Control']
+    assert 'Cookie' in first.headers['Vary']
+
+    # Revalidation and repeat views do not touch the database
+    not_modified, selects = count_statements(lambda: client.get('/marketplace/', headers={'If-None-Match': etag}),
+                                             app, selects_only=True)
+    assert not_modified.status_code == 304 and selects == []
+    again, selects = count_statements(lambda: client.get('/marketplace/'), app, selects_only=True)
+    assert again.get_data() == first.get_data() and again.headers['ETag'] == etag and selects == []
+
+    # Query string is part of the key
+    assert client.get('/marketplace/?category=Fruits').headers['ETag'] != etag
+
+    with app.app_context():
+        db.session.get(FarmerProduct, product_id).product_name = 'Cherry Tomato'
+        db.session.commit()
+
+    changed = client.get('/marketplace/', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert 'Cherry Tomato' in changed.get_data(as_text=True)
+
+
+def test_krishi_bhavan_page_follows_products_table(app, client):
+    etag = client.get('/marketplace').headers['ETag']
+    assert client.get('/marketplace', headers={'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        officer = User.query.filter_by(role='krishi_bhavan_officer').first()
+        db.session.add(Product(name='Neem Oil', product_type='pesticide', stock_quantity=5,
+                               unit='liter', created_by=officer.id))
+        db.session.commit()
+    response = client.get('/marketplace', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and 'Neem Oil' in response.get_data(as_text=True)
+
+
+def test_logged_in_users_bypass_the_cache(app, client):
+    with app.app_context():
+        farmer_id = User.query.filter_by(role='farmer').first().id
+    login(client, farmer_id)
+    response = client.get('/marketplace/')
+    assert response.status_code == 200 and 'ETag' not in response.headers
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,108 @@
+import sys
+import os
+import io
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from app.models import db, User, FarmerProduct
+from app.utils.images import image_pipeline, variant_path, THUMBNAIL_SIZES
+from conftest import TestConfig
+
+UPLOADS = tempfile.mkdtemp()
+
+
+class AppConfig(TestConfig):
+    UPLOAD_FOLDER = Path(UPLOADS) / 'uploads'
+
+
+def photo_bytes(size=(2000, 1500), color=(120, 180, 60)):
+    image = Image.new('RGB', size, color)
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCam'  # Make
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif, quality=95)
+    return buffer.getvalue()
+
+
+def upload(data, name='leaf.jpg'):
+    return FileStorage(stream=io.BytesIO(data), filename=name, content_type='image/jpeg')
+
+
+def test_ingest_dedups_and_builds_thumbnails(app):
+    with app.app_context():
+        data = photo_bytes()
+        first = image_pipeline.ingest(upload(data), 'crops')
+        second = image_pipeline.ingest(upload(data, 'copy.jpg'), 'crops')
+        other = image_pipeline.ingest(upload(photo_bytes(color=(10, 10, 10))), 'crops')
+        image_pipeline.wait(timeout=30)
+
+        assert first == second != other
+        folder = AppConfig.UPLOAD_FOLDER / 'crops'
+        assert sorted(p.suffix for p in folder.iterdir()).count('.jpg') == 2
+        assert not list(folder.glob('*.upload'))
+
+        for size, edge in THUMBNAIL_SIZES.items():
+            with Image.open(AppConfig.UPLOAD_FOLDER.parent / variant_path(first, size)) as thumb:
+                assert thumb.format == 'WEBP'
+                assert max(thumb.size) == edge
+                assert not thumb.getexif()
+
+        assert image_pipeline.thumbnail(first, 'sm') == variant_path(first, 'sm')
+        assert image_pipeline.thumbnail('uploads/crops/missing.jpg', 'sm') == 'uploads/crops/missing.jpg'
+
+
+def test_stored_files_carry_no_gps(app):
+    with app.app_context():
+        image = Image.new('RGB', (800, 600), (200, 40, 40))
+        exif = Image.Exif()
+        exif[0x010F] = 'TestCam'  # Make
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        exif[0x8825] = {1: 'N', 2: (9.0, 35.0, 0.0), 3: 'E', 4: (76.0, 31.0, 0.0)}  # GPSInfo
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        assert Image.open(io.BytesIO(buffer.getvalue())).getexif().get_ifd(0x8825)
+
+        path = image_pipeline.ingest(upload(buffer.getvalue(), 'field.jpg'), 'chat_images')
+        image_pipeline.wait(timeout=30)
+        stored = [AppConfig.UPLOAD_FOLDER.parent / path] + \
+                 [AppConfig.UPLOAD_FOLDER.parent / variant_path(path, size) for size in THUMBNAIL_SIZES]
+        for file in stored:
+            with Image.open(file) as saved:
+                assert not saved.getexif().get_ifd(0x8825) and not saved.getexif(), file
+                assert 'exif' not in saved.info
+        # Orientation was applied before the tag was dropped
+        with Image.open(stored[0]) as original:
+            assert original.size == (600, 800)
+
+
+def test_rejects_files_that_are_not_images(app):
+    with app.app_context():
+        for name in ('notes.txt', 'fake.jpg'):
+            try:
+                image_pipeline.ingest(upload(b'not an image', name), 'crops')
+                assert False, name
+            except ValueError:
+                pass
+        assert not list((AppConfig.UPLOAD_FOLDER / 'crops').glob('*.upload'))
+
+
+def test_marketplace_grid_serves_thumbnails(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        path = image_pipeline.ingest(upload(photo_bytes()), 'farmer_products')
+        image_pipeline.wait(timeout=30)
+        db.session.add(FarmerProduct(farmer_id=farmer.id, product_name='Tomato', category='Vegetables',
+                                     quantity=10, unit='kg', price_per_unit=40, product_image_path=path))
+        db.session.commit()
+
+    html = app.test_client().get('/marketplace/').get_data(as_text=True)
+    assert variant_path(path, 'md') in html
+    assert f'/static/{path}"' not in html
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
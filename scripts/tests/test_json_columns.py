@@ -0,0 +1,105 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from sqlalchemy import text
+from app.models import db, User, CropIssue, DiagnosisReport
+from app.utils.json_columns import ensure_json_columns, json_field
+from app.utils.stats import predicted_disease_stats
+from conftest import login
+
+
+def add_issue(farmer_id, disease, confidence=0.8, symptoms=('Wilting',)):
+    issue = CropIssue(farmer_id=farmer_id, crop_type='Rice', issue_description='Spots', symptoms=list(symptoms),
+                      ai_prediction={'disease_name': disease, 'confidence': confidence} if disease else None)
+    db.session.add(issue)
+    return issue
+
+
+def test_columns_round_trip_python_values(app):
+    with app.app_context():
+        farmer_id = User.query.filter_by(role='farmer').first().id
+        issue = add_issue(farmer_id, 'Leaf Blast', symptoms=['Wilting', 'Brown spots'])
+        bare = add_issue(farmer_id, None, symptoms=[])
+        db.session.commit()
+        db.session.expire_all()
+        assert issue.symptoms == ['Wilting', 'Brown spots']
+        assert issue.ai_prediction['disease_name'] == 'Leaf Blast'
+        # None is stored as SQL NULL, not the JSON value null
+        assert db.session.execute(text("SELECT ai_prediction IS NULL FROM crop_issues WHERE id = :id"),
+                                  {'id': bare.id}).scalar() == 1
+
+
+def test_upgrade_rewrites_legacy_text_and_indexes_predictions(app):
+    with app.app_context():
+        farmer_id = User.query.filter_by(role='farmer').first().id
+        expert_id = User.query.filter_by(role='expert').first().id
+        # A database from before the upgrade: free text in the JSON columns and no index
+        db.session.execute(text("DROP INDEX ix_crop_issues_predicted_disease"))
+        db.session.execute(text(
+            "INSERT INTO crop_issues (farmer_id, crop_type, issue_description, status, symptoms, ai_prediction, "
+            "created_at) VALUES (:farmer, 'Rice', 'x', 'pending', 'yellow leaves', 'Blast?', CURRENT_TIMESTAMP)"
+        ), {'farmer': farmer_id})
+        issue_id = db.session.execute(text("SELECT max(id) FROM crop_issues")).scalar()
+        db.session.execute(text(
+            "INSERT INTO diagnosis_reports (crop_issue_id, expert_id, diagnosis, treatment_plan, "
+            "recommended_products, created_at) VALUES (:issue, :expert, 'd', 't', 'Neem oil', CURRENT_TIMESTAMP)"
+        ), {'issue': issue_id, 'expert': expert_id})
+        db.session.commit()
+
+        ensure_json_columns()
+        db.session.expire_all()
+        issue = db.session.get(CropIssue, issue_id)
+        assert issue.symptoms == ['yellow leaves'] and issue.ai_prediction is None
+        assert DiagnosisReport.query.filter_by(crop_issue_id=issue_id).one().recommended_products == ['Neem oil']
+
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN " + str(db.session.query(CropIssue.id).filter(
+                json_field(CropIssue.ai_prediction, 'disease_name') == 'Leaf Blast'
+            ).statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        )).all()
+        assert 'ix_crop_issues_predicted_disease' in ' '.join(str(row[-1]) for row in plan)
+
+
+def test_predicted_disease_stats_group_in_sql(app, client):
+    with app.app_context():
+        farmer_id = User.query.filter_by(role='farmer').first().id
+        admin_id = User.query.filter_by(role='admin').first().id
+        for disease, confidence in [('Leaf Blast', 0.9), ('Leaf Blast', 0.7), ('Brown Spot', 0.6), (None, 0)]:
+            add_issue(farmer_id, disease, confidence)
+        db.session.commit()
+        stats = predicted_disease_stats()
+        assert [(row.disease, row.count) for row in stats] == [('Leaf Blast', 2), ('Brown Spot', 1)]
+        assert abs(stats[0].avg_confidence - 0.8) < 1e-9
+
+    login(client, admin_id)
+    page = client.get('/admin/statistics/diseases').get_data(as_text=True)
+    assert 'AI Predicted Diseases' in page and '80.0% avg. confidence' in page
+
+
+def test_routes_read_and_write_native_values(app, client):
+    with app.app_context():
+        farmer_id = User.query.filter_by(role='farmer').first().id
+        expert_id = User.query.filter_by(role='expert').first().id
+        issue = add_issue(farmer_id, 'Leaf Blast', symptoms=['Wilting', 'Brown spots'])
+        db.session.commit()
+        issue_id = issue.id
+
+    login(client, expert_id)
+    page = client.get(f'/expert/issues/{issue_id}').get_data(as_text=True)
+    assert 'Leaf Blast' in page and 'Brown spots' in page
+    client.post(f'/expert/issues/{issue_id}/diagnose', data={
+        'diagnosis': 'Blast', 'treatment_plan': 'Spray', 'recommended_products': ['Neem oil', 'Copper spray']
+    })
+    with app.app_context():
+        assert DiagnosisReport.query.filter_by(crop_issue_id=issue_id).one().recommended_products == \
+            ['Neem oil', 'Copper spray']
+
+    login(client, farmer_id)
+    page = client.get(f'/farmer/disease-prediction/{issue_id}').get_data(as_text=True)
+    assert 'Brown spots' in page and 'Copper spray' in page and 'Leaf Blast' in page
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,98 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app import create_app
+from app.models import db, User, ChatMessage, FarmerProduct, MarketplaceInquiry
+from app.utils.unread_counters import INQUIRY, unread_total
+from scripts.migrations.backfill_marketplace_inquiries import parse_inquiry, backfill
+from conftest import TestConfig, count_statements, login
+
+
+def make_product(farmer):
+    product = FarmerProduct(farmer_id=farmer.id, product_name='Tomato', category='Vegetables',
+                            quantity=10, unit='kg', price_per_unit=40)
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def test_contact_farmer_stores_structured_inquiry(app, client):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        product_id, farmer_id = make_product(farmer).id, farmer.id
+
+    response = client.post('/marketplace/contact-farmer', data={
+        'product_id': product_id, 'visitor_name': 'Anu', 'visitor_phone': '9876543210',
+        'message': 'Is it organic (no pesticides): yes?'
+    })
+    assert response.status_code == 200
+
+    with app.app_context():
+        inquiry = MarketplaceInquiry.query.one()
+        assert (inquiry.product_id, inquiry.farmer_id) == (product_id, farmer_id)
+        assert (inquiry.visitor_name, inquiry.visitor_phone) == ('Anu', '9876543210')
+        assert inquiry.message == 'Is it organic (no pesticides): yes?'
+        assert unread_total(farmer_id, INQUIRY) == 1
+        assert ChatMessage.query.count() == 0
+
+
+def test_inquiries_page_is_paginated_without_parsing(app, client):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        product = make_product(farmer)
+        db.session.add_all([MarketplaceInquiry(product_id=product.id, farmer_id=farmer.id, visitor_name=f'Visitor {i}',
+                                               visitor_phone='9876543210', message=f'question {i}')
+                            for i in range(25)])
+        db.session.commit()
+        farmer_id = farmer.id
+
+    login(client, farmer_id)
+    html, statements = count_statements(
+        lambda: client.get('/farmer/marketplace-inquiries').get_data(as_text=True), app)
+
+    assert html.count('class="customer-avatar"') == 20
+    assert 'question 24' in html and 'question 4' not in html
+    assert 'Tomato' in html
+    # Rows, product and total come from a fixed number of statements
+    assert sum('marketplace_inquiries' in st for st in statements) <= 3
+
+    html = client.get('/farmer/marketplace-inquiries?page=2').get_data(as_text=True)
+    assert html.count('class="customer-avatar"') == 5
+
+    assert client.post('/farmer/marketplace-inquiries/mark-all-read').get_json()['status'] == 'success'
+    with app.app_context():
+        assert unread_total(farmer_id, INQUIRY) == 0
+        assert MarketplaceInquiry.query.filter_by(is_read=False).count() == 0
+
+
+def test_backfill_moves_legacy_messages():
+    assert parse_inquiry('[Public Inquiry] Anu (9876543210): price (per kg): ?') == \
+        ('Anu', '9876543210', 'price (per kg): ?')
+    assert parse_inquiry('[Public Inquiry] just text') == ('Guest', None, 'just text')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        db.session.add_all(
+            [ChatMessage(farmer_id=farmer.id, message=f'[Public Inquiry] Anu (9876543210): q{i}',
+                         sender_role='public', is_read=i < 2) for i in range(5)] +
+            [ChatMessage(farmer_id=farmer.id, expert_id=expert.id, message='hello', sender_role='expert')]
+        )
+        db.session.commit()
+
+        backfill()
+        assert MarketplaceInquiry.query.count() == 5
+        assert MarketplaceInquiry.query.filter_by(is_read=False).count() == 3
+        assert ChatMessage.query.count() == 1
+        assert unread_total(farmer.id, INQUIRY) == 3
+        assert unread_total(farmer.id) == 1
+
+        backfill()
+        assert MarketplaceInquiry.query.count() == 5
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
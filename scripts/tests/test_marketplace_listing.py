@@ -0,0 +1,87 @@
+import sys
+import os
+import re
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, FarmerProduct
+from app.utils.cache import stats_cache
+from app.utils.marketplace import load_listing_page, cached_category_facets
+from conftest import count_statements
+
+
+def add_products(farmer, count, category='Vegetables'):
+    # Pairs of listings share a timestamp so the id tie-breaker is exercised
+    start = datetime(2026, 1, 1)
+    products = [FarmerProduct(farmer_id=farmer.id, product_name=f'Item {i}', category=category, quantity=5,
+                              unit='kg', price_per_unit=10, created_at=start + timedelta(minutes=i // 2))
+                for i in range(count)]
+    db.session.add_all(products)
+    db.session.commit()
+    return products
+
+
+def test_keyset_pages_walk_forward_and_back(app):
+    with app.app_context():
+        stats_cache.clear()
+        farmer = User.query.filter_by(role='farmer').first()
+        add_products(farmer, 30)
+        base = FarmerProduct.query.filter_by(is_available=True)
+
+        expected = [p.product_name for p in base.order_by(FarmerProduct.created_at.desc(),
+                                                          FarmerProduct.id.desc()).all()]
+        seen, pages, page = [], [], load_listing_page(base, per_page=12)
+        while True:
+            pages.append(page)
+            seen += [p.product_name for p in page.items]
+            if not page.has_next:
+                break
+            page, statements = count_statements(lambda: load_listing_page(base, after=pages[-1].next_cursor, per_page=12))
+            # Deep pages are a single bounded SELECT with no COUNT (SQLite renders "OFFSET 0" with LIMIT)
+            assert len(statements) == 1
+            assert 'count(' not in statements[0].lower()
+        assert seen == expected
+        assert [len(p.items) for p in pages] == [12, 12, 6]
+        assert not pages[0].has_prev and pages[-1].has_prev
+
+        back = load_listing_page(base, before=pages[2].prev_cursor, per_page=12)
+        assert [p.id for p in back.items] == [p.id for p in pages[1].items]
+        first = load_listing_page(base, before=pages[1].prev_cursor, per_page=12)
+        assert [p.id for p in first.items] == [p.id for p in pages[0].items] and not first.has_prev
+
+        assert load_listing_page(base, after='garbage', per_page=12).items == pages[0].items
+
+
+def test_facets_are_cached_until_a_product_changes(app):
+    with app.app_context():
+        stats_cache.clear()
+        farmer = User.query.filter_by(role='farmer').first()
+        veg = add_products(farmer, 3)
+        add_products(farmer, 2, category='Fruits')
+
+        assert cached_category_facets() == {'Fruits': 2, 'Vegetables': 3}
+        _, statements = count_statements(cached_category_facets)
+        assert statements == []
+
+        veg[0].is_available = False
+        db.session.commit()
+        assert cached_category_facets() == {'Fruits': 2, 'Vegetables': 2}
+
+
+def test_listing_page_renders_cursor_links(app, client):
+    with app.app_context():
+        stats_cache.clear()
+        farmer = User.query.filter_by(role='farmer').first()
+        add_products(farmer, 15)
+
+    html = client.get('/marketplace/').get_data(as_text=True)
+    assert '15 listings' in html
+    assert 'Vegetables\n                                (15)' in html
+    cursor = re.search(r'after=([^"&]+)', html).group(1)
+    html = client.get(f'/marketplace/?after={cursor}').get_data(as_text=True)
+    assert html.count('Item ') >= 3 and 'Item 14' not in html
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,130 @@
+import sys
+import os
+import io
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, Product, ProductRequest, ProductStockHistory
+from app.utils.stock import apply_stock_batch
+from app.utils.product_requests import apply_request_decisions
+from conftest import login
+
+
+def officer_id():
+    return User.query.filter_by(role='krishi_bhavan_officer').first().id
+
+
+def add_products(*stocks):
+    products = [Product(name=f'Product {n}', product_type='seed', unit='kg', stock_quantity=stock,
+                        created_by=officer_id()) for n, stock in enumerate(stocks)]
+    db.session.add_all(products)
+    db.session.commit()
+    return [product.id for product in products]
+
+
+def add_requests(count):
+    """Pending requests for Urea, which is in stock (approving reserves it)"""
+    if Product.query.filter_by(name='Urea').first() is None:
+        db.session.add(Product(name='Urea', product_type='fertilizer', unit='kg', stock_quantity=100,
+                               created_by=officer_id()))
+    farmer = User.query.filter_by(role='farmer').first()
+    requests = [ProductRequest(farmer_id=farmer.id, product_name='Urea', product_type='fertilizer', quantity=5)
+                for _ in range(count)]
+    db.session.add_all(requests)
+    db.session.commit()
+    return [r.id for r in requests]
+
+
+def test_stock_batch_applies_in_order(app):
+    with app.app_context():
+        a, b = add_products(5, 0)
+        rows = [{'product_id': a, 'quantity_change': 10, 'idempotency_key': 'k1'},
+                {'product_id': b, 'quantity_change': '7'},
+                {'product_id': a, 'quantity_change': -12, 'reason': 'Camp distribution'}]
+        applied, results = apply_stock_batch(rows, officer_id())
+        db.session.commit()
+        assert applied == 3 and [r['new_stock'] for r in results] == [15, 7, 3]
+        assert db.session.get(Product, a).stock_quantity == 3 and db.session.get(Product, b).stock_quantity == 7
+        entries = ProductStockHistory.query.filter_by(product_id=a).order_by(ProductStockHistory.id).all()
+        assert [(e.previous_stock, e.new_stock) for e in entries] == [(5, 15), (15, 3)]
+        assert entries[1].reason == 'Camp distribution'
+
+        # The keyed row is skipped when the batch is sent again
+        applied, results = apply_stock_batch(rows[:1], officer_id())
+        assert applied == 0 and results[0]['status'] == 'skipped'
+
+
+def test_stock_batch_with_errors_applies_nothing(app):
+    with app.app_context():
+        a, = add_products(5)
+        rows = [{'product_id': a, 'quantity_change': 2},
+                {'product_id': a, 'quantity_change': -8},
+                {'product_id': 999, 'quantity_change': 1},
+                {'product_id': a, 'quantity_change': 'lots'}]
+        applied, results = apply_stock_batch(rows, officer_id())
+        db.session.rollback()
+        assert applied == 0
+        assert [r['status'] for r in results] == ['skipped', 'error', 'error', 'error']
+        assert db.session.get(Product, a).stock_quantity == 5
+        assert ProductStockHistory.query.count() == 0
+
+
+def test_request_decisions(app):
+    with app.app_context():
+        first, second, third = add_requests(3)
+        rows = [{'request_id': first, 'action': 'approve'},
+                {'request_id': second, 'action': 'Reject', 'rejection_reason': 'Out of season'}]
+        applied, results = apply_request_decisions(rows, officer_id())
+        db.session.commit()
+        assert applied == 2
+        approved, rejected = db.session.get(ProductRequest, first), db.session.get(ProductRequest, second)
+        assert approved.status == 'approved' and approved.approved_by == officer_id() and approved.approval_date
+        assert rejected.status == 'rejected' and rejected.rejection_reason == 'Out of season'
+
+        # Replays are skipped; deciding a request the other way is an error and stops the batch
+        applied, results = apply_request_decisions(
+            rows + [{'request_id': third, 'action': 'approve'}, {'request_id': first, 'action': 'reject'}],
+            officer_id())
+        db.session.rollback()
+        assert applied == 0 and [r['status'] for r in results] == ['skipped', 'skipped', 'skipped', 'error']
+        assert db.session.get(ProductRequest, third).status == 'pending'
+
+
+def test_bulk_routes(app, client):
+    with app.app_context():
+        user_id = officer_id()
+        a, b = add_products(1, 2)
+        request_ids = add_requests(2)
+    login(client, user_id)
+
+    csv_file = f'product_id,quantity_change,reason\n{a},4,Delivery\n{b},-2,Issued\n'.encode()
+    response = client.post('/officer/products/bulk-stock',
+                           data={'batch_file': (io.BytesIO(csv_file), 'stock.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    with app.app_context():
+        assert [db.session.get(Product, i).stock_quantity for i in (a, b)] == [5, 0]
+
+    # A trailing comma is ignored; an extra value is rejected instead of crashing
+    for body, expected in ((f'product_id,quantity_change\n{a},1,\n', 6), (f'product_id,quantity_change\n{a},1,x\n', 6)):
+        response = client.post('/officer/products/bulk-stock',
+                               data={'batch_file': (io.BytesIO(body.encode()), 'stock.csv')},
+                               content_type='multipart/form-data', follow_redirects=True)
+        assert response.status_code == 200
+        with app.app_context():
+            assert db.session.get(Product, a).stock_quantity == expected
+    assert b'more columns than the header' in response.data
+
+    response = client.post('/officer/products/bulk-stock', json=[{'product_id': b, 'quantity_change': -1}])
+    assert response.status_code == 400 and response.get_json()['results'][0]['status'] == 'error'
+    assert client.post('/officer/products/bulk-stock', json={'rows': []}).status_code == 400
+
+    response = client.post('/officer/product-requests/bulk',
+                           json={'rows': [{'request_id': i, 'action': 'approve'} for i in request_ids]})
+    assert response.status_code == 200 and response.get_json()['applied'] == 2
+    with app.app_context():
+        assert ProductRequest.query.filter_by(status='approved').count() == 2
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,78 @@
+import sys
+import os
+import io
+import re
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from app.models import User
+from app.utils.report_jobs import report_jobs
+from app.utils.reports import (
+    generate_pdf_report, PDF_TABLE_CHUNK_ROWS, _pdf_data_tables, _pdf_document, _pdf_header_table, _wrap_cell
+)
+from conftest import TestConfig, login
+
+
+class AppConfig(TestConfig):
+    REPORT_FOLDER = tempfile.mkdtemp(prefix='pdf_report_')
+
+
+def page_count(pdf):
+    return len(re.findall(rb'/Type /Page\b', pdf))
+
+
+def test_rows_are_rendered_as_page_sized_tables():
+    rows = [{'ID': n, 'Name': f'Farmer & Sons <{n}>', 'Email': f'user{n}@example.com'} for n in range(101)]
+    header = _pdf_header_table(list(rows[0]), 170)
+    tables = list(_pdf_data_tables(header, list(rows[0]), 170, iter(rows)))
+    assert tables[0] is header
+    assert [len(t._cellvalues) for t in tables[1:]] == [PDF_TABLE_CHUNK_ROWS, PDF_TABLE_CHUNK_ROWS, 21]
+    # Plain strings, markup characters kept as text
+    assert tables[1]._cellvalues[3] == ['3', 'Farmer & Sons <3>', 'user3@example.com']
+
+
+def test_long_cells_are_wrapped_to_the_column():
+    assert _wrap_cell('short', 60) == 'short'
+    for text in ('Farmer With A Much Longer Full Name', 'averyveryverylongemail@example.com', 'x' * 200):
+        lines = _wrap_cell(text, 60).split('\n')
+        assert len(lines) > 1 and ''.join(lines).replace(' ', '') == text.replace(' ', '')
+        assert all(stringWidth(line, 'Helvetica', 9) <= 60 for line in lines)
+
+
+def test_report_pages_grow_with_rows():
+    small = generate_pdf_report([{'ID': 1}], 'Users', summary={'Total': 1}).read()
+    rows = [{'ID': n, 'Name': f'User {n}', 'Note': 'Needs a second line in a narrow column ' * (n % 3)}
+            for n in range(600)]
+    pdf = generate_pdf_report(rows, 'Users')
+    assert not hasattr(pdf, 'getvalue')
+    data = pdf.read()
+    assert data.startswith(b'%PDF') and data.rstrip().endswith(b'%%EOF')
+    assert page_count(small) == 1 and page_count(data) > 10
+    assert generate_pdf_report([], 'Empty').read().startswith(b'%PDF')
+
+
+def test_only_later_pages_reserve_room_for_the_header():
+    header = _pdf_header_table(['ID', 'Name'], 170)
+    first, later = _pdf_document(io.BytesIO(), header).pageTemplates
+    assert first.autoNextPageTemplate == 'Later'
+    height = header.wrap(0, 0)[1]
+    assert first.frames[0]._height - later.frames[0]._height == pytest.approx(height)
+    assert first.frames[0]._y2 > later.frames[0]._y2
+
+
+def test_users_report_route(app, client):
+    with app.app_context():
+        admin_id = User.query.filter_by(role='admin').first().id
+    login(client, admin_id)
+    # Built in the background, then served from the cached artifact
+    client.get('/admin/reports/users/pdf')
+    report_jobs.wait()
+    response = client.get('/admin/reports/users/pdf')
+    assert response.status_code == 200 and response.mimetype == 'application/pdf'
+    assert response.get_data().startswith(b'%PDF')
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, FarmerProduct
+from app.utils.search import search_products, search_terms, rebuild_search_index
+
+
+def add_products(farmer, *rows):
+    products = [FarmerProduct(farmer_id=farmer.id, product_name=name, category=category, description=description,
+                              location=location, quantity=10, unit='kg', price_per_unit=40)
+                for name, category, description, location in rows]
+    db.session.add_all(products)
+    db.session.commit()
+    return products
+
+
+def names(term, query=None):
+    query, corrected = search_products(query or FarmerProduct.query, term)
+    return [p.product_name for p in query.all()], corrected
+
+
+def test_ranked_prefix_and_typo_search(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        add_products(
+            farmer,
+            ('Organic Tomatoes', 'Vegetables', 'Fresh red tomatoes', 'Thrissur'),
+            ('Tomato Seeds', 'Seeds', 'Hybrid variety', 'Palakkad'),
+            ('Ketchup', 'Processed', 'Made from ripe tomatoes', 'Kochi'),
+            ('Banana', 'Fruits', 'Nendran bananas', 'Thrissur'),
+        )
+
+        found, corrected = names('tomato')
+        assert corrected is None
+        # Name matches outrank description-only matches
+        assert set(found[:2]) == {'Organic Tomatoes', 'Tomato Seeds'} and found[2] == 'Ketchup'
+
+        assert set(names('toma')[0]) == {'Organic Tomatoes', 'Tomato Seeds', 'Ketchup'}  # prefix
+        assert set(names('thrissur')[0]) == {'Organic Tomatoes', 'Banana'}               # location
+        assert names('seeds palakkad')[0] == ['Tomato Seeds']    # every word must match
+
+        found, corrected = names('banan')
+        assert found == ['Banana']
+        found, corrected = names('bananna')
+        assert found == ['Banana'] and corrected == 'banana'
+
+        assert names('"tomato" OR *')[0]                         # FTS syntax is not interpreted
+        assert search_terms('  Red, "ripe"  tomatoes!') == ['red', 'ripe', 'tomatoes']
+
+
+def test_index_follows_updates_and_deletes(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        product, other = add_products(farmer, ('Onion', 'Vegetables', None, None),
+                                      ('Garlic', 'Vegetables', None, None))
+
+        product.product_name = 'Shallots'
+        db.session.commit()
+        assert names('onion')[0] == []
+        assert names('shallots')[0] == ['Shallots']
+
+        db.session.delete(other)
+        db.session.commit()
+        assert names('garlic')[0] == []
+
+        rebuild_search_index()
+        assert names('shallots')[0] == ['Shallots']
+
+
+def test_marketplace_page_uses_search_and_category_filter(app, client):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        add_products(farmer, ('Organic Tomatoes', 'Vegetables', None, None),
+                     ('Tomato Seeds', 'Seeds', None, None))
+
+    html = client.get('/marketplace/?search=tomato&category=Seeds').get_data(as_text=True)
+    assert 'Tomato Seeds' in html and 'Organic Tomatoes' not in html
+
+    html = client.get('/marketplace/?search=tomatto').get_data(as_text=True)
+    assert 'Showing results for' in html and 'Organic Tomatoes' in html
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,109 @@
+import sys
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app import create_app
+from app.models import (
+    db, User, Product, ProductStockHistory, CropIssue, DiagnosisReport, YieldPrediction, Notice, FarmerProduct
+)
+from app.utils.query_guard import RepeatedQueryError, normalize_statement
+from app.utils.stock import products_with_last_change
+from conftest import TestConfig, count_statements, login
+
+ROLE_BLUEPRINTS = {'farmer': 'farmer', 'expert': 'expert', 'admin': 'admin', 'krishi_bhavan_officer': 'officer'}
+
+
+class AppConfig(TestConfig):
+    QUERY_REPEAT_LIMIT = 5
+    REPORT_FOLDER = tempfile.mkdtemp()
+
+
+def role_ids():
+    return {role: User.query.filter_by(role=role).first().id for role in ROLE_BLUEPRINTS}
+
+
+def add_data(count=20):
+    ids = role_ids()
+    farmer, expert, officer = ids['farmer'], ids['expert'], ids['krishi_bhavan_officer']
+    for i in range(count):
+        product = Product(name=f'Seed {i}', product_type='seed', stock_quantity=i, created_by=officer)
+        db.session.add(product)
+        db.session.flush()
+        for days in (3, 1):
+            db.session.add(ProductStockHistory(product_id=product.id, quantity_change=1, previous_stock=0,
+                                               new_stock=1, changed_by=officer,
+                                               created_at=datetime(2026, 1, 10) - timedelta(days=days)))
+        issue = CropIssue(farmer_id=farmer, crop_type='Rice', issue_description='Spots', symptoms=['Wilting'],
+                          ai_prediction={'disease_name': 'Leaf Blast', 'confidence': 0.8})
+        db.session.add(issue)
+        db.session.flush()
+        if i % 2:
+            db.session.add(DiagnosisReport(crop_issue_id=issue.id, expert_id=expert, diagnosis='Blast',
+                                           treatment_plan='Spray', severity='High'))
+        db.session.add(YieldPrediction(farmer_id=farmer, crop_type='Rice', soil_type='Loamy', irrigation_type='Canal',
+                                       fertilizer_type='Organic', planting_date=date(2024, 6, 1), farm_size=1.0,
+                                       location='Kerala', predicted_yield=2.0))
+        db.session.add(Notice(title=f'Notice {i}', content='Subsidy', posted_by=officer,
+                              expires_at=datetime.utcnow() - timedelta(days=1) if i % 3 == 0 else None))
+        db.session.add(FarmerProduct(farmer_id=farmer, product_name=f'Tomato {i}', category='Vegetables',
+                                     quantity=5, unit='kg', price_per_unit=30))
+    db.session.commit()
+    return ids
+
+
+def test_repeated_statements_raise():
+    assert normalize_statement("SELECT * FROM t WHERE id = 12 AND name = 'x''y'\n  LIMIT 1") == \
+        'SELECT * FROM t WHERE id = ? AND name = ? LIMIT ?'
+
+    app = create_app(AppConfig)
+    with app.app_context():
+        add_data(count=8)
+    with app.app_context():
+        # The per-product lookup the stock report used to do
+        try:
+            for product in Product.query.all():
+                ProductStockHistory.query.filter_by(product_id=product.id)\
+                    .order_by(ProductStockHistory.created_at.desc()).first()
+        except RepeatedQueryError as e:
+            assert 'product_stock_history' in str(e)
+        else:
+            raise AssertionError('N+1 loop was not detected')
+    with app.app_context():
+        # Counts start again in a new app context (request)
+        for product in Product.query.limit(5).all():
+            ProductStockHistory.query.filter_by(product_id=product.id).first()
+
+
+def test_stock_report_reads_history_once(app, client):
+    with app.app_context():
+        ids = add_data(count=30)
+        never_changed = Product(name='Sprayer', product_type='equipment', stock_quantity=2,
+                                created_by=ids['krishi_bhavan_officer'])
+        db.session.add(never_changed)
+        db.session.commit()
+        last = {product.name: changed for product, changed in products_with_last_change().all()}
+        assert last['Seed 0'] == datetime(2026, 1, 9) and last['Sprayer'] is None
+
+    login(client, ids['krishi_bhavan_officer'])
+    response, statements = count_statements(lambda: client.get('/officer/reports/stock/pdf'), app)
+    assert response.status_code == 200 and response.get_data().startswith(b'%PDF')
+    assert len([s for s in statements if 'product_stock_history' in s]) == 1
+
+
+def test_pages_stay_within_the_repeat_limit(app, client):
+    with app.app_context():
+        ids = add_data()
+    rules = [rule for rule in app.url_map.iter_rules() if 'GET' in rule.methods and not rule.arguments]
+    for role, blueprint in ROLE_BLUEPRINTS.items():
+        login(client, ids[role])
+        for rule in rules:
+            if rule.endpoint.startswith(f'{blueprint}.'):
+                # RepeatedQueryError propagates out of the test client (TESTING=True)
+                assert client.get(rule.rule).status_code < 500, rule.rule
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,82 @@
+import sys
+import os
+import csv
+import io
+from datetime import date
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, CropIssue, YieldPrediction
+from app.utils.report_datasets import (
+    IssueRow, issue_rows, prediction_rows, decode_symptoms, disease_history_report,
+    yield_predictions_report
+)
+from conftest import count_statements, login
+
+
+def add_issues(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        db.session.add_all([
+            CropIssue(farmer_id=farmer.id, crop_type='Rice', issue_description='Spots', status='pending',
+                      symptoms=['Brown spots', 'Wilting', 'Leaf curl', 'Yellow leaves'],
+                      ai_prediction={'disease_name': 'Leaf Blast', 'confidence': 0.87}),
+            CropIssue(farmer_id=farmer.id, crop_type='Banana', issue_description='Old entry', status='resolved',
+                      symptoms='not json', expert_response='Spray neem oil'),
+            YieldPrediction(farmer_id=farmer.id, crop_type='Rice', soil_type='Loamy', irrigation_type='Canal',
+                            fertilizer_type='Organic', planting_date=date(2024, 6, 1), farm_size=2.0,
+                            location='Kerala', predicted_yield=None)
+        ])
+        db.session.commit()
+        return farmer.id
+
+
+def test_rows_decode_symptoms_once_per_distinct_value(app):
+    farmer_id = add_issues(app)
+    with app.app_context():
+        decode_symptoms.cache_clear()
+        rows = list(issue_rows(farmer_id)) + list(issue_rows(farmer_id))
+    assert all(type(row) is IssueRow for row in rows)
+    blast = next(row for row in rows if row.crop_type == 'Rice')
+    assert blast.disease_name == 'Leaf Blast' and blast.confidence == 0.87
+    assert blast.symptoms == ('Brown spots', 'Wilting', 'Leaf curl', 'Yellow leaves')
+    assert decode_symptoms.cache_info().misses == 2 and decode_symptoms.cache_info().hits == 2
+    assert decode_symptoms('not json') == ('not json',) and decode_symptoms('"one"') == ('one',)
+
+    data, summary = disease_history_report([row for row in rows[:2]])
+    assert summary == {'Total Issues': 2, 'Pending': 1, 'Reviewed': 0, 'Resolved': 1}
+    by_crop = {record['Crop Type']: record for record in data}
+    assert by_crop['Rice']['Symptoms'] == 'Brown spots, Wilting, Leaf curl...'
+    assert by_crop['Rice']['Confidence'] == '87.0%' and by_crop['Rice']['Expert Response'] == 'No'
+    assert by_crop['Banana']['Disease Predicted'] == 'N/A' and by_crop['Banana']['Expert Response'] == 'Yes'
+
+    with app.app_context():
+        # A prediction without a yield no longer breaks the summary
+        assert yield_predictions_report(list(prediction_rows(farmer_id)))[1]['Average Yield/Acre'] == 'N/A'
+
+
+def test_farmer_report_routes_use_one_select_per_dataset(app, client):
+    farmer_id = add_issues(app)
+    login(client, farmer_id)
+
+    def fetch():
+        pdf = client.get('/farmer/reports/disease-history/pdf')
+        # The CSV streams; read it before the next request
+        body = client.get('/farmer/reports/disease-history/csv').get_data(as_text=True)
+        return pdf, body, client.get('/farmer/reports/yield-predictions/pdf'), \
+            client.get('/farmer/reports/yield-predictions/csv')
+
+    (pdf, body, yield_pdf, yield_csv), statements = count_statements(fetch, app)
+
+    assert pdf.status_code == 200 and pdf.get_data().startswith(b'%PDF')
+    assert yield_pdf.status_code == 200 and yield_csv.status_code == 200
+    assert len([s for s in statements if 'FROM crop_issues' in s]) == 2
+    assert len([s for s in statements if 'FROM yield_predictions' in s]) == 2
+    rows = {row['Crop Type']: row for row in csv.DictReader(io.StringIO(body))}
+    # The CSV keeps every symptom
+    assert rows['Rice']['Symptoms'] == 'Brown spots, Wilting, Leaf curl, Yellow leaves'
+    assert rows['Banana']['Symptoms'] == 'not json'
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
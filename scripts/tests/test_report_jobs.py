@@ -0,0 +1,96 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User
+from app.utils.cache import stats_cache
+from app.utils.report_jobs import report_jobs, ReportType
+from conftest import TestConfig, login
+
+REPORT_DIR = tempfile.mkdtemp(prefix='report_jobs_')
+
+
+class AppConfig(TestConfig):
+    REPORT_FOLDER = REPORT_DIR
+
+
+def test_identical_requests_share_one_artifact_until_data_changes(app):
+    with app.app_context():
+        stats_cache.clear()
+        calls = []
+        build = report_jobs.types['admin_users'].build
+        report_jobs.types['admin_users'] = ReportType('admin_users', lambda: calls.append(1) or build(),
+                                                      ('users',), 'users_report_{date}.pdf')
+        try:
+            job_id = report_jobs.submit('admin_users')
+            report_jobs.wait()
+            assert report_jobs.status(job_id)['status'] == 'done'
+            assert report_jobs.artifact_path(job_id).read_bytes().startswith(b'%PDF')
+
+            assert report_jobs.submit('admin_users') == job_id
+            report_jobs.wait()
+            assert calls == [1]
+
+            User.query.filter_by(role='farmer').first().full_name = 'Renamed Farmer'
+            db.session.commit()
+            new_id = report_jobs.submit('admin_users')
+            report_jobs.wait()
+            assert new_id != job_id and calls == [1, 1]
+
+            # A cleared (or restarted) cache never reuses an old stamp
+            stats_cache.clear()
+            assert report_jobs.job_id('admin_users') not in (job_id, new_id)
+        finally:
+            report_jobs.types['admin_users'] = ReportType('admin_users', build, ('users',), 'users_report_{date}.pdf')
+
+
+def test_failed_jobs_report_their_error(app):
+    @report_jobs.report('broken', tables=('users',), filename='broken_{date}.pdf')
+    def build_broken():
+        raise RuntimeError('no data source')
+
+    with app.app_context():
+        job_id = report_jobs.submit('broken')
+        report_jobs.wait()
+        state = report_jobs.status(job_id)
+        assert state['status'] == 'failed' and state['error'] == 'no data source'
+        # Not retried straight away
+        assert report_jobs.submit('broken') == job_id and report_jobs.status(job_id)['status'] == 'failed'
+    assert report_jobs.status('../etc') is None
+
+
+def test_report_routes_queue_then_serve(app, client):
+    login(client, 'admin')
+
+    response = client.get('/admin/reports/region-wise/pdf', headers={'Accept': 'application/json'})
+    if response.status_code == 202:
+        job = response.get_json()
+        assert job['status'] in ('queued', 'running', 'done')
+        report_jobs.wait()
+        status = client.get(job['status_url']).get_json()
+        assert status['status'] == 'done'
+        download = client.get(status['download_url'])
+        assert download.mimetype == 'application/pdf' and download.get_data().startswith(b'%PDF')
+
+    cached = client.get('/admin/reports/region-wise/pdf')
+    assert cached.status_code == 200 and cached.mimetype == 'application/pdf'
+    assert 'region_wise_report_' in cached.headers['Content-Disposition']
+
+    # Browsers get a page that refreshes until the file is ready
+    page = client.get('/admin/reports/users/pdf')
+    assert page.status_code == 200 or b'Preparing Your Report' in page.get_data()
+    report_jobs.wait()
+
+    queued = client.post('/admin/reports/jobs/admin_users')
+    assert queued.status_code == 202 and queued.get_json()['job_id']
+    report_jobs.wait()
+    assert client.post('/admin/reports/jobs/nope').status_code == 404
+
+    login(client, 'farmer')
+    assert client.post('/admin/reports/jobs/admin_users').status_code == 403
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
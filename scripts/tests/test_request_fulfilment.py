@@ -0,0 +1,138 @@
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, Product, ProductRequest, ProductStockHistory
+from app.utils.product_requests import (
+    apply_request_decisions, link_requests, process_pending_requests, reservation_key
+)
+from conftest import login
+
+
+def user_id(role):
+    return User.query.filter_by(role=role).first().id
+
+
+def add_product(name, stock, product_type='fertilizer'):
+    product = Product(name=name, product_type=product_type, unit='kg', stock_quantity=stock,
+                      created_by=user_id('krishi_bhavan_officer'))
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+
+def add_request(name, quantity, product_type='Fertilizer', age_minutes=0, product_id=None):
+    product_request = ProductRequest(farmer_id=user_id('farmer'), product_name=name, product_type=product_type,
+                                     quantity=quantity, product_id=product_id,
+                                     created_at=datetime.utcnow() - timedelta(minutes=age_minutes))
+    db.session.add(product_request)
+    db.session.commit()
+    return product_request.id
+
+
+def test_legacy_requests_are_linked_by_name_and_type(app):
+    with app.app_context():
+        urea = add_product('Urea', 10)
+        add_product('Urea', 10, product_type='equipment')
+        matched = add_request(' urea', 2)
+        matched_exact = add_request('UREA', 2)
+        unmatched = add_request('Potash', 2)
+        assert link_requests() == 1  # the leading space does not match
+        db.session.commit()
+        assert db.session.get(ProductRequest, matched_exact).product_id == urea
+        assert db.session.get(ProductRequest, matched).product_id is None
+        assert db.session.get(ProductRequest, unmatched).product_id is None
+
+        plan = ' '.join(str(row) for row in db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT id FROM products "
+            "WHERE lower(product_type) = lower('Fertilizer') AND lower(name) = lower('urea')")))
+        assert 'ix_products_type_name_lower' in plan
+
+
+def test_approval_reserves_stock_once(app):
+    with app.app_context():
+        officer = user_id('krishi_bhavan_officer')
+        urea = add_product('Urea', 10)
+        first, second = add_request('Urea', 6), add_request('Urea', 6)
+
+        applied, results = apply_request_decisions([{'request_id': first, 'action': 'approve'}], officer)
+        db.session.commit()
+        assert applied == 1 and db.session.get(Product, urea).stock_quantity == 4
+        entry = ProductStockHistory.query.filter_by(idempotency_key=reservation_key(first)).one()
+        assert entry.quantity_change == -6 and entry.reason == f'Product request #{first}'
+
+        # Not enough left for the second request: it stays pending and stock is untouched
+        applied, results = apply_request_decisions([{'request_id': second, 'action': 'approve'}], officer)
+        db.session.rollback()
+        assert applied == 0 and results[0]['message'].startswith('Stock:')
+        assert db.session.get(ProductRequest, second).status == 'pending'
+
+        # Approving again is a no-op
+        applied, results = apply_request_decisions([{'request_id': first, 'action': 'approve'}], officer)
+        assert applied == 0 and results[0]['status'] == 'skipped'
+        assert db.session.get(Product, urea).stock_quantity == 4
+
+
+def test_pending_queue_is_served_oldest_first(app):
+    with app.app_context():
+        officer = user_id('krishi_bhavan_officer')
+        urea = add_product('Urea', 10)
+        oldest = add_request('urea', 4, age_minutes=50)
+        too_big = add_request('Urea', 8, age_minutes=40)
+        small = add_request('Urea', 5, age_minutes=30)
+        newest = add_request('Urea', 2, age_minutes=20)
+        unknown = add_request('Potash', 1, age_minutes=10)
+
+        summary = process_pending_requests(officer, batch_size=2)
+        assert summary == {'approved': 2, 'waiting': 2, 'unmatched': 1}
+        status = {r.id: r.status for r in ProductRequest.query.all()}
+        assert [status[i] for i in (oldest, too_big, small, newest, unknown)] == \
+            ['approved', 'pending', 'approved', 'pending', 'pending']
+        assert db.session.get(Product, urea).stock_quantity == 1
+
+
+def test_fulfilment_routes(app, client):
+    with app.app_context():
+        officer = user_id('krishi_bhavan_officer')
+        farmer = user_id('farmer')
+        urea = add_product('Urea', 5)
+        pending = add_request('Urea', 3)
+
+    login(client, farmer)
+    client.post('/farmer/product-request/new',
+                data={'product_name': 'urea', 'product_type': 'Fertilizer', 'quantity': '4', 'unit': 'kg'})
+    with app.app_context():
+        new_request = ProductRequest.query.order_by(ProductRequest.id.desc()).first()
+        assert new_request.product_id == urea
+        new_id = new_request.id
+
+    login(client, officer)
+    assert b'in stock' in client.get('/officer/product-requests').data
+    client.post(f'/officer/product-requests/{pending}/approve')
+    response = client.post(f'/officer/product-requests/{new_id}/approve', follow_redirects=True)
+    assert b'Could not approve' in response.data
+    with app.app_context():
+        assert db.session.get(ProductRequest, pending).status == 'approved'
+        assert db.session.get(ProductRequest, new_id).status == 'pending'
+        assert db.session.get(Product, urea).stock_quantity == 2
+
+    # A pending request still needs the product, so it cannot be deleted
+    response = client.post(f'/officer/products/{urea}/delete', follow_redirects=True)
+    assert b'pending requests' in response.data
+    with app.app_context():
+        assert db.session.get(Product, urea) is not None
+
+    # Once every request is decided it can; the decided requests keep their name and type
+    client.post(f'/officer/product-requests/{new_id}/reject')
+    response = client.post(f'/officer/products/{urea}/delete', follow_redirects=True)
+    assert b'Product deleted successfully' in response.data
+    with app.app_context():
+        assert db.session.get(Product, urea) is None
+        decided = db.session.get(ProductRequest, pending)
+        assert (decided.status, decided.product_id, decided.product_name) == ('approved', None, 'Urea')
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
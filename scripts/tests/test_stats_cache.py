@@ -0,0 +1,75 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, CropIssue
+from app.utils.cache import StatsCache, SQLiteCacheBackend
+from app.utils.stats import cached_issue_overview
+from conftest import TestConfig, count_statements
+
+
+class AppConfig(TestConfig):
+    STATS_CACHE_BACKEND = 'memory'
+
+
+def add_issue(status='pending', crop_type='Rice'):
+    farmer = User.query.filter_by(role='farmer').first()
+    issue = CropIssue(farmer_id=farmer.id, crop_type=crop_type, issue_description='Test issue',
+                      location='Kottayam', status=status)
+    db.session.add(issue)
+    db.session.commit()
+    return issue
+
+
+def test_overview_cached_until_commit(app):
+    with app.app_context():
+        add_issue()
+        overview, statements = count_statements(cached_issue_overview)
+        assert overview.total_issues == 1 and overview.pending_issues == 1
+        assert len(statements) == 1
+
+        # Served from the cache
+        _, statements = count_statements(cached_issue_overview)
+        assert statements == []
+
+        # A rolled back change leaves the entry valid
+        db.session.add(CropIssue(farmer_id=1, crop_type='Wheat', issue_description='x'))
+        db.session.flush()
+        db.session.rollback()
+        _, statements = count_statements(cached_issue_overview)
+        assert statements == []
+
+        # A committed change invalidates it
+        issue = add_issue(status='resolved', crop_type='Wheat')
+        overview = cached_issue_overview()
+        assert overview.total_issues == 2
+        assert overview.issues_by_status == {'pending': 1, 'resolved': 1}
+        assert overview.issues_by_crop == {'Rice': 1, 'Wheat': 1}
+
+        issue.status = 'pending'
+        db.session.commit()
+        assert cached_issue_overview().pending_issues == 2
+
+
+def test_sqlite_backend_shared_between_workers():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'stats_cache.db')
+        worker_a, worker_b = StatsCache(), StatsCache()
+        worker_a.backend = SQLiteCacheBackend(path)
+        worker_b.backend = SQLiteCacheBackend(path)
+
+        calls = []
+        compute = lambda: calls.append(1) or {'total': len(calls)}
+        assert worker_a.get_or_compute('k', compute, tags=('crop_issues',)) == {'total': 1}
+        assert worker_b.get_or_compute('k', compute, tags=('crop_issues',)) == {'total': 1}
+        assert len(calls) == 1
+
+        # Invalidation in one worker is seen by the other
+        worker_a.invalidate('crop_issues')
+        assert worker_b.get_or_compute('k', compute, tags=('crop_issues',)) == {'total': 2}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,119 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from datetime import datetime, date
+from app.models import (
+    db, User, CropIssue, YieldPrediction, DiagnosisReport,
+    IssueRollup, RegionFarmerRollup, YieldRollup, DiseaseRollup
+)
+from app.utils.rollups import rebuild_rollups
+from app.utils.stats import region_issue_stats, disease_frequency_stats, yield_trend_stats
+
+
+def snapshot():
+    """Rollup contents as comparable sets, ignoring surrogate ids."""
+    result = {}
+    for model in (IssueRollup, RegionFarmerRollup, YieldRollup, DiseaseRollup):
+        columns = [c.name for c in model.__table__.columns if c.name != 'id']
+        result[model.__tablename__] = sorted(
+            tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+            for row in db.session.query(*[model.__table__.c[c] for c in columns]).all()
+        )
+    return result
+
+
+def test_incremental_rollups_match_rebuild(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+
+        issues = []
+        for i in range(6):
+            issue = CropIssue(
+                farmer_id=farmer.id, crop_type='Rice' if i % 2 else 'Wheat',
+                issue_description='Test', location=None if i == 5 else 'Kottayam',
+                created_at=datetime(2024, 1 + i % 3, 5)
+            )
+            db.session.add(issue)
+            issues.append(issue)
+        db.session.flush()
+        db.session.add(DiagnosisReport(crop_issue_id=issues[0].id, expert_id=expert.id, diagnosis='d',
+                                       disease_identified='Blight', severity='High', treatment_plan='t'))
+        db.session.add(DiagnosisReport(crop_issue_id=issues[1].id, expert_id=expert.id, diagnosis='d',
+                                       disease_identified='Blight', severity='Low', treatment_plan='t'))
+        for value in (2.0, 4.0, None):
+            db.session.add(YieldPrediction(
+                farmer_id=farmer.id, crop_type='Rice', soil_type='Loamy', irrigation_type='Drip',
+                fertilizer_type='Organic', planting_date=date(2024, 1, 1), farm_size=1.0,
+                location='Kerala', predicted_yield=value, created_at=datetime(2024, 2, 1)
+            ))
+        db.session.commit()
+
+        # Updates and deletes move rows between rollup keys
+        issues[2].location = 'Thrissur'
+        db.session.delete(issues[4])
+        db.session.commit()
+
+        incremental = snapshot()
+        rebuild_rollups()
+        assert incremental == snapshot(), 'incremental rollups drifted from a full rebuild'
+
+        regions = {r.location: (r.total_issues, r.farmers_count) for r in region_issue_stats()}
+        assert regions == {'Kottayam': (3, 1), 'Thrissur': (1, 1)}
+
+        blight = disease_frequency_stats()[0]
+        assert blight.disease_identified == 'Blight' and blight.count == 2
+        assert blight.avg_severity == 2.0
+
+        trend = yield_trend_stats(months=3, end=datetime(2024, 2, 15))
+        assert trend == {'2023-12': (0, 0), '2024-01': (0, 0), '2024-02': (3.0, 3)}
+
+
+def test_diagnosis_counts_follow_crop_type_changes(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+
+        def diagnosed(crop_type, disease):
+            issue = CropIssue(farmer_id=farmer.id, crop_type=crop_type, issue_description='Test', location='Idukki')
+            db.session.add(issue)
+            db.session.flush()
+            db.session.add(DiagnosisReport(crop_issue_id=issue.id, expert_id=expert.id, diagnosis='d',
+                                           disease_identified=disease, severity='High', treatment_plan='t'))
+            db.session.commit()
+            return issue
+
+        first, second, third = diagnosed('Rice', 'Blast'), diagnosed('Rice', 'Blast'), diagnosed('Pepper', 'Wilt')
+
+        def check():
+            incremental = snapshot()
+            rebuild_rollups()
+            assert snapshot() == incremental
+
+        # Crop type edited after the diagnosis
+        first.crop_type = 'Paddy'
+        db.session.commit()
+        check()
+
+        # Crop type and diagnosis edited in the same flush
+        second = db.session.get(CropIssue, second.id)
+        second.crop_type = 'Paddy'
+        DiagnosisReport.query.filter_by(crop_issue_id=second.id).one().severity = 'Low'
+        db.session.commit()
+        check()
+
+        # Issue deleted together with its report
+        third = db.session.get(CropIssue, third.id)
+        db.session.delete(DiagnosisReport.query.filter_by(crop_issue_id=third.id).one())
+        db.session.delete(third)
+        db.session.commit()
+        check()
+        assert DiseaseRollup.query.filter_by(crop_type='').count() == 0
+        assert {(r.crop_type, r.severity, r.diagnosis_count) for r in DiseaseRollup.query.all()} == \
+            {('Paddy', 'High', 1), ('Paddy', 'Low', 1)}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,177 @@
+import sys
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from app import create_app
+from app.models import db, User, Product, ProductStockHistory, ProductStockSnapshot
+from app.utils import stock
+from app.utils.stock import (
+    products_with_last_change, record_stock_change, stock_as_of, stock_valuation, take_stock_snapshot
+)
+from conftest import TestConfig, login
+
+
+def officer_id():
+    return User.query.filter_by(role='krishi_bhavan_officer').first().id
+
+
+def add_product(stock, price=None, product_type='seed', name='Paddy Seed'):
+    product = Product(name=name, product_type=product_type, unit='kg', price_per_unit=price,
+                      stock_quantity=0, created_by=officer_id())
+    db.session.add(product)
+    db.session.commit()
+    if stock:
+        record_stock_change(product.id, stock, 'Initial stock', officer_id())
+        db.session.commit()
+    return product
+
+
+def test_changes_are_recorded_and_idempotent(app):
+    with app.app_context():
+        product = add_product(10)
+        entry = record_stock_change(product.id, -4, 'Issued', officer_id(), idempotency_key='form-1')
+        db.session.commit()
+        assert (entry.previous_stock, entry.new_stock) == (10, 6) and product.stock_quantity == 6
+
+        # Replaying the same submission returns the first entry and changes nothing
+        again = record_stock_change(product.id, -4, 'Issued', officer_id(), idempotency_key='form-1')
+        db.session.commit()
+        assert again.id == entry.id and product.stock_quantity == 6
+        assert ProductStockHistory.query.filter_by(product_id=product.id).count() == 2
+
+        # Stock never goes negative
+        assert record_stock_change(product.id, -7, 'Issued', officer_id()) is None
+        db.session.rollback()
+        assert product.stock_quantity == 6
+
+
+def test_duplicate_key_race_keeps_the_callers_changes(app):
+    with app.app_context():
+        product = add_product(10)
+        other = add_product(5, name='Urea')
+        first = record_stock_change(product.id, -2, 'Issued', officer_id(), idempotency_key='race')
+        db.session.commit()
+
+        # Changes staged by the caller before the stock change
+        product.description = 'Certified seed'
+        record_stock_change(other.id, 3, 'Delivery', officer_id())
+
+        # A concurrent request committed the key after our lookup: the insert hits the unique index
+        lookup = stock._entry_for_key
+        with mock.patch.object(stock, '_entry_for_key', side_effect=[None, lookup('race')]):
+            entry = record_stock_change(product.id, -2, 'Issued', officer_id(), idempotency_key='race')
+        db.session.commit()
+
+        assert entry.id == first.id
+        assert product.stock_quantity == 8 and product.description == 'Certified seed'
+        assert other.stock_quantity == 8
+        assert ProductStockHistory.query.filter_by(product_id=product.id).count() == 2
+
+
+def test_stock_as_of_snapshot_plus_ledger(app):
+    with app.app_context():
+        seed = add_product(10, price=25)
+        fertilizer = add_product(4, price=100, product_type='fertilizer', name='Urea')
+        start = datetime.utcnow()
+        take_stock_snapshot(now=start)
+        snapshot_at = ProductStockSnapshot.query.first().taken_at
+
+        record_stock_change(seed.id, -3, 'Issued', officer_id())
+        record_stock_change(fertilizer.id, 6, 'Delivery', officer_id())
+        db.session.commit()
+
+        assert stock_as_of(snapshot_at) == {seed.id: 10, fertilizer.id: 4}
+        now = datetime.utcnow() + timedelta(seconds=1)
+        assert stock_as_of(now) == {seed.id: 7, fertilizer.id: 10}
+
+        # A later snapshot derived from the ledger agrees with the live stock
+        taken_at, rows = take_stock_snapshot(now=now + timedelta(seconds=60))
+        assert rows == 2 and stock_as_of(taken_at) == {seed.id: 7, fertilizer.id: 10}
+        assert take_stock_snapshot(now=now + timedelta(seconds=60))[1] == 0
+
+        assert stock_valuation() == [('fertilizer', 1, 10, 1000), ('seed', 1, 7, 175)]
+        assert stock_valuation(snapshot_at) == [('fertilizer', 1, 4, 400), ('seed', 1, 10, 250)]
+        # Products created after the date are left out
+        assert stock_as_of(start - timedelta(days=1)) == {}
+
+        # Historical reports only see the changes made up to their date
+        latest = {product.id: changed for product, changed in products_with_last_change().all()}
+        assert latest[seed.id] > snapshot_at
+        as_of = {product.id: changed for product, changed in products_with_last_change(until=snapshot_at).all()}
+        assert all(changed is None or changed <= snapshot_at for changed in as_of.values())
+
+
+def test_stock_routes(app, client):
+    with app.app_context():
+        user_id = officer_id()
+        product_id = add_product(5).id
+    login(client, user_id)
+
+    form = {'quantity_change': '-2', 'reason': 'Issued', 'idempotency_key': 'abc-1'}
+    for _ in range(2):
+        assert client.post(f'/officer/products/{product_id}/update-stock', data=form).status_code == 302
+    form = {'quantity_change': '-9', 'reason': 'Issued', 'idempotency_key': 'abc-2'}
+    client.post(f'/officer/products/{product_id}/update-stock', data=form)
+    with app.app_context():
+        assert db.session.get(Product, product_id).stock_quantity == 3
+        assert ProductStockHistory.query.filter_by(product_id=product_id).count() == 2
+
+    # The edit form was opened at 3; a restock of 5 lands before it is saved with 1
+    with app.app_context():
+        record_stock_change(product_id, 5, 'Delivery', user_id)
+        db.session.commit()
+    form = {'name': 'Paddy Seed', 'product_type': 'seed', 'unit': 'kg', 'stock_quantity': '1', 'stock_base': '3'}
+    assert client.post(f'/officer/products/{product_id}/edit', data=form).status_code == 302
+    with app.app_context():
+        assert db.session.get(Product, product_id).stock_quantity == 6
+        correction = ProductStockHistory.query.filter_by(product_id=product_id, reason='Manual correction').one()
+        assert correction.quantity_change == -2
+
+    response = client.get(f'/officer/reports/stock/pdf?as_of={datetime.utcnow():%Y-%m-%d}')
+    assert response.status_code == 200 and response.data.startswith(b'%PDF')
+
+
+def test_concurrent_changes_add_up():
+    with tempfile.TemporaryDirectory() as tmp:
+        class StressConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "ledger.db")}'
+            SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+
+        app = create_app(StressConfig)
+        with app.app_context():
+            user_id = officer_id()
+            product_id = add_product(0).id
+
+        def change(n):
+            for attempt in range(20):
+                with app.app_context():
+                    try:
+                        record_stock_change(product_id, n % 5 + 1, 'Delivery', user_id, idempotency_key=f'k{n}')
+                        db.session.commit()
+                        return
+                    except OperationalError:
+                        db.session.rollback()
+                        time.sleep(0.01 * (attempt + 1))
+            raise AssertionError(f'change {n} kept hitting lock timeouts')
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(change, list(range(60)) * 2))
+
+        with app.app_context():
+            expected = sum(n % 5 + 1 for n in range(60))
+            entries = ProductStockHistory.query.filter_by(product_id=product_id).all()
+            assert db.session.get(Product, product_id).stock_quantity == expected
+            assert len(entries) == 60 and sum(e.quantity_change for e in entries) == expected
+            assert sorted(e.new_stock for e in entries)[-1] == expected
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
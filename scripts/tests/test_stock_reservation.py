@@ -0,0 +1,180 @@
+import sys
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.attributes import set_committed_value
+from app import create_app
+from app.models import db, User, FarmerProduct, MarketplaceOrder
+from app.utils.reservations import place_order, confirm_payment, release_expired_reservations
+from conftest import TestConfig
+
+BUYER = dict(buyer_name='Asha', buyer_phone='9000000000', shipping_address='MG Road',
+             postal_code='680001', city='Thrissur')
+
+
+def add_product(quantity):
+    farmer = User.query.filter_by(role='farmer').first()
+    product = FarmerProduct(farmer_id=farmer.id, product_name='Tomato', category='Vegetables',
+                            quantity=quantity, unit='kg', price_per_unit=40)
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def test_reserve_then_pay(app):
+    with app.app_context():
+        product = add_product(5)
+        order = place_order(product, 3, **BUYER)
+        db.session.commit()
+        assert product.quantity == 2 and order.payment_status == 'pending' and order.reserved_until
+        assert order.total_price == 120
+
+        assert confirm_payment(order)
+        db.session.commit()
+        assert order.payment_status == 'paid' and order.transaction_id.startswith('PAY-')
+        assert order.reserved_until is None and product.quantity == 2
+
+        # A second payment of the same order is a no-op that still reports it paid
+        transaction_id = order.transaction_id
+        assert confirm_payment(order)
+        db.session.commit()
+        assert order.payment_status == 'paid' and order.transaction_id == transaction_id
+        assert product.quantity == 2
+
+
+def test_insufficient_stock_and_sell_out(app):
+    with app.app_context():
+        product = add_product(4)
+        assert place_order(product, 5, **BUYER) is None
+        assert place_order(product, 0, **BUYER) is None
+        place_order(product, 4, **BUYER)
+        db.session.commit()
+        assert product.quantity == 0 and not product.is_available
+        assert place_order(product, 1, **BUYER) is None
+
+
+def test_expired_reservations_release_stock(app):
+    with app.app_context():
+        product = add_product(3)
+        order = place_order(product, 3, **BUYER)
+        db.session.commit()
+        assert release_expired_reservations() == 0
+
+        later = datetime.utcnow() + timedelta(hours=1)
+        assert release_expired_reservations(now=later) == 1
+        db.session.refresh(product)
+        db.session.refresh(order)
+        assert product.quantity == 3 and product.is_available and order.payment_status == 'expired'
+
+        # Paying late re-reserves the stock while it is still there...
+        assert confirm_payment(order)
+        db.session.commit()
+        db.session.refresh(product)
+        assert order.payment_status == 'paid' and product.quantity == 0
+
+        # ...and fails once someone else bought it
+        second = place_order(add_product(2), 2, **BUYER)
+        db.session.commit()
+        release_expired_reservations(now=later)
+        place_order(db.session.get(FarmerProduct, second.product_id), 2, **BUYER)
+        db.session.commit()
+        assert not confirm_payment(second)
+        db.session.rollback()
+        assert second.payment_status == 'expired'
+        assert db.session.get(FarmerProduct, second.product_id).quantity == 0
+
+
+def test_legacy_pending_order_takes_stock_at_payment(app):
+    with app.app_context():
+        product = add_product(2)
+        order = MarketplaceOrder(product_id=product.id, farmer_id=product.farmer_id, quantity=2,
+                                 total_price=80, payment_status='pending', **BUYER)
+        db.session.add(order)
+        db.session.commit()
+        assert confirm_payment(order)
+        db.session.commit()
+        db.session.refresh(product)
+        assert product.quantity == 0 and not product.is_available
+
+        # Paying again from a page loaded before the first payment gives back the stock it took
+        product.quantity, product.is_available = 2, True
+        db.session.commit()
+        set_committed_value(order, 'payment_status', 'pending')
+        assert confirm_payment(order)
+        db.session.commit()
+        db.session.refresh(product)
+        assert product.quantity == 2 and order.payment_status == 'paid'
+
+
+def test_checkout_and_payment_routes(app, client):
+    with app.app_context():
+        product_id = add_product(2).id
+    form = dict(BUYER, quantity='3')
+    assert b'Only 2' in client.post(f'/marketplace/checkout/{product_id}', data=form).data
+
+    form['quantity'] = '2'
+    response = client.post(f'/marketplace/checkout/{product_id}', data=form)
+    assert response.status_code == 302 and '/payment/' in response.location
+    with app.app_context():
+        assert db.session.get(FarmerProduct, product_id).quantity == 0
+        order_id = MarketplaceOrder.query.filter_by(product_id=product_id).one().id
+
+    assert client.post(f'/marketplace/payment/{order_id}').status_code == 200
+    with app.app_context():
+        assert db.session.get(MarketplaceOrder, order_id).payment_status == 'paid'
+        assert db.session.get(FarmerProduct, product_id).quantity == 0
+
+    response = client.post(f'/marketplace/payment/{order_id}', follow_redirects=True)
+    assert b'already paid' in response.data and b'reservation expired' not in response.data
+
+
+def test_concurrent_buyers_never_oversell():
+    stock, buyers = 20, 60
+    with tempfile.TemporaryDirectory() as tmp:
+        class StressConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "stress.db")}'
+            SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+
+        app = create_app(StressConfig)
+        with app.app_context():
+            product_id = add_product(stock).id
+
+        def buy(n):
+            for attempt in range(20):
+                with app.app_context():
+                    try:
+                        order = place_order(db.session.get(FarmerProduct, product_id), 1, **BUYER)
+                        if order is None:
+                            db.session.rollback()
+                            return False
+                        db.session.commit()
+                        paid = confirm_payment(order)
+                        db.session.commit()
+                        return paid
+                    except OperationalError:
+                        db.session.rollback()
+                        time.sleep(0.01 * (attempt + 1))
+            raise AssertionError(f'buyer {n} kept hitting lock timeouts')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(buy, range(buyers)))
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            product = db.session.get(FarmerProduct, product_id)
+            paid = MarketplaceOrder.query.filter_by(product_id=product_id, payment_status='paid').count()
+            assert sum(results) == paid == stock
+            assert product.quantity == 0 and not product.is_available
+            db.engine.dispose()
+        print(f'{buyers} concurrent buyers, {stock} units: {buyers / elapsed:.0f} checkouts/sec')
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
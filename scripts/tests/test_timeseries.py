@@ -0,0 +1,58 @@
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, mysql
+from app.models import db, User, CropIssue, DiagnosisReport
+from app.utils.timeseries import last_months, zero_fill, month_bucket, days_between, monthly_series
+
+
+def test_last_months_crosses_year_boundary():
+    assert last_months(3, end=datetime(2024, 2, 10)) == ['2023-12', '2024-01', '2024-02']
+
+
+def test_zero_fill_is_dense_and_ordered():
+    end = datetime(2024, 3, 1)
+    assert zero_fill([('2024-03', 5), ('2024-01', 2)], 3, end=end) == {'2024-01': 2, '2024-02': 0, '2024-03': 5}
+    assert zero_fill([('2024-02', 1.5, 4)], 2, default=(0, 0), end=end) == {'2024-02': (1.5, 4), '2024-03': (0, 0)}
+
+
+def test_expressions_compile_for_other_dialects():
+    pg = str(month_bucket(CropIssue.created_at, 'postgresql').compile(dialect=postgresql.dialect()))
+    assert 'to_char' in pg
+    my = str(month_bucket(CropIssue.created_at, 'mysql').compile(dialect=mysql.dialect()))
+    assert 'date_format' in my
+    pg_days = str(days_between(DiagnosisReport.created_at, CropIssue.created_at, 'postgresql')
+                  .compile(dialect=postgresql.dialect()))
+    assert 'EXTRACT(epoch FROM' in pg_days and 'julianday' not in pg_days
+
+
+def test_monthly_series_and_days_between_on_sqlite(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        now = datetime.utcnow()
+        issue = CropIssue(farmer_id=farmer.id, crop_type='Rice', issue_description='x',
+                          created_at=now - timedelta(days=2))
+        db.session.add(issue)
+        db.session.flush()
+        db.session.add(DiagnosisReport(crop_issue_id=issue.id, expert_id=expert.id, diagnosis='d',
+                                       treatment_plan='t', created_at=now))
+        db.session.commit()
+
+        series = monthly_series(func.count(DiagnosisReport.id), DiagnosisReport.created_at,
+                                DiagnosisReport.expert_id == expert.id, months=6)
+        assert list(series) == last_months(6)
+        assert series[now.strftime('%Y-%m')] == 1
+        assert sum(series.values()) == 1
+
+        days = db.session.query(func.avg(days_between(DiagnosisReport.created_at, CropIssue.created_at)))\
+            .join(CropIssue, DiagnosisReport.crop_issue_id == CropIssue.id).scalar()
+        assert round(days, 1) == 2.0
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,85 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from app.models import db, User, ChatMessage, MarketplaceInquiry, UnreadCounter
+from app.utils.chat import mark_thread_read
+from app.utils.unread_counters import INQUIRY, unread_total, unread_by_partner, rebuild_unread_counters
+from conftest import login
+
+
+def snapshot():
+    return sorted((c.user_id, c.kind, c.partner_id, c.unread_count)
+                  for c in UnreadCounter.query.all() if c.unread_count)
+
+
+def test_counters_follow_inserts_reads_and_rebuild(app):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+
+        db.session.add_all(
+            [ChatMessage(farmer_id=farmer.id, expert_id=expert.id, message='q', sender_role='farmer')
+             for _ in range(3)] +
+            [ChatMessage(farmer_id=farmer.id, expert_id=expert.id, message='a', sender_role='expert')
+             for _ in range(2)] +
+            [MarketplaceInquiry(farmer_id=farmer.id, visitor_name='A', visitor_phone='9999999999',
+                                message='hi') for _ in range(4)]
+        )
+        db.session.commit()
+
+        assert unread_by_partner(expert.id) == {farmer.id: 3}
+        assert unread_total(farmer.id) == 2
+        assert unread_total(farmer.id, INQUIRY) == 4
+
+        # ORM flip of a single inquiry
+        inquiry = MarketplaceInquiry.query.first()
+        inquiry.is_read = True
+        db.session.commit()
+        assert unread_total(farmer.id, INQUIRY) == 3
+
+        # Set-based thread read
+        last_id = db.session.query(db.func.max(ChatMessage.id)).filter_by(expert_id=expert.id).scalar()
+        mark_thread_read(farmer.id, expert.id, 'expert', last_id)
+        db.session.commit()
+        assert unread_total(expert.id) == 0
+
+        incremental = snapshot()
+        rebuild_unread_counters()
+        assert snapshot() == incremental
+
+        # Deleting a message above the cursor takes it off the counter, one below it does not
+        db.session.add_all([ChatMessage(farmer_id=farmer.id, expert_id=expert.id, message='b', sender_role='expert')
+                            for _ in range(2)])
+        db.session.commit()
+        assert unread_total(farmer.id) == 4
+        messages = ChatMessage.query.filter_by(sender_role='expert').order_by(ChatMessage.id).all()
+        mark_thread_read(farmer.id, expert.id, 'farmer', messages[-2].id)
+        db.session.commit()
+        assert unread_total(farmer.id) == 1
+        db.session.delete(messages[0])
+        db.session.delete(messages[-1])
+        db.session.commit()
+        assert unread_total(farmer.id) == 0
+        incremental = snapshot()
+        rebuild_unread_counters()
+        assert snapshot() == incremental
+
+
+def test_badge_endpoint_reads_counter(app, client):
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        db.session.add(ChatMessage(farmer_id=farmer.id, expert_id=expert.id, message='a', sender_role='expert'))
+        db.session.commit()
+
+        login(client, farmer)
+        assert client.get('/farmer/chat/unread-count').get_json() == {'unread_count': 1}
+
+        client.get(f'/farmer/chat/{expert.id}')
+        assert client.get('/farmer/chat/unread-count').get_json() == {'unread_count': 0}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,77 @@
+"""
+Benchmark chat page render time as a farmer-expert thread grows.
+
+Renders /farmer/chat/<expert_id> (latest page) and one "load older" request
+from the middle of the thread for threads of 100 to 100,000 messages. With
+keyset pagination both should stay flat.
+
+Usage:
+  python scripts/utils/benchmark_chat_history.py
+  python scripts/utils/benchmark_chat_history.py --sizes 100 1000 10000 --repeat 5
+"""
+import sys
+import os
+import argparse
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from sqlalchemy import insert
+from app import create_app
+from app.config import Config
+from app.models import db, User, ChatMessage
+
+
+def best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        farmer = User.query.filter_by(role='farmer').first()
+        expert = User.query.filter_by(role='expert').first()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(farmer.id)
+            sess['_fresh'] = True
+
+        print(f"{'messages':>10} {'chat page':>12} {'load older':>12}")
+        current = 0
+        for size in sorted(args.sizes):
+            db.session.execute(insert(ChatMessage), [
+                {'farmer_id': farmer.id, 'expert_id': expert.id, 'message': f'message {i}',
+                 'sender_role': 'expert' if i % 2 else 'farmer', 'is_read': True}
+                for i in range(current, size)
+            ])
+            db.session.commit()
+            current = size
+            middle = db.session.query(ChatMessage.id).order_by(ChatMessage.id)\
+                .offset(size // 2).limit(1).scalar()
+
+            page_ms = best_of(args.repeat, lambda: client.get(f'/farmer/chat/{expert.id}'))
+            older_ms = best_of(args.repeat, lambda: client.get(
+                f'/farmer/chat/{expert.id}/history?before_id={middle}'))
+            print(f'{size:>10,} {page_ms:>10.1f}ms {older_ms:>10.1f}ms')
+
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
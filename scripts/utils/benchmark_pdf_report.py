@@ -0,0 +1,58 @@
+"""
+Benchmark generate_pdf_report on users-report shaped data.
+
+Renders a synthetic 7-column table (the admin users report layout) at each
+size and reports wall time, peak Python memory (tracemalloc) and PDF size.
+No database is needed; rows are generated in memory.
+
+Usage:
+  python scripts/utils/benchmark_pdf_report.py                   # 1k, 10k, 100k rows
+  python scripts/utils/benchmark_pdf_report.py --sizes 1000,5000
+  python scripts/utils/benchmark_pdf_report.py --no-trace        # time only (tracemalloc slows rendering)
+"""
+import sys
+import os
+import argparse
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from app.utils.reports import generate_pdf_report
+
+ROLES = ['farmer', 'expert', 'admin', 'krishi_bhavan_officer']
+
+
+def user_rows(count):
+    return [{
+        'ID': n,
+        'Username': f'user{n}',
+        'Name': f'Farmer Number {n}' if n % 7 else f'Farmer With A Much Longer Full Name {n}',
+        'Email': f'user{n}@example.com',
+        'Role': ROLES[n % len(ROLES)],
+        'Status': 'Active' if n % 11 else 'Inactive',
+        'Created': '2026-01-01'
+    } for n in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--no-trace', action='store_true')
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'time':>9} {'peak mem':>10} {'size':>9}")
+    for rows in (int(size) for size in args.sizes.split(',')):
+        data = user_rows(rows)
+        if not args.no_trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        pdf = generate_pdf_report(data, 'Users Report', 'Benchmark')
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / 2**20 if not args.no_trace else float('nan')
+        tracemalloc.stop()
+        size = len(pdf.read())
+        print(f'{rows:>9,} {elapsed:>8.2f}s {peak:>8.1f}MB {size / 2**20:>7.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
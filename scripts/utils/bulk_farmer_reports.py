@@ -0,0 +1,58 @@
+"""
+Write end-of-season disease history and yield PDFs for every farmer in a
+district into one ZIP archive.
+
+Rows are fetched once as plain tuples and rendered on a process pool; each
+farmer's PDFs are added to the archive as soon as they are ready.
+
+Usage:
+  python scripts/utils/bulk_farmer_reports.py --district Kottayam
+  python scripts/utils/bulk_farmer_reports.py --out /tmp/all_farmers.zip --workers 8
+  python scripts/utils/bulk_farmer_reports.py --district Thrissur --reports disease --workers 0   # serial
+"""
+import sys
+import os
+import argparse
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from app import create_app
+from app.config import Config
+from app.utils.bulk_reports import REPORT_KINDS, load_farmer_report_rows, iter_farmer_reports_zip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--district', help='match farmers whose farm location contains this text')
+    parser.add_argument('--reports', default=','.join(REPORT_KINDS), help='comma separated: disease,yield')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count, 0 or 1: render in this process)')
+    parser.add_argument('--out', default=None, help='ZIP path (default: farmer_reports_<district>.zip)')
+    parser.add_argument('--url', default=None, help='database URL (default: the app configuration)')
+    args = parser.parse_args()
+
+    class ExportConfig(Config):
+        if args.url:
+            SQLALCHEMY_DATABASE_URI = args.url
+
+    kinds = [k for k in args.reports.split(',') if k in REPORT_KINDS]
+    out = args.out or f"farmer_reports_{(args.district or 'all').replace(' ', '_')}.zip"
+
+    app = create_app(ExportConfig)
+    with app.app_context():
+        started = time.perf_counter()
+        farmers = load_farmer_report_rows(args.district)
+        loaded = time.perf_counter() - started
+        rows = sum(len(issues) + len(predictions) for _, _, issues, predictions in farmers)
+        print(f'Loaded {len(farmers)} farmers, {rows} rows in {loaded:.2f}s')
+
+    started = time.perf_counter()
+    with open(out, 'wb') as archive:
+        for chunk in iter_farmer_reports_zip(farmers, kinds, args.workers):
+            archive.write(chunk)
+    elapsed = time.perf_counter() - started
+    print(f'Wrote {out} ({os.path.getsize(out) / 2**20:.1f}MB) in {elapsed:.2f}s '
+          f'with {args.workers if args.workers is not None else os.cpu_count()} worker(s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Generate WebP thumbnails for images uploaded before the image pipeline, and
+strip EXIF/XMP metadata (camera, GPS) from originals stored before uploads
+were cleaned.
+
+Walks the crop, chat and marketplace product upload folders and queues every
+original that is missing a variant. Existing variants and clean originals are
+left alone, so the script can be re-run.
+
+Usage:
+  python scripts/utils/generate_thumbnails.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from pathlib import Path
+from app import create_app
+from app.utils.images import image_pipeline, strip_metadata, ALLOWED_IMAGE_EXTENSIONS, THUMBNAIL_SIZES
+
+FOLDERS = ('crops', 'chat_images', 'farmer_products')
+
+
+def is_variant(path):
+    return path.suffix == '.webp' and any(path.stem.endswith(f'_{size}') for size in THUMBNAIL_SIZES)
+
+
+app = create_app()
+with app.app_context():
+    queued = 0
+    for folder in FOLDERS:
+        root = Path(app.config['UPLOAD_FOLDER']) / folder
+        if not root.exists():
+            continue
+        for path in sorted(root.iterdir()):
+            if path.suffix.lower().lstrip('.') not in ALLOWED_IMAGE_EXTENSIONS or is_variant(path):
+                continue
+            try:
+                strip_metadata(path)
+            except Exception as e:
+                print(f'  Could not strip metadata from {path}: {e}')
+            if image_pipeline.submit(path) is not None:
+                queued += 1
+    print(f'Generating thumbnails for {queued} image(s)...')
+    image_pipeline.wait()
+    print('Done.')
@@ -0,0 +1,120 @@
+"""
+Replay recorded queries through EXPLAIN and flag full table scans.
+
+1. Record a workload:   QUERY_LOG_PATH=/tmp/queries.jsonl python run.py   (then click around)
+2. Analyse it:          python scripts/utils/index_advisor.py /tmp/queries.jsonl --min-rows 1000
+
+A query is flagged when its plan scans a table without an index (SQLite
+``SCAN <table>``, PostgreSQL ``Seq Scan``) and that table currently holds at
+least --min-rows rows. Columns referenced in the query's WHERE / ORDER BY
+clauses are listed as index candidates.
+"""
+import sys
+import os
+import argparse
+import json
+import re
+from collections import defaultdict
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from sqlalchemy import inspect, text
+from app import create_app
+from app.models import db
+from app.utils.query_log import read_query_log
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$')
+
+
+def sqlite_scans(connection, statement, parameters):
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, tuple(parameters or ())).all()
+    scans = []
+    for row in rows:
+        match = SQLITE_SCAN.match(row[-1])
+        if match and 'INDEX' not in match.group(2):
+            scans.append(match.group(1))
+    return scans
+
+
+def postgres_scans(connection, statement, parameters):
+    if isinstance(parameters, list):
+        parameters = tuple(parameters)
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters or {}).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append(node['Relation Name'])
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return scans
+
+
+def candidate_columns(statement, table):
+    """Columns of ``table`` referenced after WHERE (filters and ordering)."""
+    upper = statement.upper()
+    where = upper.find(' WHERE ')
+    if where == -1:
+        where = upper.find(' ORDER BY ')
+    if where == -1:
+        return []
+    columns = []
+    for column in re.findall(rf'\b{re.escape(table)}\.(\w+)\b', statement[where:]):
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', nargs='?', default=os.environ.get('QUERY_LOG_PATH'))
+    parser.add_argument('--min-rows', type=int, default=1000)
+    args = parser.parse_args()
+    if not args.log:
+        parser.error('pass the query log path or set QUERY_LOG_PATH')
+
+    app = create_app()
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        explain = sqlite_scans if dialect == 'sqlite' else postgres_scans
+        tables = set(inspect(db.engine).get_table_names())
+        row_counts = {}
+
+        statements = {}
+        for entry_dialect, statement, parameters in read_query_log(args.log):
+            if entry_dialect == dialect and statement not in statements:
+                statements[statement] = parameters
+        print(f'Replaying {len(statements)} distinct statements ({dialect})')
+
+        findings = defaultdict(list)
+        with db.engine.connect() as connection:
+            for statement, parameters in statements.items():
+                try:
+                    scans = explain(connection, statement, parameters)
+                except Exception as e:
+                    connection.rollback()
+                    print(f'  skipped (could not EXPLAIN: {e.__class__.__name__})')
+                    continue
+                for table in set(scans) & tables:
+                    if table not in row_counts:
+                        row_counts[table] = connection.execute(text(f'SELECT COUNT(*) FROM {table}')).scalar()
+                    if row_counts[table] >= args.min_rows:
+                        findings[table].append(statement)
+
+        if not findings:
+            print(f'No full scans on tables with >= {args.min_rows} rows.')
+            return
+
+        for table, flagged in sorted(findings.items(), key=lambda item: -row_counts[item[0]]):
+            print(f'\n{table} ({row_counts[table]:,} rows): {len(flagged)} statement(s) scan the whole table')
+            for statement in flagged:
+                columns = candidate_columns(statement, table)
+                hint = f"  -> consider an index on ({', '.join(columns)})" if columns else ''
+                print(f"  - {' '.join(statement.split())[:160]}{hint}")
+
+
+if __name__ == '__main__':
+    main()
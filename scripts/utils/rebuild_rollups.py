@@ -0,0 +1,15 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from app import db, create_app
+from app.models import IssueRollup, RegionFarmerRollup, YieldRollup, DiseaseRollup
+from app.utils.rollups import rebuild_rollups
+
+app = create_app()
+with app.app_context():
+    print('Rebuilding statistics rollups...')
+    rebuild_rollups()
+    for model in (IssueRollup, RegionFarmerRollup, YieldRollup, DiseaseRollup):
+        print(f'  {model.__tablename__}: {model.query.count()} rows')
+    print('Done.')
@@ -0,0 +1,15 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from app import db, create_app
+from app.models import UnreadCounter
+from app.utils.unread_counters import rebuild_unread_counters
+
+app = create_app()
+with app.app_context():
+    print('Rebuilding unread counters...')
+    rebuild_unread_counters()
+    total = db.session.query(db.func.coalesce(db.func.sum(UnreadCounter.unread_count), 0)).scalar()
+    print(f'  {UnreadCounter.query.count()} counters, {total} unread messages')
+    print('Done.')
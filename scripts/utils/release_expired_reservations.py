@@ -0,0 +1,19 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from app import create_app
+from app.utils.reservations import release_expired_reservations, SWEEP_BATCH_SIZE
+
+# Run from cron every few minutes; checkout also releases expired orders for the product being bought.
+app = create_app()
+with app.app_context():
+    print('Releasing expired stock reservations...')
+    total = 0
+    while True:
+        released = release_expired_reservations()
+        total += released
+        if released < SWEEP_BATCH_SIZE:
+            break
+    print(f'  {total} orders expired, stock returned')
+    print('Done.')
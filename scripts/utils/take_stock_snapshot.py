@@ -0,0 +1,38 @@
+"""
+Snapshot every Krishi Bhavan product's stock.
+
+Run from cron (e.g. nightly). Stock as of any date is the latest snapshot
+before it plus the stock ledger entries since, so regular snapshots keep
+those lookups short however long the ledger grows.
+
+Usage:
+  python scripts/utils/take_stock_snapshot.py
+  python scripts/utils/take_stock_snapshot.py --url postgresql://...
+"""
+import sys
+import os
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from app import create_app
+from app.config import Config
+from app.utils.stock import take_stock_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help='database URL (default: the app configuration)')
+    args = parser.parse_args()
+
+    class SnapshotConfig(Config):
+        if args.url:
+            SQLALCHEMY_DATABASE_URI = args.url
+
+    app = create_app(SnapshotConfig)
+    with app.app_context():
+        taken_at, rows = take_stock_snapshot()
+        print(f'Snapshot at {taken_at:%Y-%m-%d %H:%M:%S} UTC: {rows} products')
+
+
+if __name__ == '__main__':
+    main()